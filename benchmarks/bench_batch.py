@@ -0,0 +1,153 @@
+"""
+Backlog drain benchmark
+
+對同一個 client 排入 N 個命令，模擬 agent 取出並執行全部命令所需的時間：
+
+- single：每個循環 GET /next_command 取一個命令、POST /submit_result
+  （舊的 client_install.ps1，每個命令一個循環）
+- batch：每個循環 GET /next_command?max=M 取出整批命令，依序執行後以一個
+  POST /submit_results 送回，整批滿了就立即再取下一批（目前的 client_install.ps1）
+
+win_agent.ps1 每個循環都要啟動新的 PowerShell、下載 client_install.ps1 並註冊，
+以 --cycle-overhead 秒模擬；命令本身的執行時間以 --command-seconds 模擬。
+
+Usage:
+    python benchmarks/bench_batch.py
+    python benchmarks/bench_batch.py --commands 200 --batch 50 --cycle-overhead 2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import LocalServer, _free_port
+
+
+def queue_commands(session: requests.Session, url: str, client_id: str, count: int):
+    return [
+        session.post(
+            url + "/send_command",
+            json={"client_id": client_id, "command": f"Get-Item C:\\{i}"},
+            timeout=30,
+        ).json()["command_id"]
+        for i in range(count)
+    ]
+
+
+def drain(
+    session: requests.Session, url: str, client_id: str, batch: int, args
+) -> dict:
+    """模擬 agent 循環直到佇列清空，返回循環數、HTTP 請求數與耗時"""
+    cycles = requests_sent = 0
+    executed = []
+    started = time.perf_counter()
+    while True:
+        # 啟動 PowerShell、下載 script、註冊
+        cycles += 1
+        time.sleep(args.cycle_overhead)
+
+        more = True
+        received_any = False
+        while more:
+            params = {"client_id": client_id}
+            if batch > 1:
+                params["max"] = batch
+            data = session.get(url + "/next_command", params=params, timeout=30).json()
+            requests_sent += 1
+            commands = data.get("commands")
+            if commands is None:
+                commands = [data] if data.get("command_id") else []
+            if not commands:
+                break
+            received_any = True
+
+            results = []
+            for command in commands:
+                time.sleep(args.command_seconds)
+                executed.append(command["command_id"])
+                results.append(
+                    {
+                        "command_id": command["command_id"],
+                        "result": "ok",
+                        "status": "completed",
+                    }
+                )
+            if batch > 1:
+                session.post(
+                    url + "/submit_results", json={"results": results}, timeout=30
+                )
+                requests_sent += 1
+            else:
+                for result in results:
+                    session.post(url + "/submit_result", json=result, timeout=30)
+                    requests_sent += 1
+            # 舊的 client 每個循環只執行一個命令；batch 滿了才繼續取
+            more = batch > 1 and len(commands) >= batch
+
+        if not received_any:
+            break
+
+    return {
+        "seconds": time.perf_counter() - started,
+        "cycles": cycles,
+        "requests": requests_sent,
+        "executed": executed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=50, help="queued commands")
+    parser.add_argument("--batch", type=int, default=20, help="max=N for batch mode")
+    parser.add_argument(
+        "--cycle-overhead",
+        type=float,
+        default=1.0,
+        help="seconds per agent cycle (PowerShell start, script download, register)",
+    )
+    parser.add_argument(
+        "--command-seconds", type=float, default=0.05, help="runtime per command"
+    )
+    args = parser.parse_args()
+
+    server = LocalServer(_free_port(), env={"PT1_SEARCH_BACKEND": "none"})
+    server.start()
+    try:
+        session = requests.Session()
+        response = session.post(
+            server.url + "/auth/token/exchange",
+            headers={"X-API-Token": server.api_token},
+            timeout=10,
+        )
+        session.headers["X-API-Token"] = response.json()["session_token"]
+
+        print(
+            f"commands: {args.commands}, cycle overhead: {args.cycle_overhead}s, "
+            f"command runtime: {args.command_seconds}s"
+        )
+        print(
+            f"{'MODE':>12} {'SECONDS':>8} {'CYCLES':>7} {'REQUESTS':>9} "
+            f"{'IN ORDER':>9} {'EXACTLY ONCE':>13}"
+        )
+        print("-" * 64)
+        for name, batch in (("single", 1), (f"batch {args.batch}", args.batch)):
+            client_id = f"drain-{batch}"
+            queued = queue_commands(session, server.url, client_id, args.commands)
+            r = drain(session, server.url, client_id, batch, args)
+            print(
+                f"{name:>12} {r['seconds']:>8.1f} {r['cycles']:>7} "
+                f"{r['requests']:>9} {str(r['executed'] == queued):>9} "
+                f"{str(sorted(r['executed']) == sorted(queued)):>13}"
+            )
+    finally:
+        server.stop()
+        server.cleanup()
+
+
+if __name__ == "__main__":
+    main()
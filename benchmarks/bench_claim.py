@@ -0,0 +1,299 @@
+"""
+Command claim stress test
+
+驗證 CommandManager.claim_next() 在並行 poll 下每個命令只派送一次，以及
+lease 過期的命令會放回佇列：
+
+1. threads：一個 producer thread 持續排入命令，多個 consumer thread 同時對
+   同一組 client 呼叫 claim_next()，檢查每個命令剛好被取得一次。分別測試
+   記憶體模式、shared（SQLite）模式，以及舊的「先讀取再標記 executing」
+   寫法作為對照（可能出現重複派送）
+2. lease：lease 到期前有 heartbeat（renew_leases）的命令保持 executing，
+   沒有的命令放回 pending 並只被重新取得一次
+3. http（--http）：啟動本機 server，多個連線同時 long-poll 同一個 client 的
+   /next_command，檢查 /send_command 排入的命令剛好被派送一次
+
+Usage:
+    python benchmarks/bench_claim.py
+    python benchmarks/bench_claim.py --threads 32 --commands 50000 --http
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pt1_server.services.command_manager import (
+    CommandManager,
+    ResultType,
+    SharedCommandManager,
+)
+from pt1_server.services.search_index import SearchIndex
+from pt1_server.services.storage import MemoryStateStore
+
+
+def _unsafe_claim(manager: CommandManager, stable_id: str):
+    """舊的派送寫法：讀取與標記 executing 分成兩步，中間沒有 lock
+
+    time.sleep(0) 讓出 GIL，模擬 threadpool 在兩步之間切換到另一個 poll。
+    """
+    next_command = manager.get_next_command(stable_id)
+    if not next_command:
+        return None
+    time.sleep(0)
+    manager.update_command_status(next_command[1], "executing")
+    return manager.command_history[next_command[1]]
+
+
+def run_threads(manager: CommandManager, claim, args) -> dict:
+    """producer 排入 args.commands 個命令，args.threads 個 consumer 同時取出"""
+    clients = [f"claim-{i}" for i in range(args.clients)]
+    queued = []
+    claimed = []
+    claimed_lock = threading.Lock()
+    producer_done = threading.Event()
+
+    def producer():
+        for i in range(args.commands):
+            queued.append(manager.queue_command(clients[i % len(clients)], "Get-Date"))
+        producer_done.set()
+
+    def consumer(seed: int):
+        rng = random.Random(seed)
+        local = []
+        idle = 0
+        while idle < len(clients) * 2:
+            command_info = claim(manager, rng.choice(clients))
+            if command_info is not None:
+                local.append(command_info.command_id)
+                manager.complete_command(
+                    command_info.command_id, "ok", "completed", ResultType.TEXT
+                )
+                idle = 0
+            elif producer_done.is_set():
+                idle += 1
+            else:
+                # 佇列暫時是空的：等 producer（實際的 poll 會 long-poll 等待）
+                time.sleep(0.001)
+        with claimed_lock:
+            claimed.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=producer)] + [
+        threading.Thread(target=consumer, args=(seed,)) for seed in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    counts = Counter(claimed)
+    return {
+        "commands": len(queued),
+        "claims": len(claimed),
+        "claims_per_sec": len(claimed) / elapsed,
+        "duplicates": sum(n - 1 for n in counts.values() if n > 1),
+        "missing": len(set(queued) - set(counts)),
+    }
+
+
+def check_lease(manager: CommandManager, lease: float) -> dict:
+    """A 在 lease 期間送出 heartbeat，B 沒有；到期後只有 B 的命令被放回佇列"""
+    manager.lease_seconds = lease
+    claimed = {"lease-a": [], "lease-b": []}
+    for stable_id in claimed:
+        for _ in range(3):
+            manager.queue_command(stable_id, "Start-Sleep 60")
+        while True:
+            command_info = manager.claim_next(stable_id)
+            if command_info is None:
+                break
+            claimed[stable_id].append(command_info.command_id)
+
+    deadline = time.time() + lease * 2
+    while time.time() < deadline:
+        manager.renew_leases("lease-a")
+        time.sleep(lease / 4)
+    requeued = manager.requeue_expired_leases()
+
+    reclaimed = []
+    for stable_id in claimed:
+        while True:
+            command_info = manager.claim_next(stable_id)
+            if command_info is None:
+                break
+            reclaimed.append(command_info.command_id)
+
+    statuses = Counter(
+        manager.get_command(command_id).status for command_id in claimed["lease-a"]
+    )
+    return {
+        "requeued": sorted(requeued) == sorted(claimed["lease-b"]),
+        "reclaimed_once": sorted(reclaimed) == sorted(claimed["lease-b"]),
+        "renewed_still_executing": statuses == Counter({"executing": 3}),
+    }
+
+
+def run_http(args) -> dict:
+    """多個連線同時 long-poll 同一個 client，/send_command 排入的命令只派送一次"""
+    import requests
+
+    from loadgen import LocalServer, _free_port
+
+    env = {"PT1_SEARCH_BACKEND": "none"}
+    server = LocalServer(_free_port(), workers=args.http_workers, env=env)
+    server.start()
+    try:
+        time.sleep(1 + args.http_workers * 0.5)
+        response = requests.post(
+            server.url + "/auth/token/exchange",
+            headers={"X-API-Token": server.api_token},
+            timeout=10,
+        )
+        headers = {"X-API-Token": response.json()["session_token"]}
+        client_id = "claim-http"
+        stop = threading.Event()
+
+        def poller(_):
+            session = requests.Session()
+            session.headers.update(headers)
+            dispatched = []
+            while not stop.is_set():
+                data = session.get(
+                    server.url + "/next_command",
+                    params={"client_id": client_id, "wait": 1},
+                    timeout=30,
+                ).json()
+                if data.get("command_id"):
+                    dispatched.append(data["command_id"])
+            return dispatched
+
+        with ThreadPoolExecutor(max_workers=args.http_pollers) as pool:
+            futures = [pool.submit(poller, i) for i in range(args.http_pollers)]
+            session = requests.Session()
+            session.headers.update(headers)
+            sent = [
+                session.post(
+                    server.url + "/send_command",
+                    json={"client_id": client_id, "command": "Get-Date"},
+                    timeout=30,
+                ).json()["command_id"]
+                for _ in range(args.http_commands)
+            ]
+            # 等所有命令被取走（/get_result 不是 pending）後停止 poller
+            deadline = time.time() + 60
+            while time.time() < deadline:
+                pending = session.get(
+                    server.url + f"/get_result/{sent[-1]}", timeout=30
+                ).json()
+                if pending.get("status") != "pending":
+                    break
+                time.sleep(0.2)
+            time.sleep(1)
+            stop.set()
+            dispatched = [c for future in futures for c in future.result()]
+    finally:
+        server.stop()
+        server.cleanup()
+
+    counts = Counter(dispatched)
+    return {
+        "commands": len(sent),
+        "dispatched": len(dispatched),
+        "duplicates": sum(n - 1 for n in counts.values() if n > 1),
+        "missing": len(set(sent) - set(counts)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16, help="consumer threads")
+    parser.add_argument("--commands", type=int, default=20_000, help="commands")
+    parser.add_argument("--clients", type=int, default=4, help="client IDs")
+    parser.add_argument(
+        "--switch-interval",
+        type=float,
+        default=1e-4,
+        help="sys.setswitchinterval，越小 thread 切換越頻繁、越容易觸發競爭",
+    )
+    parser.add_argument("--lease", type=float, default=1.0, help="lease seconds")
+    parser.add_argument("--http", action="store_true", help="also run HTTP test")
+    parser.add_argument("--http-workers", type=int, default=1)
+    parser.add_argument("--http-pollers", type=int, default=16)
+    parser.add_argument("--http-commands", type=int, default=500)
+    args = parser.parse_args()
+
+    sys.setswitchinterval(args.switch_interval)
+    workdir = tempfile.mkdtemp(prefix="pt1_claim_")
+    failed = False
+    try:
+
+        def shared_manager(name: str) -> SharedCommandManager:
+            from pt1_server.services.shared_state import SharedStateStore
+
+            store = SharedStateStore(os.path.join(workdir, f"{name}.db"))
+            return SharedCommandManager(store, SearchIndex())
+
+        def memory_manager(name: str) -> CommandManager:
+            return CommandManager(MemoryStateStore(), SearchIndex())
+
+        safe_claim = lambda manager, stable_id: manager.claim_next(stable_id)
+        configs = [
+            ("memory (unsafe, old path)", memory_manager, _unsafe_claim, False),
+            ("memory", memory_manager, safe_claim, True),
+            ("shared", shared_manager, safe_claim, True),
+        ]
+
+        print(
+            f"threads: {args.threads}, commands: {args.commands}, "
+            f"clients: {args.clients}"
+        )
+        print(
+            f"{'MODE':>26} {'CLAIMS':>8} {'CLAIMS/S':>9} "
+            f"{'DUPLICATES':>11} {'MISSING':>8}"
+        )
+        print("-" * 66)
+        for name, factory, claim, required in configs:
+            r = run_threads(factory(name.split()[0]), claim, args)
+            print(
+                f"{name:>26} {r['claims']:>8} {r['claims_per_sec']:>9.0f} "
+                f"{r['duplicates']:>11} {r['missing']:>8}"
+            )
+            if required and (r["duplicates"] or r["missing"]):
+                failed = True
+
+        print()
+        for name, factory in (("memory", memory_manager), ("shared", shared_manager)):
+            r = check_lease(factory(f"lease-{name}"), args.lease)
+            print(f"lease ({name}): {r}")
+            if not all(r.values()):
+                failed = True
+
+        if args.http:
+            r = run_http(args)
+            print()
+            print(
+                f"http ({args.http_workers} worker(s), {args.http_pollers} pollers): {r}"
+            )
+            if r["duplicates"] or r["missing"]:
+                failed = True
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print("FAILED" if failed else "OK: every command dispatched exactly once")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
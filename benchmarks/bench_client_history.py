@@ -0,0 +1,165 @@
+"""
+Client history middleware benchmark
+
+量測 client_history middleware 在不同 JSON body 大小下，每個 /submit_result
+請求增加的成本：同一個 route（以 read_json_body 取得 payload）分別在有與沒有
+middleware 的 app 上執行，直接呼叫 ASGI app，不經過網路與 HTTP client。
+
+不超過 PT1_HISTORY_JSON_MAX_BYTES 的 body 由 middleware 解析並交給 route，
+更大的 body 由 route 解析；兩種情況都只解析一次。
+
+Usage:
+    python benchmarks/bench_client_history.py
+    python benchmarks/bench_client_history.py --sizes 1024 1048576 --budget-mb 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 只量測 middleware 本身：不寫入狀態資料庫與全文搜尋索引
+os.environ["PT1_STATE_BACKEND"] = "memory"
+os.environ["PT1_SEARCH_BACKEND"] = "none"
+os.chdir(tempfile.mkdtemp(prefix="pt1_bench_"))
+
+from fastapi import FastAPI, Request
+
+from pt1_server.services.client_history import (
+    client_history_middleware_factory,
+    json_parse_max_bytes,
+    read_json_body,
+)
+
+RECEIVE_CHUNK = 64 * 1024  # 與 uvicorn 一樣分段送出 body
+
+
+def build_app(with_middleware: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/submit_result")
+    async def submit_result(request: Request):
+        data = await read_json_body(request)
+        return {"command_id": data.get("command_id"), "size": len(data["result"])}
+
+    if with_middleware:
+        app.middleware("http")(client_history_middleware_factory())
+    return app
+
+
+def build_body(size: int) -> bytes:
+    payload = {"command_id": "bench001", "status": "completed", "result": ""}
+    overhead = len(json.dumps(payload))
+    payload["result"] = "x" * max(0, size - overhead)
+    return json.dumps(payload).encode("utf-8")
+
+
+async def call(app: FastAPI, body: bytes):
+    """以單一 POST 請求呼叫 ASGI app"""
+    chunks = [body[i : i + RECEIVE_CHUNK] for i in range(0, len(body), RECEIVE_CHUNK)]
+    position = 0
+
+    async def receive():
+        nonlocal position
+        if position < len(chunks):
+            position += 1
+            return {
+                "type": "http.request",
+                "body": chunks[position - 1],
+                "more_body": position < len(chunks),
+            }
+        # 與真正的 server 一樣，client 未斷線時不返回 http.disconnect
+        await asyncio.sleep(3600)
+
+    status = 0
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/submit_result",
+        "raw_path": b"/submit_result",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    await app(scope, receive, send)
+    if status != 200:
+        raise RuntimeError(f"Unexpected status {status}")
+
+
+async def measure(app: FastAPI, body: bytes, requests: int) -> float:
+    """返回每個請求的 median 延遲（微秒）"""
+    for _ in range(min(10, requests)):
+        await call(app, body)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await call(app, body)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    return statistics.median(samples)
+
+
+async def run(sizes: list, budget_mb: int):
+    plain = build_app(with_middleware=False)
+    logged = build_app(with_middleware=True)
+    threshold = json_parse_max_bytes()
+
+    print(f"Middleware parses JSON bodies up to {threshold} bytes")
+    print(
+        f"{'BODY':>10} {'REQUESTS':>9} {'ROUTE ONLY (us)':>16} "
+        f"{'WITH MIDDLEWARE (us)':>21} {'OVERHEAD (us)':>14}  PATH"
+    )
+    print("-" * 90)
+    for size in sizes:
+        body = build_body(size)
+        requests = max(20, min(5000, budget_mb * 1024 * 1024 // len(body)))
+        without = await measure(plain, body, requests)
+        with_mw = await measure(logged, body, requests)
+        path = "parsed in middleware" if len(body) <= threshold else "parsed in route"
+        print(
+            f"{len(body):>10} {requests:>9} {without:>16.1f} "
+            f"{with_mw:>21.1f} {with_mw - without:>14.1f}  {path}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[256, 4096, 65536, 262144, 1048576, 8388608],
+        help="JSON body sizes in bytes",
+    )
+    parser.add_argument(
+        "--budget-mb",
+        type=int,
+        default=100,
+        help="approximate bytes sent per size (limits requests for large bodies)",
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.budget_mb))
+
+
+if __name__ == "__main__":
+    main()
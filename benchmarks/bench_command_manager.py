@@ -0,0 +1,92 @@
+"""
+CommandManager polling benchmark
+
+量測 /next_command 路徑（get_next_command + update_command_status）在
+command_history 大小從 1k 成長到 1M 時的延遲，確認 polling 成本不隨歷史增長。
+
+Usage:
+    python benchmarks/bench_command_manager.py
+    python benchmarks/bench_command_manager.py --sizes 1000 10000 --polls 5000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pt1_server.services.command_manager import CommandManager, ResultType
+from pt1_server.services.search_index import SearchIndex
+
+
+def build_manager(history_size: int, clients: int = 200) -> CommandManager:
+    """建立含有 history_size 筆已完成命令與 client 事件的 CommandManager"""
+    # 不建立全文搜尋索引，只量測 polling 路徑
+    manager = CommandManager(search_index=SearchIndex())
+    for i in range(history_size):
+        stable_id = f"client-{i % clients}"
+        if i % 2:
+            manager.log_client_event(stable_id, "client_api POST /heartbeat", 200)
+        else:
+            command_id = manager.queue_command(stable_id, "Get-Date")
+            manager.update_command_status(command_id, "executing")
+            manager.complete_command(command_id, "ok", "completed", ResultType.TEXT)
+    return manager
+
+
+def measure_polls(manager: CommandManager, polls: int) -> list:
+    """量測每次 poll（含 dispatch）的延遲（微秒）"""
+    target = "bench-target"
+    samples = []
+    for i in range(polls):
+        # 一半的 poll 有命令可取，一半為空 poll
+        if i % 2 == 0:
+            manager.queue_command(target, "Get-Process")
+
+        start = time.perf_counter()
+        next_command = manager.get_next_command(target)
+        if next_command:
+            manager.update_command_status(next_command[1], "executing")
+        manager.get_pending_commands_count(target)
+        samples.append((time.perf_counter() - start) * 1_000_000)
+
+        if next_command:
+            manager.complete_command(
+                next_command[1], "done", "completed", ResultType.TEXT
+            )
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+        help="command_history sizes to test",
+    )
+    parser.add_argument("--polls", type=int, default=10_000, help="polls per size")
+    args = parser.parse_args()
+
+    print(
+        f"{'HISTORY':>10} {'P50 (us)':>10} {'P99 (us)':>10} {'TIMEOUT SCAN (us)':>18}"
+    )
+    print("-" * 52)
+    for size in args.sizes:
+        manager = build_manager(size)
+        samples = sorted(measure_polls(manager, args.polls))
+        p50 = statistics.median(samples)
+        p99 = samples[int(len(samples) * 0.99) - 1]
+
+        start = time.perf_counter()
+        manager.check_timed_out_commands()
+        timeout_scan = (time.perf_counter() - start) * 1_000_000
+
+        print(f"{size:>10} {p50:>10.2f} {p99:>10.2f} {timeout_scan:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Idle agent cost benchmark
+
+以 loadgen.py 對同一組閒置 agent（沒有 CLI 使用者、沒有命令）分別執行 cycle 與
+persistent 兩種 agent 模式，比較每個 agent 每小時的：
+
+- HTTP 請求數（GET /client_install.ps1、POST /register_client、GET /next_command）
+- server CPU 秒數（/proc/<pid>/stat，包含 uvicorn worker）
+- agent process 啟動次數：cycle 模式每次 poll 都啟動新的 PowerShell、下載並
+  解析 client_install.ps1，這是 Windows 端閒置 CPU 的主要來源；persistent
+  模式只在啟動或 script 更新時才啟動
+
+每個模式各啟動一個新的本機 server。
+
+Usage:
+    python benchmarks/bench_idle_agents.py
+    python benchmarks/bench_idle_agents.py --agents 200 --duration 300
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = ("cycle", "persistent")
+
+
+def run_mode(mode: str, args, output: str) -> dict:
+    command = [
+        sys.executable,
+        os.path.join(HERE, "loadgen.py"),
+        "--agent-mode",
+        mode,
+        "--agents",
+        str(args.agents),
+        "--callers",
+        "0",
+        "--duration",
+        str(args.duration),
+        "--warmup",
+        str(args.warmup),
+        "--ramp",
+        str(args.ramp),
+        "--output",
+        output,
+    ]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=100, help="idle agents")
+    parser.add_argument("--duration", type=float, default=150, help="measured seconds")
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=60,
+        help="seconds excluded from stats (longer than one persistent long-poll)",
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=10, help="seconds to start all agents"
+    )
+    parser.add_argument("--output", help="write both reports to this JSON file")
+    args = parser.parse_args()
+
+    reports = {}
+    with tempfile.TemporaryDirectory(prefix="pt1_idle_") as workdir:
+        for mode in MODES:
+            print(
+                f"Running {args.agents} idle {mode} agents for "
+                f"{args.warmup:g}s warmup + {args.duration:g}s ..."
+            )
+            reports[mode] = run_mode(mode, args, os.path.join(workdir, f"{mode}.json"))
+
+    print("")
+    print("Per idle agent per hour:")
+    print(f"{'MODE':>12} {'REQUESTS':>9} {'PROCESS STARTS':>15} {'SERVER CPU (s)':>15}")
+    print("-" * 54)
+    for mode in MODES:
+        hour = reports[mode]["per_agent_hour"]
+        cpu = hour["server_cpu_seconds"]
+        print(
+            f"{mode:>12} {hour['requests']:>9.1f} {hour['process_starts']:>15.1f} "
+            f"{'n/a' if cpu is None else format(cpu, '.3f'):>15}"
+        )
+
+    before, after = (reports[mode]["per_agent_hour"] for mode in MODES)
+    print("")
+    for key, label in (
+        ("requests", "requests"),
+        ("server_cpu_seconds", "server CPU"),
+    ):
+        if before[key] and after[key] is not None:
+            print(f"{label}: {(1 - after[key] / before[key]) * 100:.0f}% fewer")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
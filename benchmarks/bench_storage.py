@@ -0,0 +1,82 @@
+"""
+State store benchmark
+
+比較 MemoryStateStore 與 SQLiteStateStore 在 send_command / submit_result
+路徑（queue_command + update_command_status + complete_command）的吞吐量，
+以及 SQLite 把所有變更寫入磁碟所需的時間與重新載入時間。
+
+Usage:
+    python benchmarks/bench_storage.py
+    python benchmarks/bench_storage.py --commands 50000 --flush-ms 20
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pt1_server.services.command_manager import CommandManager, ResultType
+from pt1_server.services.search_index import SearchIndex
+from pt1_server.services.storage import MemoryStateStore, SQLiteStateStore
+
+
+def run(manager: CommandManager, commands: int, clients: int = 100) -> float:
+    """執行 commands 次完整的命令生命週期，返回每秒操作數"""
+    start = time.perf_counter()
+    for i in range(commands):
+        stable_id = f"client-{i % clients}"
+        command_id = manager.queue_command(stable_id, "Get-Process")
+        next_command = manager.get_next_command(stable_id)
+        manager.update_command_status(next_command[1], "executing")
+        manager.complete_command(command_id, "x" * 512, "completed", ResultType.TEXT)
+    return commands / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--commands", type=int, default=20_000)
+    parser.add_argument("--flush-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    memory_rate = run(
+        CommandManager(store=MemoryStateStore(), search_index=SearchIndex()),
+        args.commands,
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.db")
+        store = SQLiteStateStore(path, flush_interval=args.flush_ms / 1000)
+        sqlite_rate = run(
+            CommandManager(store=store, search_index=SearchIndex()), args.commands
+        )
+
+        start = time.perf_counter()
+        store.flush()
+        flush_time = time.perf_counter() - start
+        store.close()
+
+        start = time.perf_counter()
+        reloaded = CommandManager(
+            store=SQLiteStateStore(path), search_index=SearchIndex()
+        )
+        reload_time = time.perf_counter() - start
+
+    print(f"Commands per backend: {args.commands}")
+    print("")
+    print(f"{'BACKEND':<10} {'LIFECYCLES/s':>14} {'RELATIVE':>10}")
+    print("-" * 36)
+    print(f"{'memory':<10} {memory_rate:>14.0f} {1.0:>10.2f}")
+    print(f"{'sqlite':<10} {sqlite_rate:>14.0f} {sqlite_rate / memory_rate:>10.2f}")
+    print("")
+    print(f"SQLite final flush: {flush_time * 1000:.1f} ms")
+    print(
+        f"SQLite reload:      {reload_time * 1000:.1f} ms "
+        f"({len(reloaded.command_history)} commands)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Multi-worker throughput benchmark
+
+以 1、2、4、8 個 uvicorn worker 啟動本機 server（多 worker 時使用
+PT1_STATE_BACKEND=shared），由多個 client process 執行完整的命令循環並回報
+每秒完成的請求數與延遲：
+
+    POST /send_command → GET /next_command → POST /submit_result → GET /get_result
+
+所有 client process 輪流 poll 同一組 client ID，同一個命令可能同時被多個
+worker 的 poll 競爭。結束後取出剩餘的命令，確認每個命令剛好被派送一次
+（duplicates 與 missing 都必須是 0）。
+
+單 worker 另外量測預設的記憶體模式作為基準。吞吐量受限於 CPU 核心數：
+worker 數超過核心數之後不會再增加。
+
+Usage:
+    python benchmarks/bench_workers.py
+    python benchmarks/bench_workers.py --workers 1 2 4 --procs 8 --duration 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from loadgen import LocalServer, _free_port, _percentile
+
+
+def _session_token(base_url: str, api_token: str) -> str:
+    response = requests.post(
+        base_url + "/auth/token/exchange",
+        headers={"X-API-Token": api_token},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()["session_token"]
+
+
+def run_client(
+    base_url: str, session_token: str, clients: int, duration: float, seed: int
+) -> dict:
+    """一個 client process：在 duration 秒內重複執行命令循環"""
+    rng = random.Random(seed)
+    session = requests.Session()
+    session.headers["X-API-Token"] = session_token
+    latencies: List[float] = []
+    sent: List[str] = []
+    dispatched: List[str] = []
+    errors = 0
+
+    def call(method: str, path: str, **kwargs):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=30, **kwargs)
+            response.raise_for_status()
+        except requests.RequestException:
+            errors += 1
+            return None
+        latencies.append((time.perf_counter() - started) * 1000)
+        return response.json()
+
+    deadline = time.time() + duration
+    while time.time() < deadline:
+        client_id = f"bench-{rng.randrange(clients)}"
+        queued = call(
+            "POST",
+            "/send_command",
+            json={"client_id": client_id, "command": "Get-Date"},
+        )
+        if queued:
+            sent.append(queued["command_id"])
+
+        # 可能取得其他 process 送出的命令
+        command = call("GET", "/next_command", params={"client_id": client_id})
+        if command and command.get("command_id"):
+            dispatched.append(command["command_id"])
+            call(
+                "POST",
+                "/submit_result",
+                json={
+                    "command_id": command["command_id"],
+                    "result": "ok",
+                    "status": "completed",
+                },
+            )
+        if queued:
+            call("GET", f"/get_result/{queued['command_id']}")
+
+    return {
+        "latencies": latencies,
+        "sent": sent,
+        "dispatched": dispatched,
+        "errors": errors,
+    }
+
+
+def drain(base_url: str, session_token: str, clients: int) -> List[str]:
+    """取出所有尚未派送的命令"""
+    headers = {"X-API-Token": session_token}
+    dispatched = []
+    for i in range(clients):
+        while True:
+            response = requests.get(
+                base_url + "/next_command",
+                params={"client_id": f"bench-{i}"},
+                headers=headers,
+                timeout=30,
+            )
+            command_id = response.json().get("command_id")
+            if not command_id:
+                break
+            dispatched.append(command_id)
+    return dispatched
+
+
+def run_config(workers: int, backend: str, args) -> Dict[str, float]:
+    env = {"PT1_STATE_BACKEND": backend, "PT1_SEARCH_BACKEND": "none"}
+    server = LocalServer(_free_port(), workers=workers, env=env)
+    server.start()
+    try:
+        # 等所有 worker 都啟動完成
+        time.sleep(1 + workers * 0.5)
+        token = _session_token(server.url, server.api_token)
+
+        started = time.time()
+        with ProcessPoolExecutor(max_workers=args.procs) as pool:
+            futures = [
+                pool.submit(
+                    run_client, server.url, token, args.clients, args.duration, seed
+                )
+                for seed in range(args.procs)
+            ]
+            results = [future.result() for future in futures]
+        elapsed = time.time() - started
+
+        latencies = sorted(ms for r in results for ms in r["latencies"])
+        sent = [c for r in results for c in r["sent"]]
+        dispatched = [c for r in results for c in r["dispatched"]]
+        dispatched += drain(server.url, token, args.clients)
+    finally:
+        server.stop()
+        server.cleanup()
+
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "errors": sum(r["errors"] for r in results),
+        "commands": len(sent),
+        "duplicates": len(dispatched) - len(set(dispatched)),
+        "missing": len(set(sent) - set(dispatched)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="worker counts"
+    )
+    parser.add_argument("--procs", type=int, default=8, help="client processes")
+    parser.add_argument(
+        "--clients", type=int, default=4, help="agent client IDs shared by all procs"
+    )
+    parser.add_argument("--duration", type=float, default=15, help="seconds per run")
+    args = parser.parse_args()
+
+    configs = [(workers, "shared") for workers in args.workers]
+    if 1 in args.workers:
+        configs.insert(0, (1, "memory"))
+
+    print(f"CPU cores: {os.cpu_count()}, client processes: {args.procs}")
+    print(
+        f"{'WORKERS':>7} {'BACKEND':>8} {'REQUESTS':>9} {'REQ/S':>8} "
+        f"{'P50 (ms)':>9} {'P99 (ms)':>9} {'ERRORS':>7} {'COMMANDS':>9} "
+        f"{'DUPLICATES':>11} {'MISSING':>8}"
+    )
+    print("-" * 92)
+    for workers, backend in configs:
+        r = run_config(workers, backend, args)
+        print(
+            f"{workers:>7} {backend:>8} {r['requests']:>9} {r['rps']:>8.1f} "
+            f"{r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['errors']:>7} "
+            f"{r['commands']:>9} {r['duplicates']:>11} {r['missing']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,854 @@
+"""
+Agent fleet load generator
+
+模擬 N 個 Windows agent（win_agent.ps1 + client_install.ps1 的 HTTP 協定）與
+M 個 CLI 使用者（pt1 send + pt1 wait）對 pt1-server 施加負載，回報每個
+endpoint 的吞吐量與 p50/p99 延遲、端到端命令延遲、server RSS 與 CPU，以及
+每個 agent 每小時的請求數，結果寫入 JSON 檔以便比較不同版本。
+
+每個 agent 的循環（--agent-mode cycle，每個循環是一個新的 PowerShell process）：
+    GET  /client_install.ps1
+    POST /register_client
+    GET  /next_command?wait=N           long-poll，沒有命令時結束這個循環
+    POST /heartbeat/{client_id}         執行期間每 10 秒一次
+    POST /submit_result
+    POST /upload_files/{command_id}     只有 --file-ratio 比例的命令
+    POST /agent_transcript/{client_id}
+
+--agent-mode persistent（預設，win_agent.ps1 的預設模式）只在啟動時下載
+client_install.ps1 並註冊一次，之後持續以 script_version long-poll；server
+回報新版本時以 If-None-Match 重新下載並重新註冊（模擬 process 重新啟動）。
+
+每個 CLI 使用者的循環：
+    POST /send_command → GET /command_events（等到 done）→ GET /get_result
+
+未指定 --url 時在暫存目錄啟動本機 server（uvicorn，繼承目前的 PT1_* 環境變數），
+並由 /proc/<pid>/status 與 /proc/<pid>/stat 取樣 RSS 與 CPU 時間（包含
+--workers 的子 process）；連到既有 server 時可用 --server-pid 指定。
+
+Usage:
+    python benchmarks/loadgen.py --agents 200 --callers 20 --duration 60
+    python benchmarks/loadgen.py --url http://host:5566 --api-token TOKEN --server-pid 1234
+    python benchmarks/loadgen.py --agents 500 --output after.json --compare before.json
+    python benchmarks/loadgen.py --agents 200 --callers 0 --agent-mode cycle
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pt1_server.__version__ import __version__
+
+HEARTBEAT_INTERVAL = 10  # 與 client_install.ps1 的 heartbeat job 相同
+# 與 client_install.ps1 相同的 long-poll 秒數
+POLL_WAIT = {"cycle": 25, "persistent": 50}
+PROCESS_START_LABEL = "agent process start"
+COMMAND_LABEL = "command (send -> result)"
+DRAIN_SECONDS = 5  # 量測結束後 agent 繼續處理已送出命令的時間
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    """samples 必須已排序（nearest-rank）"""
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=ROOT,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_rss_bytes(pid: int) -> Optional[int]:
+    """由 /proc 讀取 RSS（非 Linux 時返回 None）"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def read_cpu_seconds(pid: int) -> Optional[float]:
+    """由 /proc 讀取 process 與其子 process（uvicorn workers）的 user + system CPU 秒數"""
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+        total = 0
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as f:
+                    # comm 可能包含空白，以最後一個 ')' 之後的欄位為準
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            if int(entry) == pid or int(fields[1]) == pid:
+                total += int(fields[11]) + int(fields[12])
+        return total / ticks if total else None
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class LocalServer:
+    """在暫存目錄啟動 pt1-server，tokens.json 與 uploads/ 都放在該目錄
+
+    workers > 1 時以 uvicorn --workers 啟動並使用 PT1_STATE_BACKEND=shared；
+    env 中的設定覆蓋目前的環境變數。
+    """
+
+    def __init__(self, port: int, workers: int = 1, env: Optional[dict] = None):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.workdir = tempfile.mkdtemp(prefix="pt1_loadgen_")
+        self.api_token = str(uuid.uuid4())
+        self.workers = workers
+        self.env = env or {}
+        self.process = None
+
+    def start(self, timeout: float = 30):
+        with open(os.path.join(self.workdir, "tokens.json"), "w") as f:
+            # 沒有 expires_at 的 token 會在啟動時被輪替，先給一天的效期
+            expires_at = datetime.utcnow() + timedelta(days=1)
+            entry = {
+                "name": "loadgen",
+                "token": self.api_token,
+                "expires_at": expires_at.isoformat() + "Z",
+            }
+            json.dump({"tokens": [entry]}, f)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+        args = [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "pt1_server.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(self.port),
+            "--log-level",
+            "warning",
+        ]
+        if self.workers > 1:
+            env["PT1_STATE_BACKEND"] = "shared"
+            args += ["--workers", str(self.workers)]
+        env.update(self.env)
+        self.log = open(os.path.join(self.workdir, "server.log"), "wb")
+        self.process = subprocess.Popen(
+            args,
+            cwd=self.workdir,
+            env=env,
+            stdout=self.log,
+            stderr=subprocess.STDOUT,
+        )
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                requests.get(self.url + "/", timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(
+            f"Server did not start, see {os.path.join(self.workdir, 'server.log')}"
+        )
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.process:
+            self.log.close()
+
+    def cleanup(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class Recorder:
+    """依 endpoint 收集延遲（毫秒）與錯誤數；只計入在量測區間內開始的請求"""
+
+    def __init__(self, window_start: float, window_end: float):
+        self.window_start = window_start
+        self.window_end = window_end
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.events: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, label: str, started: float, ok: bool = True):
+        if not self.window_start <= started < self.window_end:
+            return
+        elapsed = (time.time() - started) * 1000
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(label, []).append(elapsed)
+            else:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def count(self, label: str):
+        """計數不是 HTTP 請求的事件（例如 agent process 啟動）"""
+        if not self.window_start <= time.time() < self.window_end:
+            return
+        with self._lock:
+            self.events[label] = self.events.get(label, 0) + 1
+
+    def summary(self, seconds: float) -> Dict[str, dict]:
+        results = {}
+        with self._lock:
+            labels = sorted(set(self.latencies) | set(self.errors))
+            for label in labels:
+                samples = sorted(self.latencies.get(label, []))
+                results[label] = {
+                    "count": len(samples),
+                    "errors": self.errors.get(label, 0),
+                    "rps": round(len(samples) / seconds, 2) if seconds > 0 else 0,
+                    "p50_ms": round(_percentile(samples, 0.50), 2),
+                    "p99_ms": round(_percentile(samples, 0.99), 2),
+                    "max_ms": round(samples[-1], 2) if samples else 0,
+                }
+        return results
+
+
+class LoadGenerator:
+    def __init__(self, args, base_url: str, session_token: str):
+        self.args = args
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"X-API-Token": session_token}
+        self.stop_at = 0.0  # CLI 使用者停止送出命令
+        self.agents_stop_at = 0.0  # agent 多跑一段時間，讓最後的命令完成
+        self.recorder: Optional[Recorder] = None
+        self.transcript = self._build_transcript(args.transcript_kb * 1024)
+        self.file_body = os.urandom(args.file_kb * 1024)
+
+    @staticmethod
+    def _build_transcript(size: int) -> bytes:
+        """模擬 Start-Transcript 的輸出"""
+        lines = [
+            "**********************",
+            "Windows PowerShell transcript start",
+            f"Start time: {datetime.now():%Y%m%d%H%M%S}",
+            "**********************",
+        ]
+        row = 0
+        total = sum(len(line) + 2 for line in lines)
+        while total < size:
+            row += 1
+            lines.append(
+                f"{row:>6} svchost      {random.randint(1000, 99999):>8} "
+                f"{random.random() * 100:>8.2f} Running  C:\\Windows\\System32"
+            )
+            total += len(lines[-1]) + 2
+        return "\r\n".join(lines).encode("utf-8")[:size]
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update(self.headers)
+        return session
+
+    def _running(self, agent: bool = False) -> bool:
+        return time.time() < (self.agents_stop_at if agent else self.stop_at)
+
+    def _call(
+        self, session: requests.Session, label: str, method: str, path: str, **kwargs
+    ) -> Optional[requests.Response]:
+        started = time.time()
+        try:
+            response = session.request(
+                method,
+                self.base_url + path,
+                timeout=kwargs.pop("timeout", 30),
+                **kwargs,
+            )
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(label, started, ok)
+        return response if ok else None
+
+    # ------------------------------------------------------------------
+    # Agent
+    # ------------------------------------------------------------------
+
+    def agent_loop(self, index: int):
+        args = self.args
+        client_id = f"loadgen-{index:05d}"
+        hostname = f"LOADGEN-{index:05d}"
+        username = "loadgen"
+        session = self._session()
+        persistent = args.agent_mode == "persistent"
+        run_count = 0
+        script = {"etag": None, "version": None}
+
+        def start_process():
+            """client_install.ps1：下載（persistent 帶 If-None-Match）並註冊"""
+            self.recorder.count(PROCESS_START_LABEL)
+            headers = {}
+            if script["etag"]:
+                headers["If-None-Match"] = script["etag"]
+            response = self._call(
+                session,
+                "GET /client_install.ps1",
+                "GET",
+                "/client_install.ps1",
+                headers=headers,
+            )
+            if response is not None and response.status_code == 200:
+                script["etag"] = response.headers.get("ETag")
+                script["version"] = response.headers.get("X-PT1-Script-Version")
+            self._call(
+                session,
+                "POST /register_client",
+                "POST",
+                "/register_client",
+                json={
+                    "client_id": client_id,
+                    "hostname": hostname,
+                    "username": username,
+                },
+            )
+
+        if persistent:
+            start_process()
+
+        while self._running(agent=True):
+            run_count += 1
+            run_id = f"run-{run_count:03d}"
+
+            if not persistent:
+                start_process()
+
+            remaining = self.agents_stop_at - time.time()
+            if remaining < 1:
+                break
+            wait = int(min(args.poll_wait, remaining))
+            params = {
+                "client_id": client_id,
+                "hostname": hostname,
+                "username": username,
+                "wait": wait,
+            }
+            if persistent and script["version"]:
+                params["script_version"] = script["version"]
+            started = time.time()
+            try:
+                response = session.get(
+                    self.base_url + "/next_command",
+                    params=params,
+                    timeout=wait + 10,
+                )
+                data = response.json() if response.status_code < 400 else None
+            except (requests.RequestException, ValueError):
+                data = None
+            if data is None:
+                self.recorder.record("GET /next_command", started, ok=False)
+                time.sleep(1)
+                continue
+            latest = data.get("script_version")
+            if persistent and latest and latest != script["version"]:
+                # server 有新版 client_install.ps1：process 結束，win_agent.ps1 重新下載
+                self.recorder.record("GET /next_command (empty)", started)
+                start_process()
+                continue
+            if not data.get("command"):
+                # 沒有命令：client_install.ps1 建立 SKIP_TRANSCRIPT flag，不上傳 transcript
+                self.recorder.record("GET /next_command (empty)", started)
+                continue
+            self.recorder.record("GET /next_command (command)", started)
+            command_id = data["command_id"]
+
+            # 執行命令，期間定時送出 heartbeat
+            exec_until = time.time() + args.exec_ms / 1000
+            while True:
+                self._call(
+                    session,
+                    "POST /heartbeat/{client_id}",
+                    "POST",
+                    f"/heartbeat/{client_id}",
+                    data={"hostname": hostname, "username": username},
+                )
+                pause = exec_until - time.time()
+                if pause <= 0:
+                    break
+                time.sleep(min(pause, HEARTBEAT_INTERVAL))
+                if time.time() >= exec_until:
+                    break
+
+            with_file = random.random() < args.file_ratio
+            self._call(
+                session,
+                "POST /submit_result",
+                "POST",
+                "/submit_result",
+                json={
+                    "command_id": command_id,
+                    "result": f"{data['command']} output\r\n" * 8,
+                    "status": "completed",
+                    "result_type": "mixed" if with_file else "text",
+                },
+            )
+            if with_file:
+                self._call(
+                    session,
+                    "POST /upload_files/{command_id}",
+                    "POST",
+                    f"/upload_files/{command_id}",
+                    files={
+                        "files": (
+                            "output.bin",
+                            command_id.encode() + self.file_body,
+                            "application/octet-stream",
+                        )
+                    },
+                )
+
+            self._call(
+                session,
+                "POST /agent_transcript/{client_id}",
+                "POST",
+                f"/agent_transcript/{client_id}",
+                files={
+                    "transcript_file": (
+                        f"{run_id}-transcript.txt",
+                        self.transcript,
+                        "text/plain",
+                    )
+                },
+                data={"run_id": run_id},
+            )
+
+    # ------------------------------------------------------------------
+    # CLI caller
+    # ------------------------------------------------------------------
+
+    def _wait_for_done(
+        self, session: requests.Session, command_id: str
+    ) -> Optional[bool]:
+        """
+        與 pt1 wait 相同：訂閱 /command_events 直到 done
+
+        Returns:
+            是否完成；agent 已停止而等不到結果時返回 None（不計為錯誤）
+        """
+        started = time.time()
+        done = False
+        timeout = min(self.args.command_timeout, self.agents_stop_at - started)
+        try:
+            with session.get(
+                self.base_url + "/command_events",
+                params={
+                    "command_ids": command_id,
+                    "timeout": max(1, timeout),
+                    "keepalive": 5,
+                },
+                headers={"Accept": "text/event-stream"},
+                stream=True,
+                timeout=(10, 40),
+            ) as response:
+                if response.status_code < 400:
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line in ("event: done", "event: timeout"):
+                            done = line == "event: done"
+                            break
+        except requests.RequestException:
+            pass
+        if not done and time.time() >= self.agents_stop_at:
+            return None
+        self.recorder.record("GET /command_events", started, done)
+        return done
+
+    def caller_loop(self, index: int):
+        args = self.args
+        session = self._session()
+        rng = random.Random(index)
+
+        while self._running():
+            target = f"loadgen-{rng.randrange(args.agents):05d}"
+            started = time.time()
+            response = self._call(
+                session,
+                "POST /send_command",
+                "POST",
+                "/send_command",
+                json={"client_id": target, "command": "Get-Process | Select -First 5"},
+            )
+            if response is None:
+                time.sleep(1)
+                continue
+            command_id = response.json()["command_id"]
+
+            done = self._wait_for_done(session, command_id)
+            if done is None:
+                break
+            if done:
+                self._call(
+                    session,
+                    "GET /get_result/{command_id}",
+                    "GET",
+                    f"/get_result/{command_id}",
+                )
+                self.recorder.record(COMMAND_LABEL, started)
+            else:
+                self.recorder.record(COMMAND_LABEL, started, ok=False)
+
+            time.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+    # ------------------------------------------------------------------
+
+    def run(self, server_pid: Optional[int]) -> dict:
+        args = self.args
+        start = time.time()
+        self.stop_at = start + args.warmup + args.duration
+        self.agents_stop_at = self.stop_at + args.exec_ms / 1000 + DRAIN_SECONDS
+        self.recorder = Recorder(start + args.warmup, self.stop_at)
+
+        threads = []
+        for i in range(args.agents):
+            threads.append(threading.Thread(target=self.agent_loop, args=(i,)))
+        for i in range(args.callers):
+            threads.append(threading.Thread(target=self.caller_loop, args=(i,)))
+
+        rss_samples: List[int] = []
+        cpu_samples: List[tuple] = []
+        sampler_stop = threading.Event()
+
+        def sample_rss():
+            while not sampler_stop.is_set():
+                rss = read_rss_bytes(server_pid) if server_pid else None
+                if rss is not None:
+                    rss_samples.append(rss)
+                cpu = read_cpu_seconds(server_pid) if server_pid else None
+                if cpu is not None:
+                    cpu_samples.append((time.time(), cpu))
+                sampler_stop.wait(1)
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        # agent 在 --ramp 秒內陸續啟動，避免同時連線
+        ramp_step = args.ramp / max(1, args.agents)
+        for i, thread in enumerate(threads):
+            thread.daemon = True
+            thread.start()
+            if i < args.agents and ramp_step:
+                time.sleep(ramp_step)
+
+        deadline = self.agents_stop_at + 15
+        for thread in threads:
+            thread.join(max(0, deadline - time.time()))
+        sampler_stop.set()
+        sampler.join()
+
+        measured = args.duration
+        endpoints = self.recorder.summary(measured)
+        commands = endpoints.pop(COMMAND_LABEL, None)
+        requests_sent = sum(e["count"] + e["errors"] for e in endpoints.values())
+
+        # 量測區間內的 server CPU 時間
+        window = [
+            (t, cpu)
+            for t, cpu in cpu_samples
+            if self.recorder.window_start <= t <= self.stop_at
+        ]
+        server_cpu = None
+        if len(window) >= 2:
+            (t0, cpu0), (t1, cpu1) = window[0], window[-1]
+            server_cpu = {
+                "seconds": round((cpu1 - cpu0) * measured / (t1 - t0), 2),
+                "percent": round((cpu1 - cpu0) / (t1 - t0) * 100, 2),
+            }
+
+        # 換算成每個 agent 每小時（--callers 0 時即為閒置 agent 的成本）
+        per_agent_hour = 3600 / measured / max(1, args.agents)
+        agent_hour = {
+            "requests": round(requests_sent * per_agent_hour, 1),
+            "process_starts": round(
+                self.recorder.events.get(PROCESS_START_LABEL, 0) * per_agent_hour, 1
+            ),
+            "server_cpu_seconds": (
+                round(server_cpu["seconds"] * per_agent_hour, 3) if server_cpu else None
+            ),
+        }
+
+        mb = 1024 * 1024
+        return {
+            "pt1_version": __version__,
+            "git_commit": _git_commit(),
+            "started_at": datetime.fromtimestamp(start).isoformat(),
+            "platform": {
+                "python": platform.python_version(),
+                "system": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "config": {
+                "agents": args.agents,
+                "callers": args.callers,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "agent_mode": args.agent_mode,
+                "poll_wait": args.poll_wait,
+                "exec_ms": args.exec_ms,
+                "think_ms": args.think_ms,
+                "file_ratio": args.file_ratio,
+                "file_kb": args.file_kb,
+                "transcript_kb": args.transcript_kb,
+                "state_backend": os.getenv("PT1_STATE_BACKEND", "memory"),
+            },
+            "measured_seconds": round(measured, 2),
+            "total_rps": round(
+                sum(e["count"] for e in endpoints.values()) / measured, 2
+            ),
+            "commands": commands,
+            "endpoints": endpoints,
+            "per_agent_hour": agent_hour,
+            "server_cpu": server_cpu,
+            "server_rss_mb": (
+                {
+                    "start": round(rss_samples[0] / mb, 1),
+                    "peak": round(max(rss_samples) / mb, 1),
+                    "end": round(rss_samples[-1] / mb, 1),
+                }
+                if rss_samples
+                else None
+            ),
+        }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    def delta(label: str, key: str, value: float) -> str:
+        if not baseline:
+            return ""
+        if label == COMMAND_LABEL:
+            old = (baseline.get("commands") or {}).get(key)
+        else:
+            old = baseline.get("endpoints", {}).get(label, {}).get(key)
+        if not old:
+            return f"{'':>8}"
+        return f"{(value - old) / old * 100:>+7.0f}%"
+
+    config = report["config"]
+    print("")
+    print(
+        f"pt1 {report['pt1_version']} ({report['git_commit'] or 'unknown'})  "
+        f"agents={config['agents']} ({config.get('agent_mode', 'cycle')}) "
+        f"callers={config['callers']}  "
+        f"measured {report['measured_seconds']}s  total {report['total_rps']} req/s"
+    )
+    if baseline:
+        print(
+            f"compared with pt1 {baseline.get('pt1_version')} "
+            f"({baseline.get('git_commit') or 'unknown'})"
+        )
+    print("")
+    header = f"{'ENDPOINT':<36} {'COUNT':>8} {'ERR':>5} {'REQ/S':>9} {'P50 (ms)':>10} {'P99 (ms)':>10}"
+    if baseline:
+        header += f" {'P99 Δ':>8} {'REQ/S Δ':>8}"
+    print(header)
+    print("-" * len(header))
+
+    rows = list(report["endpoints"].items())
+    if report.get("commands"):
+        rows.append((COMMAND_LABEL, report["commands"]))
+    for label, stats in rows:
+        line = (
+            f"{label:<36} {stats['count']:>8} {stats['errors']:>5} {stats['rps']:>9.2f} "
+            f"{stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f}"
+        )
+        if baseline:
+            line += (
+                f" {delta(label, 'p99_ms', stats['p99_ms'])}"
+                f" {delta(label, 'rps', stats['rps'])}"
+            )
+        print(line)
+
+    rss = report.get("server_rss_mb")
+    if rss:
+        line = f"Server RSS: start {rss['start']} MB, peak {rss['peak']} MB, end {rss['end']} MB"
+        old = (baseline or {}).get("server_rss_mb")
+        if old:
+            line += f" (baseline peak {old['peak']} MB)"
+        print("")
+        print(line)
+    cpu = report.get("server_cpu")
+    if cpu:
+        print(f"Server CPU: {cpu['seconds']} s ({cpu['percent']}%)")
+    hour = report.get("per_agent_hour")
+    if hour:
+        line = (
+            f"Per agent per hour: {hour['requests']} requests, "
+            f"{hour['process_starts']} agent process starts"
+        )
+        if hour["server_cpu_seconds"] is not None:
+            line += f", {hour['server_cpu_seconds']} s server CPU"
+        old = (baseline or {}).get("per_agent_hour")
+        if old:
+            line += f" (baseline {old['requests']} requests)"
+        print(line)
+    print("")
+    print(
+        "GET /next_command (empty) and GET /command_events include server-side waiting."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=100, help="simulated agents")
+    parser.add_argument(
+        "--callers", type=int, default=10, help="simulated pt1 send/wait users"
+    )
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=5, help="seconds excluded from stats"
+    )
+    parser.add_argument(
+        "--ramp", type=float, default=5, help="seconds to start all agents"
+    )
+    parser.add_argument(
+        "--agent-mode",
+        choices=sorted(POLL_WAIT),
+        default="persistent",
+        help="persistent: resident agent, registers once; cycle: new process per poll",
+    )
+    parser.add_argument(
+        "--poll-wait",
+        type=int,
+        help="next_command long-poll seconds (default: 50 persistent, 25 cycle)",
+    )
+    parser.add_argument(
+        "--exec-ms", type=int, default=200, help="simulated command run time"
+    )
+    parser.add_argument(
+        "--think-ms", type=int, default=1000, help="pause between commands per caller"
+    )
+    parser.add_argument(
+        "--file-ratio",
+        type=float,
+        default=0.2,
+        help="fraction of commands uploading a file",
+    )
+    parser.add_argument("--file-kb", type=int, default=64, help="result file size")
+    parser.add_argument("--transcript-kb", type=int, default=16, help="transcript size")
+    parser.add_argument(
+        "--command-timeout",
+        type=float,
+        default=120,
+        help="pt1 wait timeout per command",
+    )
+    parser.add_argument("--url", help="existing server (default: start a local one)")
+    parser.add_argument(
+        "--api-token",
+        default=os.getenv("PT1_API_TOKEN"),
+        help="refresh token for --url",
+    )
+    parser.add_argument(
+        "--server-pid", type=int, help="pid of --url server for RSS sampling"
+    )
+    parser.add_argument(
+        "--output", help="JSON results file (default: loadgen-<time>.json)"
+    )
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    parser.add_argument(
+        "--keep-server-dir",
+        action="store_true",
+        help="keep the local server's temp dir",
+    )
+    args = parser.parse_args()
+    if args.poll_wait is None:
+        args.poll_wait = POLL_WAIT[args.agent_mode]
+
+    if args.callers and not args.agents:
+        parser.error("--callers needs at least one agent to run the commands")
+    if args.url and not args.api_token:
+        parser.error("--url needs --api-token or PT1_API_TOKEN")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    server = None
+    base_url, api_token, server_pid = args.url, args.api_token, args.server_pid
+    if not base_url:
+        server = LocalServer(_free_port())
+        server.start()
+        base_url, api_token, server_pid = (
+            server.url,
+            server.api_token,
+            server.process.pid,
+        )
+        print(f"Started local server at {base_url} (dir {server.workdir})")
+
+    try:
+        response = requests.post(
+            base_url.rstrip("/") + "/auth/token/exchange",
+            headers={"X-API-Token": api_token},
+            timeout=10,
+        )
+        response.raise_for_status()
+        session_token = response.json()["session_token"]
+
+        print(
+            f"Running {args.agents} agents and {args.callers} callers for "
+            f"{args.warmup:g}s warmup + {args.duration:g}s ..."
+        )
+        generator = LoadGenerator(args, base_url, session_token)
+        report = generator.run(server_pid)
+    finally:
+        if server:
+            server.stop()
+            if not args.keep_server_dir:
+                server.cleanup()
+
+    output = args.output or f"loadgen-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report, baseline)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ from pt1_cli.commands.list_files import ListFilesCommand
 from pt1_cli.commands.download import DownloadCommand
 from pt1_cli.commands.list_transcripts import ListTranscriptsCommand
 from pt1_cli.commands.get_transcript import GetTranscriptCommand
+from pt1_cli.commands.search import SearchCommand
 from pt1_cli.commands.terminate import TerminateCommand
 from pt1_cli.commands.help import HelpCommand
 from pt1_cli.commands.prompt import PromptCommand
@@ -52,6 +53,10 @@ def main():
         )
         print("  list-transcripts  List agent execution transcripts", file=sys.stderr)
         print("  get-transcript    Get transcript content", file=sys.stderr)
+        print(
+            "  search            Search transcripts and command results",
+            file=sys.stderr,
+        )
         print("  terminate         Terminate a client gracefully", file=sys.stderr)
         print("  help              Show detailed help", file=sys.stderr)
         print("  prompt            Show AI agent quick reference", file=sys.stderr)
@@ -95,6 +100,9 @@ def main():
     elif command == "get-transcript":
         cmd = GetTranscriptCommand()
         sys.exit(cmd.execute())
+    elif command == "search":
+        cmd = SearchCommand()
+        sys.exit(cmd.execute())
     elif command == "terminate":
         cmd = TerminateCommand()
         sys.exit(cmd.execute())
@@ -2,14 +2,45 @@
 Download Command
 
 下載命令產生的檔案
+
+下載先寫入 <output>.part，完成後才改名為最終檔名。中斷時保留 .part 與
+<output>.part.json（記錄 ETag），再次執行相同命令會用 Range + If-Range 從中斷處
+繼續；server 上的檔案已變更時自動從頭下載。
+
+--parallel N 會把大檔案切成 N 段同時下載，各段進度同樣記錄在 .part.json。
 """
 
+import json
 import sys
 import os
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pt1_cli.core import Command, PT1Config, PT1Client
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# 小於此大小的檔案不值得平行下載
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+
+
+def _load_state(state_path: Path) -> dict:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state_path: Path, state: dict):
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def _total_size(response: requests.Response) -> int:
+    """從 Content-Range（bytes a-b/size 或 bytes */size）取得檔案大小"""
+    return int(response.headers["Content-Range"].rsplit("/", 1)[1])
+
 
 class DownloadCommand(Command):
     """下載命令產生的檔案"""
@@ -26,12 +57,30 @@ class DownloadCommand(Command):
         # 建立 API client
         client = PT1Client(config)
 
+        # 解析選項
+        args = []
+        parallel = 1
+        i = 2
+        while i < len(sys.argv):
+            if sys.argv[i] == "--parallel" and i + 1 < len(sys.argv):
+                try:
+                    parallel = int(sys.argv[i + 1])
+                    if parallel < 1:
+                        raise ValueError
+                except ValueError:
+                    print("Error: parallel must be a positive number", file=sys.stderr)
+                    return 1
+                i += 2
+            else:
+                args.append(sys.argv[i])
+                i += 1
+
         # 檢查是否提供必要參數
-        if len(sys.argv) < 4:
+        if len(args) < 2:
             print("Error: command_id and filename are required", file=sys.stderr)
             print("", file=sys.stderr)
             print(
-                f"Usage: {sys.argv[0]} download <command_id> <filename> [output_path]",
+                f"Usage: {sys.argv[0]} download <command_id> <filename> [output_path] [--parallel N]",
                 file=sys.stderr,
             )
             print("", file=sys.stderr)
@@ -43,6 +92,12 @@ class DownloadCommand(Command):
                 file=sys.stderr,
             )
             print("", file=sys.stderr)
+            print("Options:", file=sys.stderr)
+            print(
+                "  --parallel N  Download large files in N concurrent ranges",
+                file=sys.stderr,
+            )
+            print("", file=sys.stderr)
             print("Example:", file=sys.stderr)
             print(
                 f"  {sys.argv[0]} download 1c424006-b72d-49fd-bdb9-109fb8d63d1e output.txt",
@@ -54,12 +109,12 @@ class DownloadCommand(Command):
             )
             return 1
 
-        command_id = sys.argv[2]
-        filename = sys.argv[3]
+        command_id = args[0]
+        filename = args[1]
 
         # 決定輸出路徑
-        if len(sys.argv) >= 5:
-            output_path = Path(sys.argv[4])
+        if len(args) >= 3:
+            output_path = Path(args[2])
             # 如果是目錄，使用原始檔名
             if output_path.is_dir() or output_path.suffix == "":
                 output_path = output_path / filename
@@ -79,19 +134,27 @@ class DownloadCommand(Command):
         # 確保輸出目錄存在
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
+        part_path = output_path.with_name(output_path.name + ".part")
+        state_path = output_path.with_name(output_path.name + ".part.json")
+
         # 下載檔案
         try:
             print(f"Downloading {filename} from command {command_id}...")
 
-            response = client.download_file(command_id, filename)
+            state = _load_state(state_path) if part_path.exists() else {}
+            # 先前的平行下載只能以平行模式接續（.part 不是連續寫入）
+            if parallel > 1 or state.get("segments"):
+                total_size = self._download_parallel(
+                    client, command_id, filename, part_path, state_path, parallel
+                )
+            else:
+                total_size = self._download_sequential(
+                    client, command_id, filename, part_path, state_path
+                )
 
-            # 寫入檔案
-            total_size = 0
-            with open(output_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        total_size += len(chunk)
+            os.replace(part_path, output_path)
+            if state_path.exists():
+                state_path.unlink()
 
             # 格式化檔案大小
             if total_size < 1024:
@@ -115,19 +178,167 @@ class DownloadCommand(Command):
                 "Please check if the server is running and the URL is correct",
                 file=sys.stderr,
             )
-            # 清理未完成的檔案
-            if output_path.exists():
-                output_path.unlink()
+            self._print_resume_hint(part_path)
             return 1
         except requests.exceptions.Timeout:
             print("Error: Request timed out", file=sys.stderr)
-            # 清理未完成的檔案
-            if output_path.exists():
-                output_path.unlink()
+            self._print_resume_hint(part_path)
             return 1
+        except KeyboardInterrupt:
+            print("", file=sys.stderr)
+            print("Download interrupted", file=sys.stderr)
+            self._print_resume_hint(part_path)
+            return 130
         except Exception as e:
             print(f"Error: {str(e)}", file=sys.stderr)
-            # 清理未完成的檔案
-            if output_path.exists():
-                output_path.unlink()
+            self._print_resume_hint(part_path)
             return 1
+
+    def _print_resume_hint(self, part_path: Path):
+        """保留未完成的檔案，提示可再次執行以接續下載"""
+        if part_path.exists():
+            print(
+                f"Partial download kept at '{part_path}'; run the same command again to resume",
+                file=sys.stderr,
+            )
+
+    def _download_sequential(
+        self,
+        client: PT1Client,
+        command_id: str,
+        filename: str,
+        part_path: Path,
+        state_path: Path,
+    ) -> int:
+        """依序下載到 .part，已有部分內容時從中斷處繼續，返回檔案大小"""
+        state = _load_state(state_path)
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if not state.get("etag"):
+            offset = 0
+
+        try:
+            if offset:
+                response = client.download_file(
+                    command_id, filename, start=offset, if_range=state["etag"]
+                )
+            else:
+                response = client.download_file(command_id, filename)
+        except requests.HTTPError as e:
+            # .part 已經是完整檔案（上次在改名前中斷）
+            if e.response is not None and e.response.status_code == 416:
+                if _total_size(e.response) == offset:
+                    return offset
+                response = client.download_file(command_id, filename)
+            else:
+                raise
+
+        if response.status_code == 206:
+            print(f"  Resuming from {offset} bytes")
+            mode = "ab"
+        else:
+            # 第一次下載，或 server 上的檔案已變更（If-Range 不符）
+            mode = "wb"
+            offset = 0
+
+        _save_state(state_path, {"etag": response.headers.get("ETag")})
+
+        total_size = offset
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    total_size += len(chunk)
+
+        return total_size
+
+    def _download_parallel(
+        self,
+        client: PT1Client,
+        command_id: str,
+        filename: str,
+        part_path: Path,
+        state_path: Path,
+        parallel: int,
+    ) -> int:
+        """把檔案切成多段同時下載到 .part，返回檔案大小"""
+        # 用 1 byte 的 Range 請求取得檔案大小與 ETag
+        try:
+            probe = client.download_file(command_id, filename, start=0, end=0)
+            probe.close()
+        except requests.HTTPError as e:
+            # 空檔案無法滿足任何 range
+            if e.response is not None and e.response.status_code == 416:
+                return self._download_sequential(
+                    client, command_id, filename, part_path, state_path
+                )
+            raise
+
+        etag = probe.headers.get("ETag")
+        if probe.status_code != 206 or not etag:
+            print("  Server does not support ranges, downloading sequentially")
+            return self._download_sequential(
+                client, command_id, filename, part_path, state_path
+            )
+        size = _total_size(probe)
+
+        state = _load_state(state_path)
+        if (
+            state.get("etag") == etag
+            and state.get("segments")
+            and part_path.exists()
+            and part_path.stat().st_size == size
+        ):
+            segments = state["segments"]
+            remaining = sum(max(end - start + 1, 0) for start, end in segments)
+            print(f"  Resuming: {size - remaining} of {size} bytes already downloaded")
+        elif size < PARALLEL_MIN_SIZE:
+            if part_path.exists():
+                part_path.unlink()
+            return self._download_sequential(
+                client, command_id, filename, part_path, state_path
+            )
+        else:
+            # 每段為 [下一個要下載的 byte, 結束 byte]
+            segment_size = -(-size // parallel)
+            segments = [
+                [start, min(start + segment_size, size) - 1]
+                for start in range(0, size, segment_size)
+            ]
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+
+        cancelled = threading.Event()
+
+        def fetch(segment: list):
+            if segment[0] > segment[1]:
+                return
+            response = client.download_file(
+                command_id, filename, start=segment[0], end=segment[1], if_range=etag
+            )
+            if response.status_code != 206:
+                response.close()
+                raise Exception("File changed on server during download")
+            with open(part_path, "r+b") as f:
+                f.seek(segment[0])
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if cancelled.is_set():
+                        response.close()
+                        return
+                    if chunk:
+                        f.write(chunk)
+                        segment[0] += len(chunk)
+
+        executor = ThreadPoolExecutor(max_workers=parallel)
+        try:
+            for _ in executor.map(fetch, segments):
+                pass
+        except BaseException:
+            # 任一段失敗或 Ctrl-C 時讓其他段停止
+            cancelled.set()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            # 記錄各段進度，下次從中斷處繼續
+            _save_state(state_path, {"etag": etag, "size": size, "segments": segments})
+
+        return size
@@ -4,10 +4,20 @@ Get Transcript Command
 取得 agent 執行記錄內容
 """
 
+import codecs
 import sys
+import time
 import requests
 from pt1_cli.core import Command, PT1Config, PT1Client
 
+# --follow 檢查新 transcript 的間隔（秒）
+FOLLOW_INTERVAL = 5
+
+
+def _client_from_transcript_id(transcript_id: str) -> str:
+    """transcript_id 格式為 <client_id>_<YYYYmmdd>_<HHMMSS>_<ms>"""
+    return transcript_id.rsplit("_", 3)[0]
+
 
 class GetTranscriptCommand(Command):
     """取得 agent 執行記錄內容"""
@@ -24,12 +34,42 @@ class GetTranscriptCommand(Command):
         # 建立 API client
         client = PT1Client(config)
 
+        # 解析參數
+        args = []
+        tail = None
+        follow = False
+        i = 2
+        while i < len(sys.argv):
+            if sys.argv[i] == "--tail" and i + 1 < len(sys.argv):
+                try:
+                    tail = int(sys.argv[i + 1])
+                    if tail < 1:
+                        raise ValueError
+                except ValueError:
+                    print("Error: tail must be a positive number", file=sys.stderr)
+                    return 1
+                i += 2
+            elif sys.argv[i] in ("--follow", "-f"):
+                follow = True
+                i += 1
+            else:
+                args.append(sys.argv[i])
+                i += 1
+
         # 檢查是否提供 transcript_id
-        if len(sys.argv) < 3:
+        if not args:
             print("Error: transcript_id is required", file=sys.stderr)
             print("", file=sys.stderr)
             print(
-                f"Usage: {sys.argv[0]} get-transcript <transcript_id>", file=sys.stderr
+                f"Usage: {sys.argv[0]} get-transcript <transcript_id> [--tail N] [--follow]",
+                file=sys.stderr,
+            )
+            print("", file=sys.stderr)
+            print("Options:", file=sys.stderr)
+            print("  --tail N      Only show the last N lines", file=sys.stderr)
+            print(
+                "  --follow, -f  Keep printing newer transcripts from the same client",
+                file=sys.stderr,
             )
             print("", file=sys.stderr)
             print("Example:", file=sys.stderr)
@@ -37,23 +77,25 @@ class GetTranscriptCommand(Command):
                 f"  {sys.argv[0]} get-transcript test-pc_20251219_094532_123",
                 file=sys.stderr,
             )
+            print(
+                f"  {sys.argv[0]} get-transcript test-pc_20251219_094532_123 --tail 50 --follow",
+                file=sys.stderr,
+            )
             return 1
 
-        transcript_id = sys.argv[2]
+        transcript_id = args[0]
 
-        # 查詢 transcript（固定使用 content 格式）
+        # 查詢 transcript（串流輸出，不整個讀進記憶體）
         try:
-            data = client.get_transcript(transcript_id, format="content")
+            self._print_transcript(client, transcript_id, tail)
 
-            # 顯示 transcript 內容
-            content = data.get("content", "")
-            print(f"Transcript: {transcript_id}")
-            print("=" * 80)
-            print(content)
-            print("=" * 80)
+            if follow:
+                self._follow(client, transcript_id, tail)
 
             return 0
 
+        except KeyboardInterrupt:
+            return 0
         except requests.exceptions.ConnectionError:
             print(
                 f"Error: Cannot connect to server at {config.server_url}",
@@ -70,3 +112,54 @@ class GetTranscriptCommand(Command):
         except Exception as e:
             print(f"Error: {str(e)}", file=sys.stderr)
             return 1
+
+    def _print_transcript(
+        self, client: PT1Client, transcript_id: str, tail: int = None
+    ):
+        """串流輸出單一 transcript"""
+        response = client.stream_transcript(transcript_id, tail=tail)
+
+        if tail:
+            print(f"Transcript: {transcript_id} (last {tail} lines)")
+        else:
+            print(f"Transcript: {transcript_id}")
+        print("=" * 80)
+
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(
+            errors="replace"
+        )
+        ends_with_newline = True
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            text = decoder.decode(chunk)
+            if text:
+                sys.stdout.write(text)
+                ends_with_newline = text.endswith("\n")
+        text = decoder.decode(b"", final=True)
+        if text:
+            sys.stdout.write(text)
+            ends_with_newline = text.endswith("\n")
+
+        if not ends_with_newline:
+            sys.stdout.write("\n")
+        print("=" * 80)
+        sys.stdout.flush()
+
+    def _follow(self, client: PT1Client, transcript_id: str, tail: int = None):
+        """持續輸出同一個 client 之後上傳的 transcript（Ctrl-C 結束）"""
+        client_id = _client_from_transcript_id(transcript_id)
+        last_id = transcript_id
+        print(f"Following transcripts from {client_id} (Ctrl-C to stop)...")
+
+        while True:
+            time.sleep(FOLLOW_INTERVAL)
+            data = client.list_transcripts(stable_id=client_id, limit=20)
+            # transcript_id 含時間戳，字串順序即上傳順序
+            newer = sorted(
+                t["transcript_id"]
+                for t in data.get("transcripts", [])
+                if t.get("transcript_id", "") > last_id
+            )
+            for new_id in newer:
+                print("")
+                self._print_transcript(client, new_id, tail)
+                last_id = new_id
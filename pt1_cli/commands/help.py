@@ -155,14 +155,20 @@ See also:
 pt1 wait - Wait for command completion
 
 Usage:
-  pt1 wait <command_id>
+  pt1 wait <command_id> [--interval <seconds>] [--max <seconds>] [--poll]
 
 Arguments:
   command_id    命令執行的 ID
 
+Options:
+  --interval    輪詢間隔秒數（僅輪詢模式，預設 0.5）
+  --max         最長等待秒數（預設 30）
+  --poll        強制使用輪詢，不使用 server 推送
+
 Description:
-  自動輪詢等待命令執行完成，並顯示結果。
-  每 2 秒檢查一次執行狀態，直到完成或失敗。
+  等待命令執行完成，並顯示結果。
+  預設透過 server 推送（/command_events）接收狀態變化，
+  server 不支援時自動改為輪詢。
 
   按 Ctrl+C 可中斷等待。
 
@@ -228,23 +234,30 @@ See also:
 pt1 download - Download file from command result
 
 Usage:
-  pt1 download <command_id> <filename> [output_path]
+  pt1 download <command_id> <filename> [output_path] [--parallel N]
 
 Arguments:
   command_id     命令執行的 ID
   filename       要下載的檔案名稱
   output_path    輸出路徑（選填，預設為當前目錄）
 
+Options:
+  --parallel N   把大檔案（8 MB 以上）切成 N 段同時下載
+
 Description:
   下載命令執行過程中產生的檔案。
 
   如果輸出路徑是目錄，會保留原始檔名。
   如果檔案已存在，會報錯避免覆蓋。
 
+  下載中斷時會保留 <output>.part，再次執行相同命令即從中斷處繼續；
+  server 上的檔案已變更時會自動重新下載。
+
 Examples:
   pt1 download 1c424006-b72d-49fd-bdb9-109fb8d63d1e output.csv
   pt1 download 1c424006-b72d-49fd-bdb9-109fb8d63d1e output.csv ./downloads/
   pt1 download 1c424006-b72d-49fd-bdb9-109fb8d63d1e output.csv ./reports/report.csv
+  pt1 download 1c424006-b72d-49fd-bdb9-109fb8d63d1e dump.zip --parallel 4
 
 See also:
   pt1 list-files <command_id>    查看可下載的檔案
@@ -253,12 +266,15 @@ See also:
 pt1 list-transcripts - List agent execution transcripts
 
 Usage:
-  pt1 list-transcripts [client_id] [limit]
+  pt1 list-transcripts [client_id] [limit] [--cursor N]
 
 Arguments:
   client_id    過濾特定 client（選填）
   limit        限制顯示筆數（選填，預設 50，最大 200）
 
+Options:
+  --cursor N   顯示下一頁（N 為上一頁最後提示的 cursor）
+
 Description:
   列出 PowerShell agent 的執行記錄 (transcripts)。
   Transcript 是完整的 PowerShell session 記錄檔。
@@ -273,6 +289,7 @@ Examples:
   pt1 list-transcripts                列出所有 transcripts
   pt1 list-transcripts my-example-pc     列出特定 client 的 transcripts
   pt1 list-transcripts my-example-pc 10  列出最近 10 筆
+  pt1 list-transcripts --cursor 1200     列出更早的 transcripts
 
 See also:
   pt1 get-transcript <transcript_id>    查看 transcript 內容
@@ -281,13 +298,18 @@ See also:
 pt1 get-transcript - Get transcript content
 
 Usage:
-  pt1 get-transcript <transcript_id>
+  pt1 get-transcript <transcript_id> [--tail N] [--follow]
 
 Arguments:
   transcript_id    Transcript 的 ID
 
+Options:
+  --tail N         只顯示最後 N 行（server 只傳回這些內容）
+  --follow, -f     持續顯示同一個 client 之後上傳的 transcripts（Ctrl-C 結束）
+
 Description:
-  查看 PowerShell agent 執行記錄的完整內容。
+  查看 PowerShell agent 執行記錄的完整內容。內容以串流方式輸出，
+  大型 transcript 不會整個載入記憶體。
 
   Transcript 包含：
   - PowerShell session 資訊
@@ -298,9 +320,48 @@ Description:
 
 Example:
   pt1 get-transcript my-example-pc_20251219_094532_123
+  pt1 get-transcript my-example-pc_20251219_094532_123 --tail 50 --follow
 
 See also:
   pt1 list-transcripts [client_id]    列出可用的 transcripts
+""",
+    "search": """
+pt1 search - Search transcripts and command results
+
+Usage:
+  pt1 search <query> [--client ID] [--type transcript|result]
+             [--since TIME] [--until TIME] [--limit N] [--rank]
+
+Arguments:
+  query            搜尋字串（多個字詞視為 AND）
+
+Options:
+  --client ID      只搜尋特定 client
+  --type TYPE      只搜尋 transcript 或 result（命令與結果）
+  --since TIME     起始時間：30m、24h、7d 或 ISO 日期（2025-12-19T09:00）
+  --until TIME     結束時間（格式同 --since）
+  --limit N        最多顯示筆數（預設 20，最大 500）
+  --rank           依相關度排序（預設由新到舊）
+
+Description:
+  在 server 端全文索引中搜尋所有 client 的 agent transcripts 與命令結果，
+  不需要逐一下載內容。每筆結果顯示符合處的片段，符合的字詞以 ** 標示。
+
+  查詢語法（SQLite FTS5）：
+  - "access denied"      完整片語
+  - error AND disk       兩者皆有
+  - timeout OR refused   任一
+  - Get-Serv*            字首比對
+  無法解析的查詢會自動改為逐字搜尋。
+
+Examples:
+  pt1 search "access denied" --since 24h
+  pt1 search Get-Service --client my-example-pc --type result
+  pt1 search "out of memory" --rank --limit 50
+
+See also:
+  pt1 get-result <command_id>           查看完整結果
+  pt1 get-transcript <transcript_id>    查看完整 transcript
 """,
 }
 
@@ -357,6 +418,7 @@ class HelpCommand(Command):
         print("Debugging:")
         print("  list-transcripts  List agent execution transcripts")
         print("  get-transcript    Get transcript content")
+        print("  search            Search transcripts and command results")
         print("")
         print("Help:")
         print("  help [command]    Show detailed help for a command")
@@ -56,13 +56,15 @@ class ListFilesCommand(Command):
                 return 0
 
             # 顯示檔案資訊
-            print(f"{'FILENAME':<40} {'SIZE':<15} {'TYPE':<25}")
-            print("-" * 80)
+            print(f"{'FILENAME':<40} {'SIZE':<12} {'SHA256':<14} {'TYPE':<25}")
+            print("-" * 94)
 
             for file_info in files:
                 filename = file_info.get("filename", "N/A")
                 size = file_info.get("size", 0)
                 content_type = file_info.get("content_type", "unknown")
+                # 只顯示 digest 前 12 碼（完整值見 /list_files API）
+                digest = (file_info.get("sha256") or "-")[:12]
 
                 # 格式化檔案大小
                 if size < 1024:
@@ -77,7 +79,9 @@ class ListFilesCommand(Command):
                     filename if len(filename) <= 37 else filename[:34] + "..."
                 )
 
-                print(f"{display_name:<40} {size_str:<15} {content_type:<25}")
+                print(
+                    f"{display_name:<40} {size_str:<12} {digest:<14} {content_type:<25}"
+                )
 
             print("")
             print("To download a file:")
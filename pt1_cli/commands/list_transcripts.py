@@ -27,13 +27,28 @@ class ListTranscriptsCommand(Command):
         # 解析參數
         client_id = None
         limit = 50
+        cursor = None
+
+        args = []
+        i = 2
+        while i < len(sys.argv):
+            if sys.argv[i] == "--cursor" and i + 1 < len(sys.argv):
+                try:
+                    cursor = int(sys.argv[i + 1])
+                except ValueError:
+                    print("Error: cursor must be a number", file=sys.stderr)
+                    return 1
+                i += 2
+            else:
+                args.append(sys.argv[i])
+                i += 1
 
-        if len(sys.argv) >= 3:
-            client_id = sys.argv[2]
+        if len(args) >= 1:
+            client_id = args[0]
 
-        if len(sys.argv) >= 4:
+        if len(args) >= 2:
             try:
-                limit = int(sys.argv[3])
+                limit = int(args[1])
                 if limit < 1 or limit > 200:
                     print("Error: limit must be between 1 and 200", file=sys.stderr)
                     return 1
@@ -43,7 +58,9 @@ class ListTranscriptsCommand(Command):
 
         # 查詢 transcript 列表
         try:
-            data = client.list_transcripts(stable_id=client_id, limit=limit)
+            data = client.list_transcripts(
+                stable_id=client_id, limit=limit, cursor=cursor
+            )
             transcripts = data.get("transcripts", [])
             count = data.get("count", 0)
             filtered_by = data.get("filtered_by_client")
@@ -106,6 +123,13 @@ class ListTranscriptsCommand(Command):
                     f"{display_id:<50} {display_client:<20} {size_str:<12} {created_display:<20}"
                 )
 
+            next_cursor = data.get("next_cursor")
+            if next_cursor:
+                filter_args = f"{client_id} {limit} " if client_id else ""
+                print("")
+                print("More transcripts available:")
+                print(f"  pt1 list-transcripts {filter_args}--cursor {next_cursor}")
+
             print("")
             print("To view transcript content:")
             print(f"  pt1 get-transcript <transcript_id>")
@@ -0,0 +1,180 @@
+"""
+Search Command
+
+全文搜尋所有 agent transcript 與命令結果
+"""
+
+import sys
+import time
+from datetime import datetime
+from typing import Optional
+
+import requests
+from pt1_cli.core import Command, PT1Config, PT1Client
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_time(value: str) -> Optional[float]:
+    """解析 30m / 24h / 7d（相對現在）或 ISO 日期時間，返回 epoch 秒"""
+    unit = value[-1:].lower()
+    if unit in _DURATION_UNITS and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * _DURATION_UNITS[unit]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class SearchCommand(Command):
+    """全文搜尋 transcript 與命令結果"""
+
+    def execute(self) -> int:
+        """執行搜尋"""
+        config = PT1Config()
+
+        # 檢查設定是否完整
+        if not config.is_configured():
+            config.show_config_help()
+            return 1
+
+        # 建立 API client
+        client = PT1Client(config)
+
+        # 解析參數
+        terms = []
+        client_id = None
+        kind = None
+        since = None
+        until = None
+        limit = 20
+        order = "newest"
+        i = 2
+        while i < len(sys.argv):
+            arg = sys.argv[i]
+            has_value = i + 1 < len(sys.argv)
+            if arg == "--client" and has_value:
+                client_id = sys.argv[i + 1]
+                i += 2
+            elif arg == "--type" and has_value:
+                kind = sys.argv[i + 1]
+                if kind not in ("transcript", "result"):
+                    print("Error: type must be transcript or result", file=sys.stderr)
+                    return 1
+                i += 2
+            elif arg in ("--since", "--until") and has_value:
+                parsed = _parse_time(sys.argv[i + 1])
+                if parsed is None:
+                    print(
+                        f"Error: {arg} expects 30m, 24h, 7d or an ISO date",
+                        file=sys.stderr,
+                    )
+                    return 1
+                if arg == "--since":
+                    since = parsed
+                else:
+                    until = parsed
+                i += 2
+            elif arg == "--limit" and has_value:
+                try:
+                    limit = int(sys.argv[i + 1])
+                    if limit < 1 or limit > 500:
+                        raise ValueError
+                except ValueError:
+                    print("Error: limit must be between 1 and 500", file=sys.stderr)
+                    return 1
+                i += 2
+            elif arg == "--rank":
+                order = "rank"
+                i += 1
+            else:
+                terms.append(arg)
+                i += 1
+
+        # 檢查是否提供搜尋字串
+        if not terms:
+            print("Error: search query is required", file=sys.stderr)
+            print("", file=sys.stderr)
+            print(
+                f"Usage: {sys.argv[0]} search <query> [--client ID] [--type transcript|result]",
+                file=sys.stderr,
+            )
+            print(
+                "              [--since 24h] [--until 2025-12-31] [--limit N] [--rank]",
+                file=sys.stderr,
+            )
+            print("", file=sys.stderr)
+            print("Example:", file=sys.stderr)
+            print(
+                f'  {sys.argv[0]} search "access denied" --since 24h', file=sys.stderr
+            )
+            return 1
+
+        query = " ".join(terms)
+
+        # 搜尋
+        try:
+            data = client.search(
+                query,
+                client_id=client_id,
+                kind=kind,
+                since=since,
+                until=until,
+                limit=limit,
+                order=order,
+            )
+            results = data.get("results", [])
+
+            print(f"Search: {query}")
+            print("=" * 100)
+            print(f"Matches: {data.get('count', len(results))}")
+
+            if not results:
+                print("")
+                print("No matches found.")
+                return 0
+
+            for result in results:
+                created = datetime.fromtimestamp(result["created_at"]).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+                print("")
+                print(
+                    f"[{result['kind']}] {result['id']}  {result['client_id']}  {created}"
+                )
+                if result.get("title"):
+                    title = result["title"].splitlines()[0]
+                    print(f"  > {title[:96]}")
+                snippet = " ".join(result.get("snippet", "").split())
+                print(f"  {snippet}")
+
+            print("")
+            print("To view the full content:")
+            print("  pt1 get-result <command_id>")
+            print("  pt1 get-transcript <transcript_id>")
+
+            return 0
+
+        except requests.exceptions.ConnectionError:
+            print(
+                f"Error: Cannot connect to server at {config.server_url}",
+                file=sys.stderr,
+            )
+            print(
+                "Please check if the server is running and the URL is correct",
+                file=sys.stderr,
+            )
+            return 1
+        except requests.exceptions.Timeout:
+            print("Error: Request timed out", file=sys.stderr)
+            return 1
+        except requests.HTTPError as e:
+            try:
+                detail = e.response.json().get("detail", str(e))
+            except ValueError:
+                detail = str(e)
+            print(f"Error: {detail}", file=sys.stderr)
+            return 1
+        except Exception as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            return 1
@@ -9,6 +9,9 @@ import time
 import requests
 from pt1_cli.core import Command, PT1Config, PT1Client
 
+# /command_events 的 timeout 上限（server 以 le=3600 驗證）
+EVENT_STREAM_MAX_SECONDS = 3600
+
 
 class WaitCommand(Command):
     """等待命令執行完成"""
@@ -40,6 +43,10 @@ class WaitCommand(Command):
                 "  --max <seconds>       Maximum wait time (default: 30)",
                 file=sys.stderr,
             )
+            print(
+                "  --poll                Poll instead of streaming status updates",
+                file=sys.stderr,
+            )
             print("", file=sys.stderr)
             print("Example:", file=sys.stderr)
             print(
@@ -57,6 +64,7 @@ class WaitCommand(Command):
         # 解析選項
         interval = 0.5  # 預設 0.5 秒
         timeout = 30  # 預設 30 秒
+        force_poll = False
 
         i = 3
         while i < len(sys.argv):
@@ -86,138 +94,34 @@ class WaitCommand(Command):
                     print("Error: max must be a number", file=sys.stderr)
                     return 1
                 i += 2
+            elif sys.argv[i] == "--poll":
+                force_poll = True
+                i += 1
             else:
                 print(f"Error: Unknown option '{sys.argv[i]}'", file=sys.stderr)
                 return 1
 
-        # 開始輪詢
         start_time = time.time()
-        dots = 0
-        last_status_print = 0.0
 
         print(f"Waiting for command {command_id} to complete...")
-        print(f"(polling every {interval}s, timeout: {timeout}s)")
-        print("")
 
         try:
-            while True:
-                elapsed = time.time() - start_time
-
-                # 檢查是否超時
-                if elapsed > timeout:
-                    print("\n")
-                    print(f"Timeout after {timeout} seconds")
-                    print(f"Command may still be running. Either:")
-                    print(f"  - Check result: pt1 get-result {command_id}")
-                    print(f"  - Wait again:   pt1 wait {command_id} --max 60")
-                    return 0
-
-                # 查詢命令狀態（使用 PT1Client 的 API）
-                try:
-                    result = client.get_result(command_id)
-                except requests.HTTPError as e:
-                    response_status = e.response.status_code if e.response else 500
-                    response_text = e.response.text if e.response else str(e)
-
-                    if response_status == 401:
-                        print("\n", file=sys.stderr)
-                        print("Error: Authentication failed", file=sys.stderr)
-                        print(
-                            "Please check your PT1_SERVER_URL and PT1_API_TOKEN",
-                            file=sys.stderr,
-                        )
-                        return 1
-                    elif response_status == 404:
-                        print("\n", file=sys.stderr)
-                        print(
-                            f"Error: Command ID '{command_id}' not found",
-                            file=sys.stderr,
-                        )
-                        return 1
-                    else:
-                        print("\n", file=sys.stderr)
-                        print(
-                            f"Error: Server returned status {response_status}",
-                            file=sys.stderr,
-                        )
-                        print(f"Response: {response_text}", file=sys.stderr)
-                        return 1
-
-                # 檢查是否有錯誤
-                if "error" in result:
-                    print("\n", file=sys.stderr)
-                    print(f"Error: {result['error']}", file=sys.stderr)
-                    return 1
+            # 預設使用 server 推送的狀態更新，server 不支援時退回輪詢
+            if not force_poll:
+                print(f"(streaming status updates, timeout: {timeout}s)")
+                print("")
+                exit_code = self._wait_with_events(
+                    client, config, command_id, timeout, start_time
+                )
+                if exit_code is not None:
+                    return exit_code
+                print("\r(status streaming not available, falling back to polling)")
 
-                status = result.get("status", "unknown")
-
-                # 如果命令已完成，顯示結果
-                if status in ["completed", "failed", "error"]:
-                    print("\n")
-                    print("=" * 80)
-                    print(f"Command {status}!")
-                    print("=" * 80)
-                    print("")
-
-                    # 顯示命令資訊
-                    print(f"Command ID:    {result['command_id']}")
-                    print(f"Client ID:     {result['stable_id']}")
-                    print(f"Status:        {result['status']}")
-                    print(f"Command:       {result['command']}")
-                    print("")
-
-                    # 顯示執行時間資訊
-                    if result.get("finished_at"):
-                        duration = result["finished_at"] - result["created_at"]
-                        print(f"Duration:      {duration:.2f} seconds")
-                        print("")
-
-                    # 顯示結果類型
-                    result_type = result.get("result_type", "text")
-                    print(f"Result Type:   {result_type}")
-                    print("")
-
-                    # 顯示文字結果
-                    if result.get("result"):
-                        print("Output:")
-                        print("-" * 80)
-                        print(result["result"])
-                        print("-" * 80)
-                        print("")
-
-                    # 顯示檔案資訊
-                    if result.get("files"):
-                        files = result["files"]
-                        print(f"Files: ({len(files)} file(s))")
-                        print("-" * 80)
-                        for file_info in files:
-                            filename = file_info["filename"]
-                            size = file_info["size"]
-                            content_type = file_info.get("content_type", "unknown")
-                            print(f"  - {filename}")
-                            print(f"    Size: {size} bytes")
-                            print(f"    Type: {content_type}")
-                            print(
-                                f"    Download: {config.server_url}/download_file/{command_id}/{filename}"
-                            )
-                            print("")
-
-                    return 0 if status == "completed" else 1
-
-                # 命令還在執行，狀態顯示最多每秒一次
-                if elapsed - last_status_print >= 1:
-                    last_status_print = elapsed
-                    dots = (dots + 1) % 4
-                    progress = "." * dots + " " * (3 - dots)
-                    elapsed_str = f"{elapsed:.0f}s"
-                    print(
-                        f"\rStatus: {status:12} [{progress}] (elapsed: {elapsed_str})",
-                        end="",
-                        flush=True,
-                    )
-
-                # 等待下一次輪詢
-                time.sleep(interval)
+            print(f"(polling every {interval}s, timeout: {timeout}s)")
+            print("")
+            return self._wait_with_polling(
+                client, config, command_id, interval, timeout, start_time
+            )
 
         except requests.exceptions.ConnectionError:
             print("\n", file=sys.stderr)
@@ -244,3 +148,215 @@ class WaitCommand(Command):
             print("\n", file=sys.stderr)
             print(f"Error: {str(e)}", file=sys.stderr)
             return 1
+
+    def _wait_with_events(self, client, config, command_id, timeout, start_time):
+        """透過 /command_events 串流等待命令完成
+
+        每條串流最長 EVENT_STREAM_MAX_SECONDS（server 的上限），--max 更長時
+        在串流逾時後重新連線，直到本地期限用完
+
+        Returns:
+            exit code；server 不支援串流時返回 None
+        """
+        dots = 0
+        status = "unknown"
+
+        try:
+            while True:
+                remaining = timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                # keepalive 設為 1 秒，讓狀態列可以每秒更新
+                events = client.stream_command_events(
+                    [command_id],
+                    timeout=min(max(remaining, 1), EVENT_STREAM_MAX_SECONDS),
+                    keepalive=1,
+                )
+                stream_timed_out = False
+                for event, data in events:
+                    if event == "status":
+                        status = data.get("status", status)
+                    elif event == "done":
+                        # 只在完成時取一次完整結果
+                        result = client.get_result(command_id)
+                        if "error" in result:
+                            print("\n", file=sys.stderr)
+                            print(f"Error: {result['error']}", file=sys.stderr)
+                            return 1
+                        return self._print_result(config, command_id, result)
+                    elif event == "timeout":
+                        # server 由請求開始計時，可能比本地的期限早幾毫秒送出
+                        # timeout；這是正常的超時，不是串流中斷
+                        stream_timed_out = True
+                        break
+
+                    elapsed = time.time() - start_time
+                    dots = (dots + 1) % 4
+                    self._print_status(status, dots, elapsed)
+
+                if not stream_timed_out:
+                    if time.time() - start_time < timeout:
+                        # 串流提早結束（連線被中斷），改用輪詢
+                        return None
+                    break
+                if remaining <= EVENT_STREAM_MAX_SECONDS:
+                    # 本地期限已用完（不重連只剩幾毫秒的串流）
+                    break
+        except requests.HTTPError as e:
+            response_status = e.response.status_code if e.response is not None else 500
+            if response_status == 404 and "Command ID" in e.response.text:
+                print("\n", file=sys.stderr)
+                print(f"Error: Command ID {command_id} not found", file=sys.stderr)
+                return 1
+            # 其他 4xx（舊版 server 沒有 /command_events、參數上限不同等）
+            # 與 501：改用輪詢
+            if 400 <= response_status < 500 or response_status == 501:
+                return None
+            return self._print_http_error(command_id, e)
+        except (requests.exceptions.ChunkedEncodingError, ValueError):
+            # 串流中斷或格式錯誤（例如被 proxy 截斷），改用輪詢
+            return None
+
+        self._print_timeout(command_id, timeout)
+        return 0
+
+    def _wait_with_polling(
+        self, client, config, command_id, interval, timeout, start_time
+    ):
+        """輪詢 /get_result 等待命令完成"""
+        dots = 0
+        last_status_print = 0.0
+
+        while True:
+            elapsed = time.time() - start_time
+
+            # 檢查是否超時
+            if elapsed > timeout:
+                self._print_timeout(command_id, timeout)
+                return 0
+
+            # 查詢命令狀態（使用 PT1Client 的 API）
+            try:
+                result = client.get_result(command_id)
+            except requests.HTTPError as e:
+                return self._print_http_error(command_id, e)
+
+            # 檢查是否有錯誤
+            if "error" in result:
+                print("\n", file=sys.stderr)
+                print(f"Error: {result['error']}", file=sys.stderr)
+                return 1
+
+            status = result.get("status", "unknown")
+
+            # 如果命令已完成，顯示結果
+            if status in ["completed", "failed", "error"]:
+                return self._print_result(config, command_id, result)
+
+            # 命令還在執行，狀態顯示最多每秒一次
+            if elapsed - last_status_print >= 1:
+                last_status_print = elapsed
+                dots = (dots + 1) % 4
+                self._print_status(status, dots, elapsed)
+
+            # 等待下一次輪詢
+            time.sleep(interval)
+
+    def _print_status(self, status, dots, elapsed):
+        progress = "." * dots + " " * (3 - dots)
+        elapsed_str = f"{elapsed:.0f}s"
+        print(
+            f"\rStatus: {status:12} [{progress}] (elapsed: {elapsed_str})",
+            end="",
+            flush=True,
+        )
+
+    def _print_timeout(self, command_id, timeout):
+        print("\n")
+        print(f"Timeout after {timeout} seconds")
+        print(f"Command may still be running. Either:")
+        print(f"  - Check result: pt1 get-result {command_id}")
+        print(f"  - Wait again:   pt1 wait {command_id} --max 60")
+
+    def _print_http_error(self, command_id, e):
+        response_status = e.response.status_code if e.response is not None else 500
+        response_text = e.response.text if e.response is not None else str(e)
+
+        if response_status == 401:
+            print("\n", file=sys.stderr)
+            print("Error: Authentication failed", file=sys.stderr)
+            print(
+                "Please check your PT1_SERVER_URL and PT1_API_TOKEN",
+                file=sys.stderr,
+            )
+            return 1
+        elif response_status == 404:
+            print("\n", file=sys.stderr)
+            print(
+                f"Error: Command ID '{command_id}' not found",
+                file=sys.stderr,
+            )
+            return 1
+        else:
+            print("\n", file=sys.stderr)
+            print(
+                f"Error: Server returned status {response_status}",
+                file=sys.stderr,
+            )
+            print(f"Response: {response_text}", file=sys.stderr)
+            return 1
+
+    def _print_result(self, config, command_id, result):
+        """顯示已完成命令的結果，返回 exit code"""
+        status = result.get("status", "unknown")
+
+        print("\n")
+        print("=" * 80)
+        print(f"Command {status}!")
+        print("=" * 80)
+        print("")
+
+        # 顯示命令資訊
+        print(f"Command ID:    {result['command_id']}")
+        print(f"Client ID:     {result['stable_id']}")
+        print(f"Status:        {result['status']}")
+        print(f"Command:       {result['command']}")
+        print("")
+
+        # 顯示執行時間資訊
+        if result.get("finished_at"):
+            duration = result["finished_at"] - result["created_at"]
+            print(f"Duration:      {duration:.2f} seconds")
+            print("")
+
+        # 顯示結果類型
+        result_type = result.get("result_type", "text")
+        print(f"Result Type:   {result_type}")
+        print("")
+
+        # 顯示文字結果
+        if result.get("result"):
+            print("Output:")
+            print("-" * 80)
+            print(result["result"])
+            print("-" * 80)
+            print("")
+
+        # 顯示檔案資訊
+        if result.get("files"):
+            files = result["files"]
+            print(f"Files: ({len(files)} file(s))")
+            print("-" * 80)
+            for file_info in files:
+                filename = file_info["filename"]
+                size = file_info["size"]
+                content_type = file_info.get("content_type", "unknown")
+                print(f"  - {filename}")
+                print(f"    Size: {size} bytes")
+                print(f"    Type: {content_type}")
+                print(
+                    f"    Download: {config.server_url}/download_file/{command_id}/{filename}"
+                )
+                print("")
+
+        return 0 if status == "completed" else 1
@@ -281,6 +281,59 @@ class PT1Client:
         response.raise_for_status()
         return response.json()
 
+    def stream_command_events(
+        self, command_ids: list, timeout: float = 300, keepalive: float = 15
+    ):
+        """
+        訂閱命令狀態變化（Server-Sent Events）
+
+        Args:
+            command_ids: 命令 ID 列表
+            timeout: 串流最長時間（秒）
+            keepalive: server 無事件時送出 keepalive 的間隔（秒）
+
+        Yields:
+            tuple: (event, data)，event 為 "status"/"done"/"timeout"/"keepalive"
+
+        Raises:
+            requests.HTTPError: 當請求失敗時（例如 server 不支援此 endpoint）
+        """
+        import json
+
+        self._ensure_session_token()
+        headers = self.config.get_headers()
+        headers["Accept"] = "text/event-stream"
+        response = requests.get(
+            f"{self.base_url}/command_events",
+            headers=headers,
+            params={
+                "command_ids": ",".join(command_ids),
+                "timeout": timeout,
+                "keepalive": keepalive,
+            },
+            stream=True,
+            timeout=(10, keepalive * 2 + 10),
+        )
+        response.raise_for_status()
+
+        with response:
+            event = "message"
+            data_lines = []
+            for line in response.iter_lines(decode_unicode=True):
+                if line is None:
+                    continue
+                if line == "":
+                    if data_lines:
+                        yield event, json.loads("\n".join(data_lines))
+                    event = "message"
+                    data_lines = []
+                elif line.startswith(":"):
+                    yield "keepalive", None
+                elif line.startswith("event:"):
+                    event = line[len("event:") :].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[len("data:") :].strip())
+
     def list_clients(self) -> dict:
         """
         列出所有已註冊的客戶端
@@ -346,22 +399,37 @@ class PT1Client:
         response.raise_for_status()
         return response.json()
 
-    def download_file(self, command_id: str, filename: str) -> requests.Response:
+    def download_file(
+        self,
+        command_id: str,
+        filename: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        if_range: Optional[str] = None,
+    ) -> requests.Response:
         """
         下載命令產生的檔案
 
         Args:
             command_id: 命令 ID
             filename: 檔案名稱
+            start: 起始 byte（大於 0 或指定 end 時送出 Range header）
+            end: 結束 byte（包含在內，None 表示到檔案結尾）
+            if_range: 先前取得的 ETag；檔案已變更時 server 會回傳整個檔案（200）
 
         Returns:
-            requests.Response: 檔案內容（需要使用 stream=True）
+            requests.Response: 檔案內容（需要使用 stream=True）；
+            有送出 Range 時 status_code 為 206 或 200
 
         Raises:
-            requests.HTTPError: 當請求失敗時
+            requests.HTTPError: 當請求失敗時（範圍超出檔案大小時為 416）
         """
         self._ensure_session_token()
         headers = self.config.get_headers()
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+            if if_range:
+                headers["If-Range"] = if_range
         response = requests.get(
             f"{self.base_url}/download_file/{command_id}/{filename}",
             headers=headers,
@@ -371,7 +439,10 @@ class PT1Client:
         return response
 
     def list_transcripts(
-        self, stable_id: Optional[str] = None, limit: int = 50
+        self,
+        stable_id: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None,
     ) -> dict:
         """
         列出 agent 執行記錄
@@ -379,9 +450,10 @@ class PT1Client:
         Args:
             stable_id: 客戶端 ID（可選）
             limit: 限制結果數量
+            cursor: 上一頁返回的 next_cursor（可選）
 
         Returns:
-            dict: Transcript 列表
+            dict: Transcript 列表（含 next_cursor）
 
         Raises:
             requests.HTTPError: 當請求失敗時
@@ -390,7 +462,9 @@ class PT1Client:
         headers = self.config.get_headers()
         params = {"limit": limit}
         if stable_id:
-            params["stable_id"] = stable_id
+            params["client_id"] = stable_id
+        if cursor:
+            params["cursor"] = cursor
 
         response = requests.get(
             f"{self.base_url}/agent_transcripts", headers=headers, params=params
@@ -398,6 +472,52 @@ class PT1Client:
         response.raise_for_status()
         return response.json()
 
+    def search(
+        self,
+        query: str,
+        client_id: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50,
+        order: str = "newest",
+    ) -> dict:
+        """
+        全文搜尋 transcript 與命令結果
+
+        Args:
+            query: 搜尋字串（FTS5 語法）
+            client_id: 只搜尋此客戶端（可選）
+            kind: transcript 或 result（可選）
+            since: 起始時間 epoch 秒（可選）
+            until: 結束時間 epoch 秒（可選）
+            limit: 限制結果數量
+            order: newest 或 rank
+
+        Returns:
+            dict: 搜尋結果（results 含 snippet）
+
+        Raises:
+            requests.HTTPError: 當請求失敗時
+        """
+        self._ensure_session_token()
+        headers = self.config.get_headers()
+        params = {"q": query, "limit": limit, "order": order}
+        if client_id:
+            params["client_id"] = client_id
+        if kind:
+            params["kind"] = kind
+        if since is not None:
+            params["since"] = since
+        if until is not None:
+            params["until"] = until
+
+        response = requests.get(
+            f"{self.base_url}/search", headers=headers, params=params
+        )
+        response.raise_for_status()
+        return response.json()
+
     def get_transcript(self, transcript_id: str, format: str = "content") -> dict:
         """
         取得 transcript 內容
@@ -427,6 +547,47 @@ class PT1Client:
         else:
             return response.json()
 
+    def stream_transcript(
+        self,
+        transcript_id: str,
+        offset: Optional[int] = None,
+        length: Optional[int] = None,
+        tail: Optional[int] = None,
+    ) -> requests.Response:
+        """
+        以串流方式取得 transcript 內容
+
+        Args:
+            transcript_id: Transcript ID
+            offset: 起始 byte（可選）
+            length: 最多 bytes 數（可選）
+            tail: 只取最後 N 行（可選）
+
+        Returns:
+            requests.Response: stream=True 的回應；response.encoding 為內容的編碼
+
+        Raises:
+            requests.HTTPError: 當請求失敗時
+        """
+        self._ensure_session_token()
+        headers = self.config.get_headers()
+        params = {"format": "content"}
+        if offset is not None:
+            params["offset"] = offset
+        if length is not None:
+            params["length"] = length
+        if tail is not None:
+            params["tail"] = tail
+
+        response = requests.get(
+            f"{self.base_url}/agent_transcript/{transcript_id}",
+            headers=headers,
+            params=params,
+            stream=True,
+        )
+        response.raise_for_status()
+        return response
+
     def terminate_client(self, client_id: str) -> dict:
         """
         發送優雅終止信號給指定客戶端
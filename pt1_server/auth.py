@@ -1,10 +1,18 @@
+import asyncio
 import json
 import os
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Optional, Tuple, List, Dict
+from typing import NamedTuple, Optional, Tuple, List
 from fastapi import Header, HTTPException, status
+from starlette.concurrency import run_in_threadpool
 
+from pt1_server.services.config import env_int
+from pt1_server.services.metrics import get_metrics
+from pt1_server.services.session_store import SessionToken, get_session_store
+from pt1_server.services.shared_state import file_lock
 
 # =============================================================================
 # Datetime utilities - centralized datetime operations
@@ -83,71 +91,59 @@ def add_seconds(dt: datetime, seconds: int) -> datetime:
 # Path to tokens file (persistent source of truth)
 # Use current working directory for tokens.json (consistent with original behavior)
 TOKENS_FILE = os.path.join(os.getcwd(), "tokens.json")
-SESSION_TOKENS_FILE = os.path.join(os.getcwd(), ".session_tokens.json")
 
 # =============================================================================
-# In-memory state (single-worker mode only)
+# In-memory state
 # =============================================================================
 #
-# IMPORTANT: These global variables are NOT thread-safe across multiple workers.
+# Each worker process keeps its own snapshot of the active refresh token and
+# its own session token cache.
 #
-# Current design:
-# - Designed for single worker mode (default uvicorn deployment)
+# Single worker (default):
 # - Session tokens are stored in memory and persisted to disk
-# - Each worker process has its own memory space
-#
-# Multi-worker considerations:
-# - If running with --workers N, each worker has separate memory
-# - Session tokens created by worker 1 won't be visible to worker 2
-# - This can cause authentication failures
 #
-# Solutions for multi-worker (if needed in the future):
-# 1. Use Redis for shared session storage (recommended)
-# 2. Use database (PostgreSQL/SQLite) with proper locking
-# 3. Use sticky sessions in load balancer (nginx ip_hash)
-# 4. Deploy multiple single-worker instances behind load balancer
-#
-# For now, keep it simple - single worker is sufficient for PT-1's use case.
+# Multiple workers (PT1_WORKERS > 1, PT1_STATE_BACKEND=shared):
+# - Session tokens are written to the shared state store; a token created by
+#   worker 1 is loaded by worker 2 the first time it is presented
+# - tokens.json read-modify-write is serialized with a file lock
+#   (tokens.json.lock), so only one worker rotates an expiring token and the
+#   others adopt it when they notice tokens.json has changed
 #
 # =============================================================================
 
-# Session token storage (in-memory, loaded from file on startup)
-_session_tokens: Dict[str, Dict] = (
-    {}
-)  # session_token -> {refresh_token, expires_at, created_at}
-_session_tokens_loaded = False
+# Session tokens live in SessionTokenStore (services/session_store.py):
+# in-memory dict + expiry heap, persisted to .session_tokens.jsonl in the background
+# (or to the shared state store in multi-worker mode)
+
+
+class ActiveToken(NamedTuple):
+    """Immutable refresh token snapshot, replaced as a whole on rotation."""
+
+    token: str
+    expires_at: datetime
+    name: str
+    description: str
+    previous_token: Optional[str] = None
+    previous_expires_at: Optional[datetime] = None
+    # Rotation period of the active entry (bounds how early it may be rotated)
+    rotation_seconds: Optional[int] = None
 
-# In-memory state
-_active_token: Optional[str] = None
-_active_expiry: Optional[datetime] = None
-_active_name: str = "rotating-token"
-_active_description: str = "Auto-rotated token (persistent)"
+
+# Published by _rotate_active_token; readers never take a lock
+_active: Optional[ActiveToken] = None
+_rotation_lock = threading.Lock()
+# tokens.json mtime when _active was published (detects rotation by another worker)
+_tokens_mtime_ns: Optional[int] = None
 
 
 # Session token duration (default 1 hour)
 def _session_token_duration_seconds() -> int:
-    default_seconds = 3600  # 1 hour
-    value = os.getenv("PT1_SESSION_TOKEN_DURATION_SECONDS")
-    if not value:
-        return default_seconds
-    try:
-        parsed = int(value)
-        return parsed if parsed > 0 else default_seconds
-    except ValueError:
-        return default_seconds
+    return env_int("PT1_SESSION_TOKEN_DURATION_SECONDS", 3600)  # 1 hour
 
 
 # Default rotation interval (seconds) if not specified on token
 def _default_rotation_seconds() -> int:
-    default_seconds = 604800  # 7 days
-    value = os.getenv("PT1_TOKEN_ROTATION_SECONDS")
-    if not value:
-        return default_seconds
-    try:
-        parsed = int(value)
-        return parsed if parsed > 0 else default_seconds
-    except ValueError:
-        return default_seconds
+    return env_int("PT1_TOKEN_ROTATION_SECONDS", 604800)  # 7 days
 
 
 def is_valid_uuid(token: str) -> bool:
@@ -173,77 +169,19 @@ def _load_tokens_file() -> dict:
         return {"tokens": []}
 
 
-def _persist_tokens(data: dict):
-    """Persist tokens.json (overwrites file)."""
-    with open(TOKENS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-
-def _load_session_tokens():
-    """Load session tokens from file on startup."""
-    global _session_tokens, _session_tokens_loaded
-
-    if _session_tokens_loaded:
-        return
-
-    if not os.path.exists(SESSION_TOKENS_FILE):
-        _session_tokens_loaded = True
-        return
-
+def _tokens_file_mtime_ns() -> Optional[int]:
     try:
-        with open(SESSION_TOKENS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        now = get_current_time()
-        loaded_count = 0
-        expired_count = 0
-
-        for session_token, token_info in data.items():
-            try:
-                expires_at = parse_datetime_string(token_info["expires_at"])
-                created_at = parse_datetime_string(token_info["created_at"])
-
-                # Skip expired tokens
-                if expires_at <= now:
-                    expired_count += 1
-                    continue
-
-                _session_tokens[session_token] = {
-                    "refresh_token": token_info["refresh_token"],
-                    "expires_at": expires_at,
-                    "created_at": created_at,
-                }
-                loaded_count += 1
-
-            except (KeyError, ValueError) as e:
-                print(f"[Auth] Warning: Skipping invalid session token entry: {e}")
-                continue
-
-        print(
-            f"[Auth] Loaded {loaded_count} session token(s) from disk (skipped {expired_count} expired)"
-        )
-        _session_tokens_loaded = True
-
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"[Auth] Warning: Failed to load session tokens: {e}")
-        _session_tokens_loaded = True
-
+        return os.stat(TOKENS_FILE).st_mtime_ns
+    except OSError:
+        return None
 
-def _persist_session_tokens():
-    """Persist session tokens to file."""
-    data = {}
-    for session_token, token_info in _session_tokens.items():
-        data[session_token] = {
-            "refresh_token": token_info["refresh_token"],
-            "expires_at": format_datetime_string(token_info["expires_at"]),
-            "created_at": format_datetime_string(token_info["created_at"]),
-        }
 
-    try:
-        with open(SESSION_TOKENS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-    except IOError as e:
-        print(f"[Auth] Warning: Failed to persist session tokens: {e}")
+def _persist_tokens(data: dict):
+    """Persist tokens.json (temp file + atomic rename)."""
+    tmp_path = TOKENS_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, TOKENS_FILE)
 
 
 def _parse_token_entry(
@@ -278,14 +216,30 @@ def _parse_token_entry(
     return token, name, description, rotation_seconds, expires_at
 
 
+def _entry_lead_seconds(lead_seconds: int, rotation_seconds: int) -> int:
+    """
+    Rotation lead for one entry: at most 1/10 of its own rotation period, so a
+    freshly minted token is never already due (no rotate-every-second loop for
+    entries whose period is shorter than the global lead).
+    """
+    return max(0, min(lead_seconds, rotation_seconds // 10))
+
+
 def _select_active_token(
     tokens_data: List[dict],
-) -> Tuple[str, str, str, datetime, List[dict]]:
+    lead_seconds: int = 0,
+) -> Tuple[str, str, str, datetime, int, List[dict]]:
     """
     Select an active token from tokens.json with rotation support.
 
+    Args:
+        tokens_data: Entries from tokens.json
+        lead_seconds: Rotate entries expiring within this many seconds, capped
+            per entry by _entry_lead_seconds()
+
     Returns:
-        tuple: (active_token, name, description, expiry, updated_tokens_data)
+        tuple: (active_token, name, description, expiry, rotation_seconds,
+                updated_tokens_data)
     """
     now = get_current_time()
     default_rotation = _default_rotation_seconds()
@@ -299,8 +253,9 @@ def _select_active_token(
 
         token, name, description, rotation_seconds, expires_at = parsed
         rotation = rotation_seconds or default_rotation
+        rotate_before = add_seconds(now, _entry_lead_seconds(lead_seconds, rotation))
 
-        if expires_at and expires_at > now:
+        if expires_at and expires_at > rotate_before:
             # Not expired; keep as-is
             updated_entries.append(
                 {
@@ -312,7 +267,7 @@ def _select_active_token(
                 }
             )
             if not active_candidate:
-                active_candidate = (token, name, description, expires_at)
+                active_candidate = (token, name, description, expires_at, rotation)
             continue
 
         # Expired or no expiry; rotate if rotation is defined
@@ -328,7 +283,7 @@ def _select_active_token(
             }
         )
         if not active_candidate:
-            active_candidate = (new_token, name, description, new_expiry)
+            active_candidate = (new_token, name, description, new_expiry, rotation)
 
     if not active_candidate:
         # No valid tokens; generate a default one
@@ -347,55 +302,143 @@ def _select_active_token(
             generated["name"],
             generated["description"],
             new_expiry,
+            default_rotation,
         )
 
-    return (
-        active_candidate[0],
-        active_candidate[1],
-        active_candidate[2],
-        active_candidate[3],
-        updated_entries,
-    )
+    return (*active_candidate, updated_entries)
 
 
-def get_active_token_with_metadata() -> Tuple[str, datetime, dict]:
-    """Get active token and metadata; rotates/persists if needed."""
-    global _active_token, _active_expiry, _active_name, _active_description
+def _token_rotation_lead_seconds() -> int:
+    """Rotate this long before expiry (at most 1/10 of the rotation interval)."""
+    lead = env_int("PT1_TOKEN_ROTATION_LEAD_SECONDS", 300, minimum=0)
+    return min(lead, _default_rotation_seconds() // 10)
 
-    now = get_current_time()
-    if _active_token and _active_expiry and _active_expiry > now:
-        return (
-            _active_token,
-            _active_expiry,
-            {"name": _active_name, "description": _active_description},
-        )
 
-    data = _load_tokens_file()
-    tokens_data = data.get("tokens", [])
+def _rotate_active_token(lead_seconds: int = 0, reload: bool = False) -> ActiveToken:
+    """
+    Load tokens.json, rotate entries expiring within lead_seconds, persist and
+    publish a new snapshot.
 
-    active_token, name, description, expiry, updated_entries = _select_active_token(
-        tokens_data
-    )
-    data["tokens"] = updated_entries
-    _persist_tokens(data)
+    Single-flight: concurrent callers wait for the rotation in progress and
+    return its snapshot instead of rotating again. reload=True re-reads
+    tokens.json even if the current snapshot is still valid (another worker
+    rotated it). The file lock makes the read-modify-write atomic across workers.
+    """
+    global _active, _tokens_mtime_ns
 
-    _active_token = active_token
-    _active_expiry = expiry
-    _active_name = name
-    _active_description = description
+    with _rotation_lock, file_lock(TOKENS_FILE):
+        now = get_current_time()
+        current = _active
+        if current and not reload:
+            current_lead = _entry_lead_seconds(
+                lead_seconds, current.rotation_seconds or _default_rotation_seconds()
+            )
+            if current.expires_at > add_seconds(now, current_lead):
+                return current
+
+        data = _load_tokens_file()
+        (
+            active_token,
+            name,
+            description,
+            expiry,
+            rotation_seconds,
+            updated_entries,
+        ) = _select_active_token(data.get("tokens", []), lead_seconds)
+        # Only write when something changed, so workers do not keep
+        # invalidating each other's snapshot
+        if updated_entries != data.get("tokens"):
+            data["tokens"] = updated_entries
+            _persist_tokens(data)
+        _tokens_mtime_ns = _tokens_file_mtime_ns()
+
+        # Rotated ahead of expiry: the old token stays valid until its expiry
+        previous_token = previous_expires_at = None
+        if current and current.token != active_token and current.expires_at > now:
+            previous_token, previous_expires_at = current.token, current.expires_at
+
+        _active = ActiveToken(
+            active_token,
+            expiry,
+            name,
+            description,
+            previous_token,
+            previous_expires_at,
+            rotation_seconds,
+        )
 
     expiry_str = format_datetime_string(expiry) if expiry else "unknown"
     print(
-        f"[Auth] Active API token: {_active_token} (expires at UTC {expiry_str}, rotation every {_default_rotation_seconds()}s)"
+        f"[Auth] Active API token: {active_token} (expires at UTC {expiry_str}, rotation every {_default_rotation_seconds()}s)"
     )
+    return _active
+
+
+def _current_token() -> ActiveToken:
+    """Published token snapshot; rotates only if the background rotator has not."""
+    snapshot = _active
+    if snapshot is None or snapshot.expires_at <= get_current_time():
+        # First call, or the rotator is not running (e.g. no lifespan)
+        snapshot = _rotate_active_token()
+    return snapshot
 
+
+def get_active_token_with_metadata() -> Tuple[str, datetime, dict]:
+    """Get active token and metadata (reads the published snapshot)."""
+    snapshot = _current_token()
+    return (
+        snapshot.token,
+        snapshot.expires_at,
+        {"name": snapshot.name, "description": snapshot.description},
+    )
+
+
+def _snapshot_accepts(snapshot: ActiveToken, token: str) -> bool:
+    """Active token, or the previous one until its original expiry."""
+    if token == snapshot.token:
+        return True
     return (
-        _active_token,
-        _active_expiry,
-        {"name": _active_name, "description": _active_description},
+        snapshot.previous_token is not None
+        and token == snapshot.previous_token
+        and snapshot.previous_expires_at > get_current_time()
     )
 
 
+def _tokens_file_changed() -> bool:
+    """Another worker (or an operator) rotated tokens.json since the last load."""
+    return _tokens_file_mtime_ns() != _tokens_mtime_ns
+
+
+def is_valid_refresh_token(token: str, reload: bool = True) -> bool:
+    """
+    Active token, or the previous one until its original expiry.
+
+    reload=True re-reads tokens.json when it changed on disk (blocking file
+    lock and IO); async callers pass reload=False and retry in the threadpool.
+    """
+    if _snapshot_accepts(_current_token(), token):
+        return True
+    if reload and _tokens_file_changed():
+        return _snapshot_accepts(_rotate_active_token(reload=True), token)
+    return False
+
+
+async def run_token_rotator():
+    """Background task: rotate the refresh token ahead of its expiry."""
+    while True:
+        lead_seconds = _token_rotation_lead_seconds()
+        snapshot = _current_token()
+        entry_lead = _entry_lead_seconds(
+            lead_seconds, snapshot.rotation_seconds or _default_rotation_seconds()
+        )
+        remaining = (snapshot.expires_at - get_current_time()).total_seconds()
+        await asyncio.sleep(max(1.0, remaining - entry_lead))
+        try:
+            await run_in_threadpool(_rotate_active_token, lead_seconds)
+        except Exception as e:
+            print(f"[Auth] Token rotation error: {e}")
+
+
 def get_token_info(token: str) -> dict:
     """
     Retrieve token metadata for auth verification endpoint.
@@ -422,44 +465,6 @@ def get_token_expiry() -> Optional[datetime]:
     return expiry
 
 
-def get_active_token_with_metadata() -> Tuple[str, datetime, dict]:
-    """Get active token and metadata; rotates/persists if needed."""
-    global _active_token, _active_expiry, _active_name, _active_description
-
-    now = get_current_time()
-    if _active_token and _active_expiry and _active_expiry > now:
-        return (
-            _active_token,
-            _active_expiry,
-            {"name": _active_name, "description": _active_description},
-        )
-
-    data = _load_tokens_file()
-    tokens_data = data.get("tokens", [])
-
-    active_token, name, description, expiry, updated_entries = _select_active_token(
-        tokens_data
-    )
-    data["tokens"] = updated_entries
-    _persist_tokens(data)
-
-    _active_token = active_token
-    _active_expiry = expiry
-    _active_name = name
-    _active_description = description
-
-    expiry_str = format_datetime_string(expiry) if expiry else "unknown"
-    print(
-        f"[Auth] Active API token: {_active_token} (expires at UTC {expiry_str}, rotation every {_default_rotation_seconds()}s)"
-    )
-
-    return (
-        _active_token,
-        _active_expiry,
-        {"name": _active_name, "description": _active_description},
-    )
-
-
 def create_session_token(refresh_token: str) -> Tuple[str, datetime]:
     """
     Create a new session token from a refresh token.
@@ -470,12 +475,8 @@ def create_session_token(refresh_token: str) -> Tuple[str, datetime]:
     Returns:
         Tuple of (session_token, expires_at)
     """
-    # Load existing session tokens on first use
-    _load_session_tokens()
-
     # Verify refresh token is valid
-    active_token, _, _ = get_active_token_with_metadata()
-    if refresh_token != active_token:
+    if not is_valid_refresh_token(refresh_token):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token",
@@ -486,15 +487,10 @@ def create_session_token(refresh_token: str) -> Tuple[str, datetime]:
     now = get_current_time()
     expires_at = add_seconds(now, _session_token_duration_seconds())
 
-    # Store session token in memory
-    _session_tokens[session_token] = {
-        "refresh_token": refresh_token,
-        "expires_at": expires_at,
-        "created_at": now,
-    }
-
-    # Persist to disk
-    _persist_session_tokens()
+    # Store in memory; the store appends it to the journal in the background
+    get_session_store().create(
+        session_token, SessionToken(refresh_token, expires_at, now)
+    )
 
     print(
         f"[Auth] Created session token {session_token[:8]}... (expires at {format_datetime_string(expires_at)})"
@@ -513,39 +509,15 @@ def verify_session_token(session_token: str) -> bool:
     Returns:
         True if valid, False otherwise
     """
-    # Load existing session tokens on first use
-    _load_session_tokens()
-
-    if session_token not in _session_tokens:
-        return False
-
-    token_data = _session_tokens[session_token]
-    now = get_current_time()
-
-    # Check if expired
-    if token_data["expires_at"] <= now:
-        # Clean up expired token
-        del _session_tokens[session_token]
-        _persist_session_tokens()
-        return False
-
-    return True
+    # Expired tokens are removed by the store's background sweep
+    return get_session_store().is_valid(session_token, get_current_time())
 
 
 def cleanup_expired_sessions():
-    """Remove expired session tokens from memory and disk."""
-    _load_session_tokens()
-
-    now = get_current_time()
-    expired = [
-        token for token, data in _session_tokens.items() if data["expires_at"] <= now
-    ]
-    for token in expired:
-        del _session_tokens[token]
-
-    if expired:
-        print(f"[Auth] Cleaned up {len(expired)} expired session token(s)")
-        _persist_session_tokens()
+    """Remove expired session tokens from memory."""
+    removed = get_session_store().sweep(get_current_time())
+    if removed:
+        print(f"[Auth] Cleaned up {removed} expired session token(s)")
 
 
 async def verify_refresh_token(
@@ -573,8 +545,11 @@ async def verify_refresh_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    active_token, _, _ = get_active_token_with_metadata()
-    if token != active_token:
+    valid = is_valid_refresh_token(token, reload=False)
+    if not valid and _tokens_file_changed():
+        # Reloading tokens.json takes a file lock and may rewrite it
+        valid = await run_in_threadpool(is_valid_refresh_token, token)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token",
@@ -605,14 +580,24 @@ async def verify_token(
         token = authorization[7:]  # Remove "Bearer " prefix
 
     if not token:
+        get_metrics().observe_token_check("missing")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session token not provided",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Verify session token
-    if not verify_session_token(token):
+    # Verify session token; a shared-store lookup (session created by another
+    # worker) is blocking SQLite IO, so it runs in the threadpool
+    start = time.perf_counter()
+    if get_session_store().needs_lookup(token):
+        valid = await run_in_threadpool(verify_session_token, token)
+    else:
+        valid = verify_session_token(token)
+    get_metrics().observe_token_check(
+        "valid" if valid else "invalid", time.perf_counter() - start
+    )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Session token invalid or expired, please restart client to obtain new token",
@@ -1,6 +1,8 @@
+import asyncio
 import os
 import logging
 from contextlib import asynccontextmanager
+from datetime import datetime
 from fastapi import FastAPI
 from pt1_server.routers import (
     root,
@@ -9,16 +11,37 @@ from pt1_server.routers import (
     client_registry,
     transcripts,
     auth,
+    uploads,
+    artifacts,
+    search,
+    metrics,
 )
 from pt1_server.auth import (
     get_active_token_with_metadata,
     get_token_expiry,
     _default_rotation_seconds,
+    run_token_rotator,
 )
+from pt1_server.services.audit_writer import get_audit_writer
 from pt1_server.services.client_history import client_history_middleware_factory
+from pt1_server.services.metrics import MetricsMiddleware
+from pt1_server.services.providers import get_command_manager
+from pt1_server.services.shared_state import LeaderLock
+from pt1_server.services.storage import get_state_store, preload_limit
+from pt1_server.services.resumable_uploads import get_resumable_upload_manager
+from pt1_server.services.artifact_store import get_artifact_store
+from pt1_server.services.search_index import get_search_index
+from pt1_server.services.retention import get_retention_sweeper
+from pt1_server.services.session_store import get_session_store
+from pt1_server.services.transcript_manager import get_transcript_manager
+from pt1_server.routers.client_registry import load_client_registry
 
 logger = logging.getLogger("uvicorn")
 
+# 多 worker 時只有持有此 lock 的 worker 執行 retention 等背景整理工作
+# （lock 持有到 process 結束，leader 結束後由新啟動的 worker 取得）
+_leader_lock = LeaderLock(os.path.join(os.getcwd(), "pt1_leader.lock"))
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -37,12 +60,107 @@ async def lifespan(app: FastAPI):
     else:
         rotation_hint = f"{rotation_seconds} seconds"
     logger.info(f"  Rotation interval (default): {rotation_hint}")
+    logger.info(f"  Sessions    : {len(get_session_store())} active")
+
+    # 載入持久化的狀態（PT1_STATE_BACKEND=memory 時為空）
+    cmd_manager = get_command_manager()
+    client_count = load_client_registry()
+    state_store = get_state_store()
+    logger.info(
+        f"  State store : {type(state_store).__name__} "
+        f"({cmd_manager.command_count()} commands, {client_count} clients)"
+    )
+
+    # 多 worker 時只有取得 leader lock 的 worker 執行整理與清除工作
+    leader = not state_store.shared or _leader_lock.acquire()
+    if state_store.shared:
+        role = "leader" if leader else "follower"
+        logger.info(f"  Worker      : pid {os.getpid()} ({role})")
+
+    # 由 manifest 重建 blob reference count，清除中斷上傳留下的孤立 blob
+    artifact_store = get_artifact_store()
+    blob_count = artifact_store.rebuild_refcounts()
+    if leader:
+        reclaimed = artifact_store.collect_garbage()
+        logger.info(
+            f"  Artifacts   : {blob_count} blobs ({reclaimed} orphaned bytes reclaimed)"
+        )
+
+    # 第一次啟用全文搜尋時，把現有的 transcript 與已完成命令排入索引
+    search_index = get_search_index()
+    if leader and search_index.enabled and search_index.is_empty():
+        backfilled = _backfill_search_index(cmd_manager)
+        logger.info(f"  Search      : indexing {backfilled} existing documents")
+    retention_sweeper = get_retention_sweeper()
+    if leader:
+        logger.info(f"  Retention   : {retention_sweeper.describe()}")
     logger.info("=" * 80)
 
+    background = []
+    if leader:
+        # 背景清除過期的 partial upload
+        background.append(
+            asyncio.create_task(get_resumable_upload_manager().run_sweeper())
+        )
+        # 背景依保留期限與容量上限清除舊的 transcripts、結果檔案與命令
+        background.append(asyncio.create_task(retention_sweeper.run()))
+        # 背景把 lease 過期（client 未回報結果也沒有 heartbeat）的命令放回佇列
+        background.append(asyncio.create_task(cmd_manager.run_lease_sweeper()))
+    # 背景在 refresh token 到期前輪替，請求路徑只讀取記憶體中的 token
+    # （每個 worker 都有自己的快照；tokens.json 的寫入以 file lock 保護）
+    background.append(asyncio.create_task(run_token_rotator()))
+
     yield
 
-    # Shutdown (if needed in the future)
-    # NOTE: If adding cleanup logic here, wrap in try-except to handle errors gracefully
+    for task in background:
+        task.cancel()
+
+    # Shutdown: flush queued audit events and pending state writes
+    try:
+        get_audit_writer().close()
+    except Exception as e:
+        logger.warning(f"Failed to close audit writer: {e}")
+    try:
+        get_session_store().close()
+    except Exception as e:
+        logger.warning(f"Failed to close session store: {e}")
+    try:
+        get_state_store().close()
+    except Exception as e:
+        logger.warning(f"Failed to close state store: {e}")
+    try:
+        get_search_index().close()
+    except Exception as e:
+        logger.warning(f"Failed to close search index: {e}")
+
+
+def _backfill_search_index(cmd_manager) -> int:
+    """把現有的 transcript 與記憶體中已完成的命令排入全文搜尋索引"""
+    search_index = get_search_index()
+    transcript_mgr = get_transcript_manager()
+    count = 0
+
+    entries, _ = transcript_mgr.index.list(limit=len(transcript_mgr.index))
+    for entry in entries:
+        transcript_id = entry["transcript_id"]
+        search_index.add_transcript(
+            transcript_id,
+            entry["client_id"],
+            datetime.fromisoformat(entry["created_time"]).timestamp(),
+            lambda max_chars, tid=transcript_id: transcript_mgr.read_transcript_text(
+                tid, max_chars
+            ),
+        )
+        count += 1
+
+    # shared 模式不在記憶體保存命令，由 store 讀取最近的已完成命令
+    commands, _ = cmd_manager.list_commands(limit=preload_limit())
+    for command_info in commands:
+        if command_info.status not in cmd_manager.ACTIVE_STATUSES:
+            search_index.add_result(command_info)
+            count += 1
+
+    return count
 
 
 app = FastAPI(lifespan=lifespan)
@@ -54,15 +172,36 @@ app.include_router(commands.router)
 app.include_router(client_registry.router)
 app.include_router(transcripts.router)
 app.include_router(auth.router)
+app.include_router(uploads.router)
+app.include_router(artifacts.router)
+app.include_router(search.router)
+app.include_router(metrics.router)
 
 app.middleware("http")(client_history_middleware_factory())
+# 最後加入的 middleware 在最外層，延遲包含其他 middleware
+app.add_middleware(MetricsMiddleware)
 
 
 def run_server():
-    """Entry point for pt1-server command"""
+    """Entry point for pt1-server command
+
+    PT1_WORKERS > 1 runs that many worker processes sharing state through
+    PT1_STATE_BACKEND=shared (set automatically).
+    """
     import uvicorn
-    import os
 
     host = os.getenv("PT1_HOST", "0.0.0.0")
     port = int(os.getenv("PT1_PORT", "5566"))
-    uvicorn.run(app, host=host, port=port)
+    workers = int(os.getenv("PT1_WORKERS", "1") or 1)
+    if workers > 1:
+        backend = os.getenv("PT1_STATE_BACKEND", "memory").lower()
+        if backend != "shared":
+            print(
+                f"[Server] PT1_WORKERS={workers}: using PT1_STATE_BACKEND=shared "
+                f"instead of {backend}"
+            )
+        # worker process 繼承環境變數，各自 import app
+        os.environ["PT1_STATE_BACKEND"] = "shared"
+        uvicorn.run("pt1_server.main:app", host=host, port=port, workers=workers)
+    else:
+        uvicorn.run(app, host=host, port=port)
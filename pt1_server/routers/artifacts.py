@@ -0,0 +1,96 @@
+"""
+Artifact store endpoints
+
+POST /artifacts/have                 詢問 server 已保存哪些 SHA-256
+POST /artifacts/{command_id}/link    把已存在的 blob 加入 command 的檔案列表（不需上傳內容）
+"""
+
+import os
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from pt1_server.auth import verify_token
+from pt1_server.services.artifact_store import ArtifactStore, get_artifact_store
+from pt1_server.services.command_manager import CommandManager, FileInfo
+from pt1_server.services.providers import call_store, get_command_manager
+
+router = APIRouter()
+
+# 單次 precheck 最多查詢的 hash 數量
+MAX_HASHES_PER_REQUEST = 1000
+
+
+class HaveRequest(BaseModel):
+    hashes: List[str]
+
+
+class LinkRequest(BaseModel):
+    filename: str
+    sha256: str
+    content_type: Optional[str] = None
+
+
+@router.post("/artifacts/have")
+async def have_artifacts(
+    body: HaveRequest,
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
+    token: str = Depends(verify_token),
+):
+    """Return which of the given SHA-256 digests the server already stores"""
+    if len(body.hashes) > MAX_HASHES_PER_REQUEST:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_HASHES_PER_REQUEST} hashes per request",
+        )
+    hashes = [h.lower() for h in body.hashes]
+    missing = artifact_store.missing(hashes)
+    missing_set = set(missing)
+    return {
+        "have": [h for h in hashes if h not in missing_set],
+        "missing": missing,
+    }
+
+
+@router.post("/artifacts/{command_id}/link")
+async def link_artifact(
+    command_id: str,
+    body: LinkRequest,
+    cmd_manager: CommandManager = Depends(get_command_manager),
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
+    token: str = Depends(verify_token),
+):
+    """Attach an already stored blob to a command without re-sending its bytes"""
+    command_info = await call_store(cmd_manager, cmd_manager.get_command, command_id)
+    if not command_info:
+        raise HTTPException(
+            status_code=404, detail=f"Command ID {command_id} not found"
+        )
+
+    sha256 = body.sha256.lower()
+    safe_filename = os.path.basename(body.filename)
+    content_type = body.content_type or "application/octet-stream"
+    size = await run_in_threadpool(
+        artifact_store.link, command_id, safe_filename, sha256, content_type
+    )
+    if size is None:
+        raise HTTPException(status_code=404, detail=f"Blob {sha256} not found")
+
+    file_info = FileInfo(
+        filename=safe_filename,
+        size=size,
+        content_type=content_type,
+        upload_timestamp=time.time(),
+        sha256=sha256,
+    )
+    await call_store(cmd_manager, cmd_manager.attach_files, command_info, [file_info])
+
+    print(f"Linked existing blob {sha256[:12]} as {safe_filename} for {command_id}")
+    return {
+        "status": "File linked successfully",
+        "command_id": command_id,
+        "uploaded_files": [file_info],
+    }
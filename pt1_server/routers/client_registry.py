@@ -1,7 +1,10 @@
+from collections.abc import Mapping
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Dict, Iterator, Optional
 from pt1_server.auth import verify_token
+from pt1_server.services.storage import get_state_store
+import os
 import time
 import hashlib
 
@@ -22,12 +25,78 @@ class ClientInfo(BaseModel):
     terminated: bool = False  # 是否已被明確終止
 
 
-# 客戶端註冊表
-client_registry: Dict[str, ClientInfo] = {}
+class SharedClientRegistry(Mapping):
+    """多 worker 模式的註冊表：每次讀寫都經過共用的 state store
+
+    取出的 ClientInfo 是 store 中資料的複本，修改後需呼叫 save_client(client)。
+    client 不會從註冊表移除（與記憶體模式相同），因此只提供唯讀的 Mapping 介面
+    加上 __setitem__ 寫入。
+    """
+
+    @property
+    def store(self):
+        return get_state_store()
+
+    def __getitem__(self, stable_id: str) -> ClientInfo:
+        data = self.store.get_client(stable_id)
+        if data is None:
+            raise KeyError(stable_id)
+        return ClientInfo(**data)
+
+    def __setitem__(self, stable_id: str, client: ClientInfo):
+        self.store.save_client(client)
+
+    def __contains__(self, stable_id) -> bool:
+        return self.store.get_client(stable_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([data["stable_id"] for data in self.store.load_clients()])
+
+    def __len__(self) -> int:
+        return self.store.count_clients()
+
+    def values(self):
+        return [ClientInfo(**data) for data in self.store.load_clients()]
+
+    def items(self):
+        return [(client.stable_id, client) for client in self.values()]
+
+
+def _create_client_registry():
+    # 只依環境變數判斷，不在 import 時建立 state store
+    if os.getenv("PT1_STATE_BACKEND", "memory").lower() == "shared":
+        return SharedClientRegistry()
+    return {}
+
+
+# 客戶端註冊表（PT1_STATE_BACKEND=shared 時由所有 worker 共用）
+client_registry: Dict[str, ClientInfo] = _create_client_registry()
 OFFLINE_TIMEOUT = 300  # 5 分鐘無回應視為離線（允許長時間命令執行 + 心跳）
 COMMAND_TIMEOUT = 120  # 2 分鐘無新命令回應視為命令超時
 
 
+def load_client_registry():
+    """從 state store 載入客戶端註冊表（啟動時呼叫）"""
+    if isinstance(client_registry, SharedClientRegistry):
+        return len(client_registry)
+    for data in get_state_store().load_clients():
+        client_registry.setdefault(data["stable_id"], ClientInfo(**data))
+    return len(client_registry)
+
+
+def save_client(client: ClientInfo):
+    """把修改後的客戶端資料寫入 state store"""
+    get_state_store().save_client(client)
+
+
+def touch_client(stable_id: str):
+    """只更新 last_seen（heartbeat 未提供環境資訊時使用）"""
+    client = client_registry.get(stable_id)
+    if client is not None:
+        client.last_seen = time.time()
+        save_client(client)
+
+
 def generate_stable_id(hostname: str, username: str) -> str:
     """基於 hostname 和 username 產生穩定的客戶端 ID
 
@@ -51,9 +120,9 @@ def update_client_status(client_id: str, hostname: str, username: str):
     # stable_id is same as client_id (legacy naming)
     stable_id = client_id
 
-    if stable_id in client_registry:
+    client = client_registry.get(stable_id)
+    if client is not None:
         # 更新現有客戶端
-        client = client_registry[stable_id]
         client.hostname = hostname  # 更新可能變動的資訊
         client.username = username
         client.last_seen = now
@@ -66,7 +135,7 @@ def update_client_status(client_id: str, hostname: str, username: str):
             )
     else:
         # 新客戶端註冊
-        client_registry[stable_id] = ClientInfo(
+        client = ClientInfo(
             client_id=client_id,
             hostname=hostname,
             username=username,
@@ -75,7 +144,10 @@ def update_client_status(client_id: str, hostname: str, username: str):
             last_seen=now,
             status="online",
         )
+        if not isinstance(client_registry, SharedClientRegistry):
+            client_registry[stable_id] = client
 
+    save_client(client)
     return stable_id
 
 
@@ -93,14 +165,16 @@ def check_offline_clients():
     for stable_id, client in client_registry.items():
         if client.status == "online" and (now - client.last_seen) > OFFLINE_TIMEOUT:
             client.status = "offline"
+            save_client(client)
 
 
 def mark_client_terminated(stable_id: str):
     """標記客戶端為已終止"""
-    if stable_id in client_registry:
-        client = client_registry[stable_id]
+    client = client_registry.get(stable_id)
+    if client is not None:
         client.terminated = True
         client.status = "offline"
+        save_client(client)
         return True
     return False
 
@@ -109,12 +183,11 @@ def mark_client_terminated(stable_id: str):
 def get_client_registry(token: str = Depends(verify_token)):
     """取得所有客戶端註冊資料"""
     check_offline_clients()
+    clients = list(client_registry.values())
     return {
-        "clients": list(client_registry.values()),
-        "online_count": len(
-            [c for c in client_registry.values() if c.status == "online"]
-        ),
-        "total_count": len(client_registry),
+        "clients": clients,
+        "online_count": len([c for c in clients if c.status == "online"]),
+        "total_count": len(clients),
     }
 
 
@@ -122,9 +195,10 @@ def get_client_registry(token: str = Depends(verify_token)):
 def get_client_info(stable_id: str, token: str = Depends(verify_token)):
     """取得特定客戶端詳細資料"""
     check_offline_clients()
-    if stable_id not in client_registry:
+    client = client_registry.get(stable_id)
+    if client is None:
         return {"error": "Client not found"}
-    return client_registry[stable_id]
+    return client
 
 
 class ClientRegistration(BaseModel):
@@ -144,5 +218,5 @@ def register_client(
     return {
         "stable_id": stable_id,
         "status": "registered",
-        "client_info": client_registry[stable_id],
+        "client_info": client_registry.get(stable_id),
     }
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Request, Depends
+from fastapi import APIRouter, Request, Depends, Header, HTTPException
 from fastapi.responses import PlainTextResponse, Response
 from pt1_server.auth import verify_token
+from functools import lru_cache
+import hashlib
 import uuid
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 router = APIRouter()
 
@@ -10,6 +12,10 @@ router = APIRouter()
 command_queue: Dict[str, Optional[str]] = {}
 
 
+# 範本內容依檔案 mtime 快取：未修改時不重新讀檔，修改後下一次請求即生效
+_template_cache: Dict[str, Tuple[int, str]] = {}
+
+
 def load_template(template_name: str) -> str:
     import os
     from pathlib import Path
@@ -17,20 +23,43 @@ def load_template(template_name: str) -> str:
     # Get the directory containing this file
     current_dir = Path(__file__).parent.parent
     template_path = current_dir / "templates" / template_name
+    mtime_ns = os.stat(template_path).st_mtime_ns
+    cached = _template_cache.get(template_name)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
     with open(template_path, "r", encoding="utf-8") as f:
-        return f.read()
+        text = f.read()
+    _template_cache[template_name] = (mtime_ns, text)
+    return text
+
+
+@lru_cache(maxsize=8)
+def _text_version(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def client_script_version() -> str:
+    """client_install.ps1 範本的版本（內容 hash），persistent agent 用來判斷是否需要更新"""
+    return _text_version(load_template("client_install.ps1"))
+
+
+AGENT_MODES = ("persistent", "cycle")
 
 
 @router.get("/win_agent.ps1", response_class=PlainTextResponse)
 def get_win_agent_script(
     request: Request,
     client_id: Optional[str] = None,
+    mode: str = "persistent",
     session_token: str = Depends(verify_token),
 ):
     """Get Windows production agent script with transcript logging
 
     Query parameters:
         client_id: Optional custom client ID (e.g., ?client_id=my-dev-pc)
+        mode: persistent (default) keeps one execution unit process running and
+              long-polling; cycle starts a new process (download + register)
+              for every poll, as older agents did
 
     Note: This endpoint accepts session token and embeds it directly in the script.
     The CLI ensures a fresh token is used for full validity period.
@@ -38,30 +67,55 @@ def get_win_agent_script(
     # 自動取得當前伺服器 URL
     base_url = f"{request.url.scheme}://{request.url.netloc}"
 
+    if mode not in AGENT_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"mode must be one of: {', '.join(AGENT_MODES)}"
+        )
+
     # 載入並格式化 Windows 生產版代理人腳本
     template = load_template("win_agent.ps1")
     script = template.format(
-        base_url=base_url, client_id=client_id or "", api_token=session_token
+        base_url=base_url,
+        client_id=client_id or "",
+        api_token=session_token,
+        agent_mode=mode,
     )
 
     return script
 
 
 @router.get("/client_install.ps1", response_class=PlainTextResponse)
-def get_install_script(request: Request, session_token: str = Depends(verify_token)):
+def get_install_script(
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    session_token: str = Depends(verify_token),
+):
     """PowerShell execution unit script (called by win_agent.ps1)
 
     Note: This endpoint expects a session token (not refresh token).
     The win_agent.ps1 script downloads this with its embedded session token.
+
+    The response carries an ETag and X-PT1-Script-Version; a persistent agent
+    re-downloads with If-None-Match and gets 304 when nothing changed.
     """
     # 自動取得當前伺服器 URL
     base_url = f"{request.url.scheme}://{request.url.netloc}"
 
     # 載入並格式化 PowerShell script 範本
     template = load_template("client_install.ps1")
-    script = template.format(base_url=base_url, api_token=session_token)
+    script = template.format(
+        base_url=base_url,
+        api_token=session_token,
+        script_version=client_script_version(),
+    )
 
-    return script
+    # 內容包含 base_url 與 session token，ETag 依實際內容計算
+    etag = f'"{hashlib.sha256(script.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "X-PT1-Script-Version": client_script_version()}
+    if if_none_match and etag in [v.strip() for v in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return PlainTextResponse(script, headers=headers)
 
 
 # Removed /clients endpoint - use /client_registry instead for complete client information
@@ -1,16 +1,29 @@
 import json
 
-from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Request
-from fastapi.responses import FileResponse
-from pt1_server.routers.clients import command_queue
-from pt1_server.routers.client_registry import update_client_status, client_registry
+from fastapi import APIRouter, File, UploadFile, HTTPException, Depends, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from pt1_server.routers.clients import command_queue, client_script_version
+from pt1_server.routers.client_registry import (
+    update_client_status,
+    touch_client,
+)
 from pt1_server.services.command_manager import (
     CommandManager,
     CommandInfo,
     ResultType,
     FileInfo,
 )
-from pt1_server.services.providers import get_command_manager
+from pt1_server.services.providers import call_store, get_command_manager
+from pt1_server.services.client_history import read_json_body
+from pt1_server.services.artifact_store import get_artifact_store
+from pt1_server.services.audit_writer import get_audit_writer
+from pt1_server.services.uploads import (
+    UPLOAD_CHUNK_SIZE,
+    save_upload_file,
+    max_upload_bytes,
+    max_transcript_bytes,
+)
 from pt1_server.auth import verify_token
 from pydantic import BaseModel
 from typing import Dict, Optional, List
@@ -18,6 +31,7 @@ import os
 import shutil
 from pathlib import Path
 import time
+from urllib.parse import quote
 
 router = APIRouter()
 
@@ -42,37 +56,108 @@ class CommandResult(BaseModel):
 # CommandManager 已移至 services.command_manager
 
 
+# Upper bound for /next_command?wait=N long-polling (seconds)
+MAX_LONG_POLL_SECONDS = 60
+
+# Upper bound for /next_command?max=N batch size
+MAX_BATCH_COMMANDS = 100
+
+
+def _dispatch_next_command(
+    cmd_manager: CommandManager, stable_id: str, limit: int = 1
+) -> dict:
+    """取得最多 limit 個 pending 命令並標記為 executing
+
+    limit > 1（/next_command?max=N）時另外以 commands 列表返回整批命令，
+    command / command_id 仍是第一個命令。
+    """
+    claimed = cmd_manager.claim_batch(stable_id, limit)
+    for command_info in claimed:
+        print(
+            f"Sending command to {stable_id}: {command_info.command} "
+            f"(ID: {command_info.command_id})"
+        )
+
+    response = {"command": None}
+    if claimed:
+        response = {
+            "command": claimed[0].command,
+            "command_id": claimed[0].command_id,
+        }
+    if limit > 1:
+        response["commands"] = [
+            {"command": c.command, "command_id": c.command_id} for c in claimed
+        ]
+    return response
+
+
 @router.get("/next_command")
-def get_next_command(
+async def get_next_command(
+    request: Request,
     client_id: str,
     hostname: str = None,
     username: str = None,
+    wait: float = Query(0, ge=0, le=MAX_LONG_POLL_SECONDS),
+    max_commands: int = Query(1, alias="max", ge=1, le=MAX_BATCH_COMMANDS),
+    script_version: Optional[str] = None,
     cmd_manager: CommandManager = Depends(get_command_manager),
     token: str = Depends(verify_token),
 ):
+    """Get next pending command for a client
+
+    wait: long-polling seconds. When > 0 and no command is pending, the request
+    is held open until a command is queued for this client or the wait expires.
+    max: when > 1, claim up to N pending commands in queue order and return
+    them as `commands` (results can be sent back with /submit_results).
+    script_version: client_install.ps1 version the (persistent) agent is
+    running. When it differs from the server's, no command is claimed and the
+    response only carries the current `script_version`, so the agent restarts
+    with the new script before taking more work.
+    """
     # client_id 現在是 stable_id
     stable_id = client_id
 
     # 更新客戶端狀態（如果提供了環境資訊）
     if hostname and username:
-        stable_id = update_client_status(client_id, hostname, username)
+        stable_id = await call_store(
+            cmd_manager, update_client_status, client_id, hostname, username
+        )
 
     if stable_id not in command_queue:
         # 自動註冊新的 stable_id
         command_queue[stable_id] = None
         print(f"Auto-registered stable ID: {stable_id}")
 
-    # 使用 CommandManager 取得下一個 pending 命令
-    next_command = cmd_manager.get_next_command(stable_id)
-    if next_command:
-        command, command_id = next_command
+    # 常駐的 agent 腳本版本過舊：不派送命令，讓 agent 先重新下載
+    current_version = client_script_version() if script_version else None
+    if current_version and script_version != current_version:
+        response = {"command": None, "script_version": current_version}
+        if max_commands > 1:
+            response["commands"] = []
+        return response
+
+    deadline = time.monotonic() + wait
+    while True:
+        # 先註冊等待者再檢查 queue，避免漏掉兩者之間排入的命令
+        with cmd_manager.command_waiters.listen(stable_id) as waiter:
+            response = await call_store(
+                cmd_manager,
+                _dispatch_next_command,
+                cmd_manager,
+                stable_id,
+                max_commands,
+            )
+            remaining = deadline - time.monotonic()
+            if response["command"] or remaining <= 0:
+                if current_version:
+                    response["script_version"] = current_version
+                return response
 
-        # Update status to executing
-        cmd_manager.update_command_status(command_id, "executing")
-        print(f"Sending command to {stable_id}: {command} (ID: {command_id})")
-        return {"command": command, "command_id": command_id}
+            await waiter.wait(remaining)
 
-    return {"command": None}
+        # Client 已斷線就不要派送，避免命令卡在 executing
+        if await request.is_disconnected():
+            return {"command": None}
 
 
 @router.post("/heartbeat/{client_id}")
@@ -80,9 +165,14 @@ def client_heartbeat(
     client_id: str,
     hostname: str = None,
     username: str = None,
+    cmd_manager: CommandManager = Depends(get_command_manager),
     token: str = Depends(verify_token),
 ):
-    """Client heartbeat to keep connection alive during long-running commands"""
+    """Client heartbeat to keep connection alive during long-running commands
+
+    Also renews the lease of the client's executing commands so they are not
+    requeued while still running.
+    """
     stable_id = client_id
 
     # 更新客戶端狀態和 last_seen
@@ -90,13 +180,15 @@ def client_heartbeat(
         stable_id = update_client_status(client_id, hostname, username)
     else:
         # 至少更新 last_seen
-        if stable_id in client_registry:
-            client_registry[stable_id].last_seen = time.time()
+        touch_client(stable_id)
+
+    renewed = cmd_manager.renew_leases(stable_id)
 
     return {
         "status": "heartbeat_received",
         "client_id": stable_id,
         "timestamp": time.time(),
+        "leases_renewed": renewed,
     }
 
 
@@ -129,6 +221,54 @@ def send_command(
         raise  # 重新拋出 409 錯誤
 
 
+async def _submit_one_result(cmd_manager: CommandManager, data: dict) -> dict:
+    """完成一個命令（/submit_result 與 /submit_results 共用），不拋出錯誤"""
+    command_id = data.get("command_id", "")
+    result = data.get("result", "")
+    status = data.get("status", "completed")
+    result_type_str = data.get("result_type", "text")
+
+    # 轉換 result_type
+    try:
+        result_type = ResultType(result_type_str)
+    except ValueError:
+        result_type = ResultType.TEXT
+
+    if not command_id:
+        print(f"[submit_result] Missing command_id in request")
+        return {"status": "accepted", "warning": "missing command_id"}
+
+    if not await call_store(cmd_manager, cmd_manager.get_command, command_id):
+        print(f"[submit_result] Command ID {command_id} not found")
+        return {
+            "status": "accepted",
+            "warning": f"command_id {command_id} not found",
+        }
+
+    # 使用 CommandManager 完成 command
+    success = await call_store(
+        cmd_manager,
+        cmd_manager.complete_command,
+        command_id,
+        result,
+        status,
+        result_type,
+    )
+
+    if not success:
+        print(f"[submit_result] Failed to complete command {command_id}")
+        return {"status": "accepted", "warning": f"failed to complete {command_id}"}
+
+    print(f"Result received for {command_id}: {status} ({result_type})")
+    return {"status": "Result submitted successfully", "command_id": command_id}
+
+
+_PARSE_WARNING = (
+    "[PT-1 WARNING] Unable to parse result - possible encoding issue. "
+    "Consider using base64 encoding for the result field."
+)
+
+
 @router.post("/submit_result")
 async def submit_result(
     request: Request,
@@ -137,56 +277,64 @@ async def submit_result(
 ):
     """Submit command execution result - always returns 200"""
     try:
-        body = await request.body()
-        # 處理非 UTF-8 編碼
-        try:
-            body_str = body.decode("utf-8")
-        except UnicodeDecodeError:
-            body_str = body.decode("latin-1")
+        # 由 client history middleware 解析過的 payload（較大的 body 在此解析一次）
+        data = await read_json_body(request)
+        return await _submit_one_result(cmd_manager, data)
 
-        data = json.loads(body_str)
-        command_id = data.get("command_id", "")
-        result = data.get("result", "")
-        status = data.get("status", "completed")
-        result_type_str = data.get("result_type", "text")
-
-        # 轉換 result_type
-        try:
-            result_type = ResultType(result_type_str)
-        except ValueError:
-            result_type = ResultType.TEXT
-
-        if not command_id:
-            print(f"[submit_result] Missing command_id in request")
-            return {"status": "accepted", "warning": "missing command_id"}
-
-        if not cmd_manager.get_command(command_id):
-            print(f"[submit_result] Command ID {command_id} not found")
-            return {
-                "status": "accepted",
-                "warning": f"command_id {command_id} not found",
-            }
+    except json.JSONDecodeError as e:
+        print(f"[submit_result] JSONDecodeError: {e}")
+        return {
+            "status": "accepted",
+            "warning": _PARSE_WARNING,
+            "parse_error": str(e),
+        }
+    except Exception as e:
+        print(f"[submit_result] Exception: {type(e).__name__}: {e}")
+        return {"status": "accepted", "error": str(e)}
 
-        # 使用 CommandManager 完成 command
-        success = cmd_manager.complete_command(command_id, result, status, result_type)
 
-        if not success:
-            print(f"[submit_result] Failed to complete command {command_id}")
-            return {"status": "accepted", "warning": f"failed to complete {command_id}"}
+@router.post("/submit_results")
+async def submit_results(
+    request: Request,
+    cmd_manager: CommandManager = Depends(get_command_manager),
+    token: str = Depends(verify_token),
+):
+    """Submit the results of several commands at once - always returns 200
 
-        print(f"Result received for {command_id}: {status} ({result_type})")
-        return {"status": "Result submitted successfully", "command_id": command_id}
+    Body: {"results": [<same fields as /submit_result>, ...]}. Each result is
+    handled like /submit_result and gets its own entry in the response
+    `results`, in the same order.
+    """
+    try:
+        data = await read_json_body(request)
+        items = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            print(f"[submit_results] Missing results list in request")
+            return {"status": "accepted", "warning": "missing results", "results": []}
+
+        results = []
+        for item in items:
+            if not isinstance(item, dict):
+                results.append({"status": "accepted", "warning": "invalid result"})
+                continue
+            try:
+                results.append(await _submit_one_result(cmd_manager, item))
+            except Exception as e:
+                print(f"[submit_results] Exception: {type(e).__name__}: {e}")
+                results.append({"status": "accepted", "error": str(e)})
+        return {"status": "accepted", "results": results}
 
     except json.JSONDecodeError as e:
-        print(f"[submit_result] JSONDecodeError: {e}")
+        print(f"[submit_results] JSONDecodeError: {e}")
         return {
             "status": "accepted",
-            "warning": "[PT-1 WARNING] Unable to parse result - possible encoding issue. Consider using base64 encoding for the result field.",
+            "warning": _PARSE_WARNING,
             "parse_error": str(e),
+            "results": [],
         }
     except Exception as e:
-        print(f"[submit_result] Exception: {type(e).__name__}: {e}")
-        return {"status": "accepted", "error": str(e)}
+        print(f"[submit_results] Exception: {type(e).__name__}: {e}")
+        return {"status": "accepted", "error": str(e), "results": []}
 
 
 @router.get("/get_result/{command_id}")
@@ -203,6 +351,93 @@ def get_result(
     return command_info
 
 
+# Statuses after which a command no longer changes
+FINAL_STATUSES = ("completed", "failed", "error")
+
+
+def _status_event(command_info: CommandInfo) -> str:
+    """Format a compact status transition as a Server-Sent Event (no result text)"""
+    payload = {
+        "command_id": command_info.command_id,
+        "stable_id": command_info.stable_id,
+        "status": command_info.status,
+        "created_at": command_info.created_at,
+        "scheduled_at": command_info.scheduled_at,
+        "finished_at": command_info.finished_at,
+        "result_type": command_info.result_type.value,
+    }
+    return f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+
+@router.get("/command_events")
+async def command_events(
+    request: Request,
+    command_ids: str,
+    timeout: float = Query(300, gt=0, le=3600),
+    keepalive: float = Query(15, gt=0, le=60),
+    cmd_manager: CommandManager = Depends(get_command_manager),
+    token: str = Depends(verify_token),
+):
+    """Stream status transitions of one or more commands (Server-Sent Events)
+
+    command_ids: comma-separated command IDs
+    timeout: close the stream after this many seconds
+    keepalive: send a comment line when nothing happened for this many seconds
+
+    Events:
+        status  - JSON with command_id, status and timestamps (no result text)
+        done    - every command reached a final status
+        timeout - timeout reached before all commands finished
+    """
+    ids = list(dict.fromkeys(c for c in command_ids.split(",") if c))
+
+    def read_commands():
+        # 每次喚醒只進一次 threadpool（shared 模式），而不是每個 ID 各一次
+        return [cmd_manager.get_command(c) for c in ids]
+
+    commands = await call_store(cmd_manager, read_commands)
+    missing = [c for c, info in zip(ids, commands) if not info]
+    if not ids or missing:
+        raise HTTPException(
+            status_code=404, detail=f"Command ID {','.join(missing)} not found"
+        )
+
+    async def event_stream():
+        last_status: Dict[str, str] = {}
+        deadline = time.monotonic() + timeout
+        while True:
+            # 先註冊等待者再讀取狀態，避免漏掉兩者之間的狀態變化
+            with cmd_manager.status_waiters.listen(*ids) as waiter:
+                commands = await call_store(cmd_manager, read_commands)
+                for command_id, command_info in zip(ids, commands):
+                    if command_info and command_info.status != last_status.get(
+                        command_id
+                    ):
+                        last_status[command_id] = command_info.status
+                        yield _status_event(command_info)
+
+                if all(last_status.get(c) in FINAL_STATUSES for c in ids):
+                    yield "event: done\ndata: {}\n\n"
+                    return
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield "event: timeout\ndata: {}\n\n"
+                    return
+
+                if not await waiter.wait(min(remaining, keepalive)):
+                    yield ": keepalive\n\n"
+
+            if await request.is_disconnected():
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/command_history")
 def get_command_history(
     stable_id: str = None,
@@ -210,16 +445,22 @@ def get_command_history(
     cmd_manager: CommandManager = Depends(get_command_manager),
     token: str = Depends(verify_token),
 ):
-    """Get command history, optionally filtered by stable_id"""
-    history = list(cmd_manager.command_history.values())
+    """Get command history, optionally filtered by stable_id
+
+    Merges real commands with client API call events (used by `pt1 history -v`).
+    """
+    # Newest first (shared state: queried from the store)
+    history, command_total = cmd_manager.list_commands(stable_id, limit)
 
-    if stable_id:
-        history = [cmd for cmd in history if cmd.stable_id == stable_id]
+    # 先寫入尚在 audit 佇列中的事件，讓剛完成的呼叫立即出現在歷史中
+    get_audit_writer().flush()
+    events = cmd_manager.client_events.recent(stable_id, limit)
+    total = command_total + cmd_manager.client_events.count(stable_id)
 
-    # Sort by created_at (newest first)
-    history.sort(key=lambda x: x.created_at, reverse=True)
+    merged = jsonable_encoder(history) + events
+    merged.sort(key=lambda x: x["created_at"], reverse=True)
 
-    return {"commands": history[:limit], "total": len(history)}
+    return {"commands": merged[:limit], "total": total}
 
 
 @router.post("/upload_files/{command_id}")
@@ -230,16 +471,13 @@ async def upload_files(
     token: str = Depends(verify_token),
 ):
     """Upload files for a specific command result"""
-    command_info = cmd_manager.get_command(command_id)
+    command_info = await call_store(cmd_manager, cmd_manager.get_command, command_id)
     if not command_info:
         raise HTTPException(
             status_code=404, detail=f"Command ID {command_id} not found"
         )
 
-    # Create command-specific directory
-    command_dir = UPLOAD_DIR / command_id
-    command_dir.mkdir(exist_ok=True)
-
+    artifact_store = get_artifact_store()
     uploaded_files = []
 
     for file in files:
@@ -248,36 +486,43 @@ async def upload_files(
 
         # Security: Clean filename to prevent path traversal
         safe_filename = os.path.basename(file.filename)
-        file_path = command_dir / safe_filename
+        content_type = file.content_type or "application/octet-stream"
 
-        # Save file
+        # Save file (streamed to disk, stored once per SHA-256)
         try:
-            with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
+            size, sha256 = await artifact_store.save_upload(
+                file,
+                command_id,
+                safe_filename,
+                content_type,
+                max_bytes=max_upload_bytes(),
+            )
 
             file_info = FileInfo(
                 filename=safe_filename,
-                size=len(content),
-                content_type=file.content_type or "application/octet-stream",
+                size=size,
+                content_type=content_type,
                 upload_timestamp=time.time(),
+                sha256=sha256,
             )
 
-            command_info.files.append(file_info)
             uploaded_files.append(file_info)
 
+        except HTTPException:
+            # 例如超過上傳上限（413）：先前已存入並 link 的檔案仍要加入 command
+            if uploaded_files:
+                await call_store(
+                    cmd_manager, cmd_manager.attach_files, command_info, uploaded_files
+                )
+            raise
         except Exception as e:
             print(f"Error uploading file {file.filename}: {str(e)}")
             continue
 
     # Update result type based on files
-    if command_info.files:
-        if command_info.result:
-            command_info.result_type = ResultType.MIXED
-        else:
-            command_info.result_type = (
-                ResultType.FILES if len(command_info.files) > 1 else ResultType.FILE
-            )
+    await call_store(
+        cmd_manager, cmd_manager.attach_files, command_info, uploaded_files
+    )
 
     print(f"Uploaded {len(uploaded_files)} files for command {command_id}")
     return {
@@ -287,48 +532,152 @@ async def upload_files(
     }
 
 
+def _file_etag(file_info: Optional[FileInfo], stat_result: os.stat_result) -> str:
+    """檔案的 strong ETag：有 SHA-256 時使用內容 hash，否則使用 mtime 與大小"""
+    if file_info is not None and file_info.sha256:
+        return f'"{file_info.sha256}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """比對 If-None-Match（可能包含多個 ETag 或 *）"""
+    candidates = [value.strip() for value in header.split(",")]
+    for value in candidates:
+        if value == "*" or (value[2:] if value.startswith("W/") else value) == etag:
+            return True
+    return False
+
+
+def _parse_byte_range(header: str, size: int) -> Optional[tuple]:
+    """
+    解析單一 byte range，返回 (start, end)（end 包含在內）
+
+    格式不符或要求多個 range 時返回 None，由呼叫端回傳整個檔案；
+    範圍完全超出檔案大小時回應 416。
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # suffix range: 最後 N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path: Path, start: int, length: int):
+    """依序讀取檔案的一段範圍（StreamingResponse 會在 threadpool 中迭代）"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 @router.get("/download_file/{command_id}/{filename}")
 async def download_file(
     command_id: str,
     filename: str,
+    request: Request,
     cmd_manager: CommandManager = Depends(get_command_manager),
     token: str = Depends(verify_token),
 ):
-    """Download a specific file from command results"""
-    command_info = cmd_manager.get_command(command_id)
+    """Download a specific file from command results
+
+    Supports a single ``Range`` (206), ``If-Range``, and ``If-None-Match`` (304)
+    so interrupted downloads can resume and parallel clients can fetch slices.
+    """
+    command_info = await call_store(cmd_manager, cmd_manager.get_command, command_id)
     if not command_info:
         raise HTTPException(
             status_code=404, detail=f"Command ID {command_id} not found"
         )
 
-    # Check if file exists in command's file list
-    file_exists = any(f.filename == filename for f in command_info.files)
-    if not file_exists:
+    # Check if file exists in command's file list (last upload wins)
+    file_info = None
+    for f in command_info.files:
+        if f.filename == filename:
+            file_info = f
+    if file_info is None:
         raise HTTPException(
             status_code=404,
             detail=f"File {filename} not found for command {command_id}",
         )
 
-    # Security: Prevent path traversal attacks
-    command_folder = UPLOAD_DIR / command_id
-    file_path = command_folder / filename
+    # Content-addressed blob first, then the legacy per-command folder
+    file_path = get_artifact_store().resolve(command_id, filename)
+    if file_path is None:
+        # Security: Prevent path traversal attacks
+        command_folder = UPLOAD_DIR / command_id
+        file_path = command_folder / filename
 
-    # Verify the resolved path is within the command folder
-    try:
-        resolved_file_path = file_path.resolve()
-        resolved_command_folder = command_folder.resolve()
-        if not str(resolved_file_path).startswith(str(resolved_command_folder)):
+        # Verify the resolved path is within the command folder
+        try:
+            resolved_file_path = file_path.resolve()
+            resolved_command_folder = command_folder.resolve()
+            if not str(resolved_file_path).startswith(str(resolved_command_folder)):
+                raise HTTPException(status_code=400, detail="Invalid file path")
+        except (OSError, ValueError):
             raise HTTPException(status_code=400, detail="Invalid file path")
-    except (OSError, ValueError):
-        raise HTTPException(status_code=400, detail="Invalid file path")
 
-    if not file_path.exists():
+    try:
+        stat_result = file_path.stat()
+    except OSError:
         raise HTTPException(
             status_code=404, detail=f"File {filename} not found on disk"
         )
 
+    size = stat_result.st_size
+    etag = _file_etag(file_info, stat_result)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = _parse_byte_range(range_header, size)
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            headers["Content-Disposition"] = (
+                f"attachment; filename*=utf-8''{quote(filename)}"
+            )
+            return StreamingResponse(
+                _iter_file_range(file_path, start, end - start + 1),
+                status_code=206,
+                media_type="application/octet-stream",
+                headers=headers,
+            )
+
     return FileResponse(
-        path=str(file_path), filename=filename, media_type="application/octet-stream"
+        path=str(file_path),
+        filename=filename,
+        media_type="application/octet-stream",
+        headers=headers,
+        stat_result=stat_result,
     )
 
 
@@ -361,7 +710,7 @@ async def upload_transcript(
     token: str = Depends(verify_token),
 ):
     """Upload PowerShell execution transcript for a specific command"""
-    command_info = cmd_manager.get_command(command_id)
+    command_info = await call_store(cmd_manager, cmd_manager.get_command, command_id)
     if not command_info:
         raise HTTPException(
             status_code=404, detail=f"Command ID {command_id} not found"
@@ -376,10 +725,10 @@ async def upload_transcript(
     transcript_path = command_dir / transcript_filename
 
     try:
-        # Save transcript file
-        with open(transcript_path, "wb") as buffer:
-            content = await transcript_file.read()
-            buffer.write(content)
+        # Save transcript file (streamed to disk in chunks)
+        size, sha256 = await save_upload_file(
+            transcript_file, transcript_path, max_bytes=max_transcript_bytes()
+        )
 
         # Parse metadata if provided
         transcript_metadata = {}
@@ -394,9 +743,10 @@ async def upload_transcript(
         # Create FileInfo for transcript
         file_info = FileInfo(
             filename=transcript_filename,
-            size=len(content),
+            size=size,
             content_type="text/plain",
             upload_timestamp=time.time(),
+            sha256=sha256,
         )
 
         # Add transcript to command files
@@ -407,6 +757,7 @@ async def upload_transcript(
             command_info.result_type = ResultType.FILE
         elif command_info.result and command_info.result_type == ResultType.TEXT:
             command_info.result_type = ResultType.MIXED
+        await call_store(cmd_manager, cmd_manager.save_command, command_info)
 
         print(f"Uploaded transcript for command {command_id}: {transcript_filename}")
 
@@ -418,6 +769,8 @@ async def upload_transcript(
             "upload_timestamp": file_info.upload_timestamp,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error uploading transcript for {command_id}: {str(e)}")
         raise HTTPException(
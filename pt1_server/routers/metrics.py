@@ -0,0 +1,144 @@
+"""
+Prometheus metrics endpoint
+
+GET /metrics    Prometheus text format：請求延遲/bytes、token 驗證、上傳，
+                以及讀取時計算的命令佇列、客戶端、transcript、audit 佇列與保留清除統計
+
+預設需要 session token（X-API-Token 或 Authorization: Bearer）；
+PT1_METRICS_PUBLIC=true 時不驗證，供受信任網路內的 Prometheus 直接抓取。
+"""
+
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import PlainTextResponse
+
+from pt1_server.auth import verify_token
+from pt1_server.routers.client_registry import check_offline_clients, client_registry
+from pt1_server.services.artifact_store import get_artifact_store
+from pt1_server.services.audit_policy import get_audit_policy
+from pt1_server.services.audit_writer import get_audit_writer
+from pt1_server.services.metrics import MetricsWriter, get_metrics
+from pt1_server.services.providers import call_store, get_command_manager
+from pt1_server.services.retention import get_retention_sweeper
+from pt1_server.services.transcript_manager import get_transcript_manager
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_public() -> bool:
+    return os.getenv("PT1_METRICS_PUBLIC", "").lower() in ("1", "true", "yes")
+
+
+async def verify_metrics_access(
+    x_api_token: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> Optional[str]:
+    """PT1_METRICS_PUBLIC 未啟用時與 verify_token 相同"""
+    if metrics_public():
+        return None
+    return await verify_token(x_api_token, authorization)
+
+
+@router.get("/metrics")
+async def metrics(token: Optional[str] = Depends(verify_metrics_access)):
+    """Prometheus text exposition format"""
+    writer = MetricsWriter()
+    get_metrics().write(writer)
+
+    cmd_manager = get_command_manager()
+    active = await call_store(cmd_manager, cmd_manager.active_command_counts)
+    writer.family(
+        "pt1_commands_active",
+        "gauge",
+        "Pending and executing commands per client",
+        [
+            ((("client", client_id), ("status", status)), count)
+            for client_id, counts in sorted(active.items())
+            for status, count in counts.items()
+        ],
+    )
+    writer.family(
+        "pt1_command_history_size",
+        "gauge",
+        "Commands held in memory",
+        [((), len(cmd_manager.command_history))],
+    )
+
+    check_offline_clients()
+    statuses = {"online": 0, "offline": 0}
+    for client in list(client_registry.values()):
+        statuses[client.status] = statuses.get(client.status, 0) + 1
+    writer.family(
+        "pt1_clients",
+        "gauge",
+        "Registered clients by status",
+        [((("status", status),), count) for status, count in sorted(statuses.items())],
+    )
+
+    index = get_transcript_manager().index
+    writer.family(
+        "pt1_transcripts",
+        "gauge",
+        "Stored agent transcripts",
+        [((), len(index))],
+    )
+    writer.family(
+        "pt1_transcript_bytes",
+        "gauge",
+        "Total size of stored agent transcripts (uncompressed)",
+        [((), index.total_size())],
+    )
+
+    artifact_stats = get_artifact_store().stats()
+    writer.family(
+        "pt1_artifact_blobs",
+        "gauge",
+        "Content-addressed result file blobs",
+        [((), artifact_stats["blobs"])],
+    )
+
+    writer.family(
+        "pt1_audit_policy_decisions_total",
+        "counter",
+        "Client API events kept, sampled out or rate limited by the audit policy",
+        [
+            ((("route", route), ("decision", decision)), count)
+            for (route, decision), count in sorted(get_audit_policy().decisions.items())
+        ],
+    )
+    audit_stats = get_audit_writer().stats()
+    writer.family(
+        "pt1_audit_events_total",
+        "counter",
+        "Client API audit events by outcome",
+        [
+            ((("result", result),), audit_stats[result])
+            for result in ("submitted", "dropped", "written")
+        ],
+    )
+    writer.family(
+        "pt1_audit_queue_depth",
+        "gauge",
+        "Audit events waiting for the background writer",
+        [((), audit_stats["queued"])],
+    )
+
+    totals = get_retention_sweeper().totals
+    writer.family(
+        "pt1_retention_reclaimed_items_total",
+        "counter",
+        "Items deleted by the retention sweeper",
+        [((("category", name),), counts["items"]) for name, counts in totals.items()],
+    )
+    writer.family(
+        "pt1_retention_reclaimed_bytes_total",
+        "counter",
+        "Bytes reclaimed by the retention sweeper",
+        [((("category", name),), counts["bytes"]) for name, counts in totals.items()],
+    )
+
+    return PlainTextResponse(writer.render(), media_type=CONTENT_TYPE)
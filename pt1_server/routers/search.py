@@ -0,0 +1,59 @@
+"""
+Full-text search endpoint
+
+GET /search?q=...    搜尋 agent transcript 與命令結果，返回符合的 snippet
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+
+from pt1_server.auth import verify_token
+from pt1_server.services.search_index import SearchIndex, get_search_index
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    client_id: Optional[str] = None,
+    kind: Optional[str] = Query(None, regex="^(transcript|result)$"),
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=500),
+    order: str = Query("newest", regex="^(newest|rank)$"),
+    search_index: SearchIndex = Depends(get_search_index),
+    token: str = Depends(verify_token),
+):
+    """
+    Search agent transcripts and command results
+
+    Args:
+        q: FTS5 query ("exact phrase", AND/OR/NOT, prefix*)
+        client_id: Only search this client
+        kind: transcript or result
+        since: Only documents created at or after this time (epoch seconds)
+        until: Only documents created before this time (epoch seconds)
+        limit: Maximum number of matches
+        order: newest (default) or rank (best match first)
+    """
+    if not search_index.enabled:
+        raise HTTPException(status_code=503, detail="Full-text search is disabled")
+
+    try:
+        results = await run_in_threadpool(
+            search_index.search,
+            q,
+            client_id=client_id,
+            kind=kind,
+            since=since,
+            until=until,
+            limit=limit,
+            order=order,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"query": q, "count": len(results), "results": results}
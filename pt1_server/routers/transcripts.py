@@ -1,5 +1,14 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
-from fastapi.responses import PlainTextResponse, JSONResponse
+from fastapi import (
+    APIRouter,
+    UploadFile,
+    File,
+    HTTPException,
+    Depends,
+    Query,
+    Request,
+)
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, Dict, List
 from pt1_server.services.transcript_manager import (
     get_transcript_manager,
@@ -10,6 +19,29 @@ import json
 
 router = APIRouter()
 
+# Python codec 名稱對應到 HTTP charset
+_HTTP_CHARSETS = {
+    "utf-8": "utf-8",
+    "utf-8-sig": "utf-8",
+    "utf-16-le": "utf-16le",
+    "utf-16-be": "utf-16be",
+    "cp1252": "windows-1252",
+}
+
+
+def _accepts_gzip(request: Request) -> bool:
+    """Accept-Encoding 是否允許 gzip（忽略 q=0）"""
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        _, _, q = params.partition("q=")
+        try:
+            return float(q) > 0 if q else True
+        except ValueError:
+            return True
+    return False
+
 
 @router.post("/agent_transcript/{client_id}")
 async def upload_agent_transcript(
@@ -55,6 +87,8 @@ async def upload_agent_transcript(
             "message": f"Transcript uploaded for client {client_id}",
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to upload transcript: {str(e)}"
@@ -67,23 +101,30 @@ async def list_agent_transcripts(
     limit: int = Query(
         50, ge=1, le=200, description="Maximum number of transcripts to return"
     ),
+    cursor: Optional[int] = Query(
+        None, ge=1, description="next_cursor from the previous page"
+    ),
     transcript_mgr: TranscriptManager = Depends(get_transcript_manager),
     token: str = Depends(verify_token),
 ):
     """
-    List available agent transcripts
+    List available agent transcripts (newest first)
 
     Args:
         client_id: Optional filter by client ID
         limit: Maximum number of transcripts to return
+        cursor: Return transcripts older than this cursor
     """
     try:
-        transcripts = transcript_mgr.list_transcripts(client_id=client_id, limit=limit)
+        transcripts, next_cursor = transcript_mgr.list_transcripts(
+            client_id=client_id, limit=limit, cursor=cursor
+        )
 
         return {
             "transcripts": transcripts,
             "count": len(transcripts),
             "filtered_by_client": client_id,
+            "next_cursor": next_cursor,
         }
 
     except Exception as e:
@@ -95,7 +136,13 @@ async def list_agent_transcripts(
 @router.get("/agent_transcript/{transcript_id}")
 async def get_agent_transcript(
     transcript_id: str,
+    request: Request,
     format: str = Query("content", regex="^(content|metadata|both)$"),
+    offset: Optional[int] = Query(None, ge=0, description="Start byte (content)"),
+    length: Optional[int] = Query(None, ge=1, description="Max bytes (content)"),
+    tail: Optional[int] = Query(
+        None, ge=1, le=100000, description="Only the last N lines (content)"
+    ),
     transcript_mgr: TranscriptManager = Depends(get_transcript_manager),
     token: str = Depends(verify_token),
 ):
@@ -105,16 +152,71 @@ async def get_agent_transcript(
     Args:
         transcript_id: Transcript identifier
         format: Return format (content, metadata, or both)
+        offset: Start reading at this byte of the uncompressed transcript
+        length: Return at most this many bytes
+        tail: Return only the last N lines
+
+    With format=content the transcript is streamed. Without offset/length/tail,
+    gzip-stored transcripts are sent as-is with ``Content-Encoding: gzip`` when
+    the client accepts gzip, otherwise re-encoded as UTF-8. With offset/length/tail
+    the raw bytes are returned in the transcript's own charset, with
+    ``X-Transcript-Offset`` and ``X-Transcript-Size`` headers.
     """
     try:
         if format == "content":
-            content = transcript_mgr.get_transcript_content(transcript_id)
-            if content is None:
+            stored = transcript_mgr.get_transcript_file(transcript_id)
+            if stored is None:
                 raise HTTPException(
                     status_code=404, detail=f"Transcript {transcript_id} not found"
                 )
-            return PlainTextResponse(
-                content=content, media_type="text/plain; charset=utf-8"
+            encoding = await run_in_threadpool(
+                transcript_mgr.detect_encoding, transcript_id
+            )
+            charset = _HTTP_CHARSETS.get(encoding, "utf-8")
+
+            if offset is None and length is None and tail is None:
+                if stored[1] and _accepts_gzip(request):
+                    # 完整內容以 BOM 開頭，UTF-16 不需指定 byte order
+                    if encoding.startswith("utf-16"):
+                        charset = "utf-16"
+                    return FileResponse(
+                        path=str(stored[0]),
+                        media_type=f"text/plain; charset={charset}",
+                        headers={
+                            "Content-Encoding": "gzip",
+                            "Vary": "Accept-Encoding",
+                        },
+                    )
+                return StreamingResponse(
+                    transcript_mgr.iter_transcript_text(transcript_id, encoding),
+                    media_type="text/plain; charset=utf-8",
+                    headers={"Vary": "Accept-Encoding"},
+                )
+
+            if offset is not None and tail is not None:
+                raise HTTPException(
+                    status_code=400, detail="Use either offset or tail, not both"
+                )
+            size = transcript_mgr.get_transcript_size(transcript_id)
+            if tail is not None:
+                start = await run_in_threadpool(
+                    transcript_mgr.tail_offset, transcript_id, tail, encoding
+                )
+            else:
+                start = offset or 0
+            if start > size:
+                raise HTTPException(
+                    status_code=416,
+                    detail=f"Offset {start} is beyond transcript size {size}",
+                )
+
+            return StreamingResponse(
+                transcript_mgr.iter_transcript_bytes(transcript_id, start, length),
+                media_type=f"text/plain; charset={charset}",
+                headers={
+                    "X-Transcript-Offset": str(start),
+                    "X-Transcript-Size": str(size),
+                },
             )
 
         elif format == "metadata":
@@ -0,0 +1,181 @@
+"""
+Resumable upload endpoints
+
+POST   /uploads/{command_id}                        建立 upload
+GET    /uploads/{command_id}/{upload_id}            查詢已收到的 bytes
+PUT    /uploads/{command_id}/{upload_id}            上傳 chunk（需 Content-Range）
+POST   /uploads/{command_id}/{upload_id}/finalize   驗證並加入 command 的檔案列表
+DELETE /uploads/{command_id}/{upload_id}            放棄 upload
+"""
+
+import re
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+
+from pt1_server.auth import verify_token
+from pt1_server.services.artifact_store import get_artifact_store
+from pt1_server.services.command_manager import CommandManager, FileInfo
+from pt1_server.services.providers import call_store, get_command_manager
+from pt1_server.services.resumable_uploads import (
+    RECOMMENDED_CHUNK_SIZE,
+    ResumableUploadManager,
+    get_resumable_upload_manager,
+)
+from pt1_server.services.uploads import max_upload_bytes
+
+router = APIRouter()
+
+_CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class UploadInitRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    content_type: Optional[str] = None
+
+
+async def _require_command(cmd_manager: CommandManager, command_id: str):
+    command_info = await call_store(cmd_manager, cmd_manager.get_command, command_id)
+    if not command_info:
+        raise HTTPException(
+            status_code=404, detail=f"Command ID {command_id} not found"
+        )
+    return command_info
+
+
+def _parse_content_range(value: Optional[str], declared_size: int) -> tuple:
+    """解析 "bytes start-end/total"，返回 (start, end)"""
+    match = _CONTENT_RANGE_PATTERN.match(value or "")
+    if not match:
+        raise HTTPException(
+            status_code=400,
+            detail="Content-Range header required (bytes start-end/total)",
+        )
+    start, end, total = match.groups()
+    start, end = int(start), int(end)
+    if end < start or (total != "*" and int(total) != declared_size):
+        raise HTTPException(status_code=416, detail=f"Invalid Content-Range: {value}")
+    return start, end
+
+
+@router.post("/uploads/{command_id}")
+async def init_upload(
+    command_id: str,
+    body: UploadInitRequest,
+    cmd_manager: CommandManager = Depends(get_command_manager),
+    upload_manager: ResumableUploadManager = Depends(get_resumable_upload_manager),
+    token: str = Depends(verify_token),
+):
+    """Start a resumable upload for a command result file"""
+    await _require_command(cmd_manager, command_id)
+
+    if body.size < 0:
+        raise HTTPException(status_code=400, detail="size must be >= 0")
+    limit = max_upload_bytes()
+    if limit and body.size > limit:
+        raise HTTPException(
+            status_code=413, detail=f"Upload exceeds limit of {limit} bytes"
+        )
+
+    state = upload_manager.init_upload(
+        command_id, body.filename, body.size, body.sha256, body.content_type
+    )
+    state["chunk_size"] = RECOMMENDED_CHUNK_SIZE
+    return state
+
+
+@router.get("/uploads/{command_id}/{upload_id}")
+async def get_upload_status(
+    command_id: str,
+    upload_id: str,
+    upload_manager: ResumableUploadManager = Depends(get_resumable_upload_manager),
+    token: str = Depends(verify_token),
+):
+    """Return how many bytes of an upload the server already has"""
+    return upload_manager.get_state(command_id, upload_id)
+
+
+@router.put("/uploads/{command_id}/{upload_id}")
+async def upload_chunk(
+    command_id: str,
+    upload_id: str,
+    request: Request,
+    upload_manager: ResumableUploadManager = Depends(get_resumable_upload_manager),
+    token: str = Depends(verify_token),
+):
+    """Append a chunk; the Content-Range start must equal the received offset"""
+    state = upload_manager.get_state(command_id, upload_id)
+    start, end = _parse_content_range(
+        request.headers.get("content-range"), state["size"]
+    )
+
+    received = await upload_manager.write_chunk(
+        command_id, upload_id, start, request.stream()
+    )
+    if received != end + 1:
+        print(
+            f"[Uploads] Chunk for {upload_id} ended at {received}, "
+            f"Content-Range said {end + 1}"
+        )
+    return {"upload_id": upload_id, "received": received, "size": state["size"]}
+
+
+@router.post("/uploads/{command_id}/{upload_id}/finalize")
+async def finalize_upload(
+    command_id: str,
+    upload_id: str,
+    cmd_manager: CommandManager = Depends(get_command_manager),
+    upload_manager: ResumableUploadManager = Depends(get_resumable_upload_manager),
+    token: str = Depends(verify_token),
+):
+    """Verify the upload and attach it to the command's file list"""
+    command_info = await _require_command(cmd_manager, command_id)
+
+    part_path, state, sha256 = await run_in_threadpool(
+        upload_manager.finalize, command_id, upload_id
+    )
+    artifact_store = get_artifact_store()
+    await run_in_threadpool(
+        artifact_store.adopt_and_link,
+        part_path,
+        sha256,
+        command_id,
+        state["filename"],
+        state["size"],
+        state["content_type"],
+    )
+    upload_manager.abort(command_id, upload_id)
+
+    file_info = FileInfo(
+        filename=state["filename"],
+        size=state["size"],
+        content_type=state["content_type"],
+        upload_timestamp=time.time(),
+        sha256=sha256,
+    )
+    await call_store(cmd_manager, cmd_manager.attach_files, command_info, [file_info])
+
+    print(f"Finalized resumable upload {upload_id} for command {command_id}")
+    return {
+        "status": "File uploaded successfully",
+        "command_id": command_id,
+        "uploaded_files": [file_info],
+    }
+
+
+@router.delete("/uploads/{command_id}/{upload_id}")
+async def abort_upload(
+    command_id: str,
+    upload_id: str,
+    upload_manager: ResumableUploadManager = Depends(get_resumable_upload_manager),
+    token: str = Depends(verify_token),
+):
+    """Discard a partial upload"""
+    if not upload_manager.abort(command_id, upload_id):
+        raise HTTPException(status_code=404, detail=f"Upload {upload_id} not found")
+    return {"status": "Upload aborted", "upload_id": upload_id}
@@ -0,0 +1,304 @@
+"""
+Content-addressed artifact store
+
+上傳的結果檔案依 SHA-256 只存一份：
+
+    uploads/blobs/<前 2 碼>/<sha256>     檔案內容
+    uploads/<command_id>/manifest.json  {filename: {sha256, size, content_type}}
+
+同一個檔案被多個 command 上傳時只佔一份空間。每個 blob 的 reference count
+在啟動時由所有 manifest 重建；command 的檔案被移除或覆蓋、count 歸零時刪除 blob。
+
+Client 可以先用 /artifacts/have 詢問 server 已有哪些 hash，
+已存在的檔案用 /artifacts/{command_id}/link 直接連結，不必再傳一次內容。
+
+多 worker 模式（shared=True）時每個 worker 的 reference count 只包含自己
+建立的 link，因此 count 歸零時不刪除 blob；link 時更新 blob 的 mtime，由
+leader worker 的 retention sweeper 定期重建 count 並清除超過一小時未被引用的 blob。
+manifest 的讀取-修改-寫入另外持有跨 process 的 file lock（blobs/manifests.lock）。
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from .shared_state import file_lock
+from .storage import get_state_store
+from .uploads import save_upload_file
+
+BLOB_DIR_NAME = "blobs"
+MANIFEST_NAME = "manifest.json"
+
+
+def _is_sha256(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+class ArtifactStore:
+    def __init__(self, upload_dir: Optional[Path] = None, shared: bool = False):
+        self.upload_dir = Path(upload_dir or Path.cwd() / "uploads")
+        self.shared = shared
+        self.blob_dir = self.upload_dir / BLOB_DIR_NAME
+        self._incoming_dir = self.blob_dir / ".incoming"
+        self._incoming_dir.mkdir(parents=True, exist_ok=True)
+        self._refcounts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Blobs
+    # ------------------------------------------------------------------
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.blob_dir / sha256[:2] / sha256
+
+    def has_blob(self, sha256: str) -> bool:
+        sha256 = sha256.lower()
+        return _is_sha256(sha256) and self.blob_path(sha256).exists()
+
+    def missing(self, hashes: Iterable[str]) -> List[str]:
+        """返回 server 尚未保存的 hash"""
+        return [h for h in hashes if not self.has_blob(h)]
+
+    def _adopt_file(self, path: Path, sha256: str) -> Path:
+        """
+        把已驗證 hash 的檔案移入 blob store（需持有 _lock）
+
+        內容已存在時直接刪除 path（不需要第二份）。
+        """
+        blob_path = self.blob_path(sha256)
+        if blob_path.exists():
+            path.unlink()
+        else:
+            blob_path.parent.mkdir(exist_ok=True)
+            os.replace(path, blob_path)
+        return blob_path
+
+    def adopt_and_link(
+        self,
+        path: Path,
+        sha256: str,
+        command_id: str,
+        filename: str,
+        size: int,
+        content_type: str = "application/octet-stream",
+    ):
+        """
+        把已驗證 hash 的檔案移入 blob store 並加入 command 的 manifest
+
+        兩步在同一個 lock 中完成：blob 已存在時，刪除暫存檔與增加 reference
+        count 之間不會有其他 command 釋放最後一個 reference 而刪掉 blob。
+        """
+        with self._lock, self._manifest_lock():
+            self._adopt_file(path, sha256)
+            self._link_locked(command_id, filename, sha256, size, content_type)
+        self._touch_blob(sha256)
+
+    async def save_upload(
+        self,
+        upload: UploadFile,
+        command_id: str,
+        filename: str,
+        content_type: str = "application/octet-stream",
+        max_bytes: Optional[int] = None,
+    ) -> Tuple[int, str]:
+        """串流寫入 UploadFile、存成 blob 並以 filename 加入 command，返回 (size, sha256)"""
+        staging_path = self._incoming_dir / uuid.uuid4().hex
+        size, sha256 = await save_upload_file(upload, staging_path, max_bytes=max_bytes)
+        self.adopt_and_link(
+            staging_path, sha256, command_id, filename, size, content_type
+        )
+        return size, sha256
+
+    # ------------------------------------------------------------------
+    # Manifests
+    # ------------------------------------------------------------------
+
+    def _manifest_path(self, command_id: str) -> Path:
+        return self.upload_dir / command_id / MANIFEST_NAME
+
+    def _read_manifest(self, command_id: str) -> Dict[str, dict]:
+        try:
+            with open(self._manifest_path(command_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _manifest_lock(self):
+        """多 worker 模式下 manifest 的讀取-修改-寫入需要跨 process 的 lock"""
+        if self.shared:
+            return file_lock(str(self.blob_dir / "manifests"))
+        return contextlib.nullcontext()
+
+    def _write_manifest(self, command_id: str, manifest: Dict[str, dict]):
+        manifest_path = self._manifest_path(command_id)
+        manifest_path.parent.mkdir(exist_ok=True)
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+
+    def link(
+        self,
+        command_id: str,
+        filename: str,
+        sha256: str,
+        content_type: str = "application/octet-stream",
+    ) -> Optional[int]:
+        """
+        把已保存的 blob 以 filename 加入 command 的 manifest（同名檔案會被取代）
+
+        blob 是否存在與大小在同一個 lock 中取得，檢查與 link 之間不會有其他
+        command 釋放最後一個 reference 而刪掉 blob。
+
+        Returns:
+            blob 的大小；blob 不存在時返回 None
+        """
+        sha256 = sha256.lower()
+        if not _is_sha256(sha256):
+            return None
+        with self._lock, self._manifest_lock():
+            self._touch_blob(sha256)
+            try:
+                size = self.blob_path(sha256).stat().st_size
+            except OSError:
+                return None
+            self._link_locked(command_id, filename, sha256, size, content_type)
+        return size
+
+    def _link_locked(
+        self,
+        command_id: str,
+        filename: str,
+        sha256: str,
+        size: int,
+        content_type: str,
+    ):
+        manifest = self._read_manifest(command_id)
+        previous = manifest.get(filename)
+        manifest[filename] = {
+            "sha256": sha256,
+            "size": size,
+            "content_type": content_type,
+        }
+        self._write_manifest(command_id, manifest)
+        self._refcounts[sha256] = self._refcounts.get(sha256, 0) + 1
+        if previous is not None:
+            self._release(previous["sha256"])
+
+    def _touch_blob(self, sha256: str):
+        if self.shared:
+            # 讓 leader 的 garbage collection 把它視為最近使用的 blob
+            try:
+                os.utime(self.blob_path(sha256))
+            except OSError:
+                pass
+
+    def resolve(self, command_id: str, filename: str) -> Optional[Path]:
+        """取得 command 檔案對應的 blob 路徑（不在 manifest 中時返回 None）"""
+        entry = self._read_manifest(command_id).get(filename)
+        if entry is None:
+            return None
+        return self.blob_path(entry["sha256"])
+
+    def command_usage(self, command_id: str) -> int:
+        """command manifest 中所有檔案的大小總和（不考慮重複內容）"""
+        return sum(
+            entry.get("size", 0) for entry in self._read_manifest(command_id).values()
+        )
+
+    def remove_command(self, command_id: str) -> int:
+        """
+        移除 command 的 manifest 並釋放它引用的 blob
+
+        Returns:
+            實際刪除的 bytes 數
+        """
+        with self._lock, self._manifest_lock():
+            manifest = self._read_manifest(command_id)
+            try:
+                self._manifest_path(command_id).unlink()
+            except OSError:
+                pass
+            return sum(self._release(entry["sha256"]) for entry in manifest.values())
+
+    def _release(self, sha256: str) -> int:
+        """reference count 減一，歸零時刪除 blob，返回刪除的 bytes 數"""
+        count = self._refcounts.get(sha256, 0) - 1
+        if count > 0:
+            self._refcounts[sha256] = count
+            return 0
+        self._refcounts.pop(sha256, None)
+        if self.shared:
+            # 其他 worker 可能仍引用此 blob，交給 collect_garbage() 處理
+            return 0
+        blob_path = self.blob_path(sha256)
+        try:
+            size = blob_path.stat().st_size
+            blob_path.unlink()
+            return size
+        except OSError:
+            return 0
+
+    # ------------------------------------------------------------------
+    # Startup / maintenance
+    # ------------------------------------------------------------------
+
+    def rebuild_refcounts(self) -> int:
+        """掃描所有 manifest 重建 reference count，返回 blob 數量"""
+        refcounts: Dict[str, int] = {}
+        for manifest_path in self.upload_dir.glob(f"*/{MANIFEST_NAME}"):
+            for entry in self._read_manifest(manifest_path.parent.name).values():
+                sha256 = entry["sha256"]
+                refcounts[sha256] = refcounts.get(sha256, 0) + 1
+        with self._lock:
+            self._refcounts = refcounts
+        return len(refcounts)
+
+    def collect_garbage(self, min_age_seconds: int = 3600) -> int:
+        """
+        刪除沒有任何 manifest 引用的 blob 與中斷上傳留下的暫存檔
+
+        只處理超過 min_age_seconds 的檔案，避免刪到正在 link 的 blob。
+
+        Returns:
+            刪除的 bytes 數
+        """
+        cutoff = time.time() - min_age_seconds
+        reclaimed = 0
+        for path in self.blob_dir.glob("*/*"):
+            in_use = path.parent != self._incoming_dir and path.name in self._refcounts
+            try:
+                stat_result = path.stat()
+                if in_use or stat_result.st_mtime > cutoff:
+                    continue
+                path.unlink()
+                reclaimed += stat_result.st_size
+            except OSError:
+                continue
+        return reclaimed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "blobs": len(self._refcounts),
+                "references": sum(self._refcounts.values()),
+            }
+
+
+# Global instance
+_artifact_store = None
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Dependency injection for FastAPI"""
+    global _artifact_store
+    if _artifact_store is None:
+        _artifact_store = ArtifactStore(shared=get_state_store().shared)
+    return _artifact_store
@@ -0,0 +1,156 @@
+"""
+Client API audit sampling policy
+
+決定 client_history middleware 的每筆事件是否送入 AuditWriter：
+
+- 非 2xx 的回應一律記錄，不受取樣與頻率限制影響
+- 其餘事件依 route 的取樣率記錄（PT1_AUDIT_SAMPLE_RATES，以逗號分隔的
+  `<route>=<rate>`，route 可以是路徑樣板 `/heartbeat/{client_id}` 或第一段
+  路徑 `/heartbeat`；未列出的 route 使用 PT1_AUDIT_DEFAULT_RATE，預設 1）
+- 每個 client 每分鐘最多記錄 PT1_AUDIT_CLIENT_RATE 筆（token bucket，預設 60，
+  0 表示不限制）
+
+預設只對 agent 大量重複的呼叫取樣（heartbeat、register_client、transcript
+與分段上傳），設定中的值會覆蓋預設值，例如 `/heartbeat=1` 恢復完整記錄。
+與 Metrics 相同，所有判斷都在 event loop thread 進行，不需要 lock。
+"""
+
+import os
+import random
+import time
+from typing import Dict, Optional, Tuple
+
+from pt1_server.services.config import env_float
+from pt1_server.services.metrics import UNMATCHED_ROUTE
+
+DEFAULT_SAMPLE_RATES = {
+    "/heartbeat/{client_id}": 0.05,
+    "/register_client": 0.1,
+    "/agent_transcript/{client_id}": 0.1,
+    "/upload_transcript/{command_id}": 0.1,
+    "/uploads/{command_id}/{upload_id}": 0.1,
+}
+
+# client bucket 超過這個數量時清除閒置（已補滿）的 bucket
+MAX_CLIENT_BUCKETS = 10000
+
+KEPT = "kept"
+SAMPLED_OUT = "sampled_out"
+RATE_LIMITED = "rate_limited"
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """解析 `<route>=<rate>,...`；格式錯誤的項目略過"""
+    rates = {}
+    for item in value.split(","):
+        route, sep, rate = item.strip().rpartition("=")
+        if not sep or not route.strip():
+            continue
+        try:
+            rates[route.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"[Audit] WARNING: Ignoring invalid sample rate {item.strip()!r}")
+    return rates
+
+
+class AuditPolicy:
+    """依 route 取樣率與 client 頻率限制決定是否記錄事件"""
+
+    def __init__(
+        self,
+        sample_rates: Optional[Dict[str, float]] = None,
+        default_rate: float = 1.0,
+        client_rate_per_minute: float = 60,
+    ):
+        self.sample_rates = dict(DEFAULT_SAMPLE_RATES)
+        if sample_rates:
+            self.sample_rates.update(sample_rates)
+        self.default_rate = min(1.0, default_rate)
+        self.client_rate_per_minute = client_rate_per_minute
+
+        # route 樣板 -> 取樣率（解析第一段路徑的結果）
+        self._route_rates: Dict[str, float] = {}
+        # client key -> (tokens, last_refill)
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        # (route, decision) -> count
+        self.decisions: Dict[Tuple[str, str], int] = {}
+
+    def rate_for(self, route: Optional[str]) -> float:
+        route = route or UNMATCHED_ROUTE
+        rate = self._route_rates.get(route)
+        if rate is None:
+            rate = self.sample_rates.get(route)
+            if rate is None:
+                prefix = "/" + route.strip("/").split("/", 1)[0]
+                rate = self.sample_rates.get(prefix, self.default_rate)
+            self._route_rates[route] = rate
+        return rate
+
+    def _take_token(self, client_key: str, now: float) -> bool:
+        capacity = self.client_rate_per_minute
+        tokens, last = self._buckets.get(client_key, (capacity, now))
+        tokens = min(capacity, tokens + (now - last) * capacity / 60)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[client_key] = (tokens, now)
+
+        if len(self._buckets) > MAX_CLIENT_BUCKETS:
+            idle = now - 60
+            self._buckets = {
+                key: bucket for key, bucket in self._buckets.items() if bucket[1] > idle
+            }
+        return allowed
+
+    def _count(self, route: str, decision: str):
+        key = (route, decision)
+        self.decisions[key] = self.decisions.get(key, 0) + 1
+
+    def should_log(
+        self, route: Optional[str], status_code: int, client_key: Optional[str]
+    ) -> bool:
+        """
+        Args:
+            route: 路徑樣板（未匹配時為 None）
+            status_code: 回應狀態碼
+            client_key: 頻率限制的對象（stable_id 或來源 IP）
+        """
+        label = route or UNMATCHED_ROUTE
+        if not 200 <= status_code < 300:
+            self._count(label, KEPT)
+            return True
+
+        rate = self.rate_for(route)
+        if rate < 1.0 and random.random() >= rate:
+            self._count(label, SAMPLED_OUT)
+            return False
+
+        if self.client_rate_per_minute > 0 and not self._take_token(
+            client_key or "unknown", time.monotonic()
+        ):
+            self._count(label, RATE_LIMITED)
+            return False
+
+        self._count(label, KEPT)
+        return True
+
+
+def create_audit_policy() -> AuditPolicy:
+    """依環境變數建立 AuditPolicy"""
+    return AuditPolicy(
+        sample_rates=parse_sample_rates(os.getenv("PT1_AUDIT_SAMPLE_RATES", "")),
+        default_rate=env_float("PT1_AUDIT_DEFAULT_RATE", 1.0),
+        client_rate_per_minute=env_float("PT1_AUDIT_CLIENT_RATE", 60),
+    )
+
+
+# Global instance
+_audit_policy = None
+
+
+def get_audit_policy() -> AuditPolicy:
+    """取得 AuditPolicy 單例"""
+    global _audit_policy
+    if _audit_policy is None:
+        _audit_policy = create_audit_policy()
+    return _audit_policy
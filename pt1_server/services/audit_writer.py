@@ -0,0 +1,212 @@
+"""
+Asynchronous client API audit writer
+
+client_history middleware 在請求路徑上只呼叫 AuditWriter.submit()，把一筆
+AuditRecord append 到 collections.deque（CPython 的 deque.append / popleft
+是原子操作，不需要 lock）。背景 thread 每 PT1_AUDIT_FLUSH_MS 毫秒取出整批：
+
+- 由 command_id 找出所屬 client（可能需要查詢 SQLite state store）
+- 產生 event ID，取得一次 lock 把整批寫入 ClientEventLog
+- 設定 PT1_AUDIT_LOG 時，把整批事件以 JSONL 一次 append 到檔案；檔案超過
+  PT1_AUDIT_LOG_MAX_MB 時改名為 <file>.1（只保留一份）
+
+佇列中超過 PT1_AUDIT_QUEUE_SIZE 筆尚未寫入的事件時，新事件直接丟棄並計入
+dropped，寫入跟不上時不會佔用無上限的記憶體，也不會拖慢請求。
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, Sequence
+
+from pt1_server.services.config import env_int
+from pt1_server.services.providers import get_command_manager
+
+
+class AuditRecord(NamedTuple):
+    """middleware 送出的原始事件；client 在寫入時才解析"""
+
+    created_at: float
+    event: str
+    status_code: int
+    stable_id: Optional[str]  # 由 query string 或路徑取得
+    command_id: Optional[str]  # 路徑中的 command_id
+    json_stable_id: Optional[str]
+    json_command_id: Optional[str]
+    detail_args: Sequence[str]
+
+
+class AuditWriter:
+    """以背景 thread 批次寫入 client API 事件"""
+
+    def __init__(
+        self,
+        cmd_manager,
+        queue_size: int = 10000,
+        flush_interval: float = 0.1,
+        log_path: Optional[str] = None,
+        log_max_bytes: int = 100 * 1024 * 1024,
+    ):
+        self.cmd_manager = cmd_manager
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+
+        self._queue: Deque[AuditRecord] = deque()
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+
+        # drain 可能同時由背景 thread 與 flush() 呼叫，以 lock 保持寫入順序
+        self._drain_lock = threading.Lock()
+        self._log_file = None
+        self._stop = threading.Event()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="pt1-audit-writer", daemon=True
+        )
+        self._writer.start()
+
+    # ---- request path ------------------------------------------------------
+
+    def submit(self, record: AuditRecord) -> bool:
+        """放入佇列；佇列已滿時丟棄並返回 False"""
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            return False
+        self._queue.append(record)
+        self.submitted += 1
+        return True
+
+    # ---- writer ------------------------------------------------------------
+
+    def _resolve_stable_id(self, record: AuditRecord) -> Optional[str]:
+        """與原本 middleware 相同的優先順序：路徑 command > JSON client > JSON command"""
+        stable_id = record.stable_id
+        if record.command_id:
+            command_info = self.cmd_manager.get_command(record.command_id)
+            if command_info:
+                stable_id = command_info.stable_id
+        if record.json_stable_id:
+            stable_id = record.json_stable_id
+        if record.json_command_id:
+            command_info = self.cmd_manager.get_command(record.json_command_id)
+            if command_info:
+                stable_id = command_info.stable_id
+        return stable_id
+
+    def drain(self) -> int:
+        """寫入目前佇列中的所有事件，返回寫入筆數"""
+        with self._drain_lock:
+            count = len(self._queue)
+            if not count:
+                return 0
+            batch = [self._queue.popleft() for _ in range(count)]
+
+            entries = [
+                (
+                    self._resolve_stable_id(record),
+                    record.event,
+                    record.status_code,
+                    "&".join(record.detail_args),
+                    record.created_at,
+                )
+                for record in batch
+            ]
+            event_ids = self.cmd_manager.client_events.append_many(entries)
+
+            if self.log_path:
+                try:
+                    self._write_log(entries, event_ids)
+                except OSError as e:
+                    print(f"[Audit] ERROR: Failed to write {self.log_path}: {e}")
+
+            self.written += count
+            self.batches += 1
+            return count
+
+    def _write_log(self, entries: List[tuple], event_ids: List[str]):
+        lines = []
+        for (stable_id, event, status_code, detail, created_at), event_id in zip(
+            entries, event_ids
+        ):
+            lines.append(
+                json.dumps(
+                    {
+                        "event_id": event_id,
+                        "stable_id": stable_id or "unknown",
+                        "created_at": created_at,
+                        "event": event,
+                        "status_code": status_code,
+                        "detail": detail,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "a", encoding="utf-8")
+        self._log_file.write("\n".join(lines) + "\n")
+        self._log_file.flush()
+
+        if self._log_file.tell() >= self.log_max_bytes:
+            self._log_file.close()
+            self._log_file = None
+            os.replace(self.log_path, self.log_path + ".1")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"[Audit] ERROR: Failed to write batch: {e}")
+
+    def flush(self):
+        """立即寫入佇列中的事件（讀取 client 事件前呼叫）"""
+        self.drain()
+
+    def close(self):
+        self._stop.set()
+        self._writer.join(timeout=5)
+        self.drain()
+        with self._drain_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+        }
+
+
+def create_audit_writer() -> AuditWriter:
+    """依環境變數建立 AuditWriter"""
+    return AuditWriter(
+        get_command_manager(),
+        queue_size=env_int("PT1_AUDIT_QUEUE_SIZE", 10000),
+        flush_interval=env_int("PT1_AUDIT_FLUSH_MS", 100) / 1000,
+        log_path=os.getenv("PT1_AUDIT_LOG") or None,
+        log_max_bytes=env_int("PT1_AUDIT_LOG_MAX_MB", 100) * 1024 * 1024,
+    )
+
+
+# Global instance
+_audit_writer = None
+_audit_writer_lock = threading.Lock()
+
+
+def get_audit_writer() -> AuditWriter:
+    """取得 AuditWriter 單例"""
+    global _audit_writer
+    if _audit_writer is None:
+        with _audit_writer_lock:
+            if _audit_writer is None:
+                _audit_writer = create_audit_writer()
+    return _audit_writer
@@ -0,0 +1,186 @@
+"""
+Client API call event log
+
+為 client_history middleware 記錄的 API 呼叫事件提供獨立、有上限的儲存空間，
+避免 polling 產生的事件與真正的 command 一起塞進 CommandManager.command_history。
+
+- 每個 client 一個 ring buffer（容量由 PT1_CLIENT_EVENT_CAPACITY 設定）
+- 所有 client 共用一個記憶體上限（PT1_CLIENT_EVENT_MAX_BYTES），超過時淘汰最舊的事件
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional
+
+from .config import env_int
+
+# 每筆事件的固定成本估計（tuple + float + int + 字串物件 header）
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def default_client_event_capacity() -> int:
+    """每個 client 保留的事件數量（預設 200 筆）"""
+    return env_int("PT1_CLIENT_EVENT_CAPACITY", 200)
+
+
+def default_client_event_max_bytes() -> int:
+    """所有 client 事件的記憶體上限（預設 16 MB）"""
+    return env_int("PT1_CLIENT_EVENT_MAX_BYTES", 16 * 1024 * 1024)
+
+
+class ClientEvent(NamedTuple):
+    seq: int
+    event_id: str
+    stable_id: str
+    created_at: float
+    event: str
+    status_code: int
+    detail: str
+
+    @property
+    def size(self) -> int:
+        return _ENTRY_OVERHEAD_BYTES + len(self.event) + len(self.detail)
+
+    def to_history_entry(self) -> dict:
+        """轉成與 CommandInfo 相同欄位的 dict，供 /command_history 合併輸出"""
+        return {
+            "command_id": self.event_id,
+            "stable_id": self.stable_id,
+            "command": self.event,
+            "created_at": self.created_at,
+            "scheduled_at": None,
+            "finished_at": self.created_at,
+            "status": f"client_call_{self.status_code}",
+            "result": self.detail,
+            "result_type": "text",
+            "files": [],
+        }
+
+
+class ClientEventLog:
+    """有上限的 client API 呼叫事件記錄
+
+    middleware 在 event loop 寫入，/command_history 在 threadpool 讀取，
+    因此以一個 lock 保護 deque。
+    """
+
+    def __init__(
+        self, capacity_per_client: Optional[int] = None, max_bytes: Optional[int] = None
+    ):
+        self.capacity_per_client = (
+            capacity_per_client or default_client_event_capacity()
+        )
+        self.max_bytes = max_bytes or default_client_event_max_bytes()
+        self._events: Dict[str, Deque[ClientEvent]] = {}
+        # 全域 FIFO（seq, stable_id），用來在超過記憶體上限時找出最舊的事件
+        self._order: Deque[tuple] = deque()
+        self._seq = itertools.count()
+        self.total_bytes = 0
+        self.total_events = 0
+        self.evicted_events = 0
+        self._lock = threading.Lock()
+
+    def _new_entry(
+        self,
+        stable_id: Optional[str],
+        event: str,
+        status_code: int,
+        detail: str,
+        created_at: Optional[float],
+    ) -> ClientEvent:
+        return ClientEvent(
+            seq=next(self._seq),
+            event_id=str(uuid.uuid4())[:8],
+            stable_id=stable_id or "unknown",
+            created_at=created_at or time.time(),
+            event=event,
+            status_code=status_code,
+            detail=detail or "",
+        )
+
+    def _insert(self, entry: ClientEvent):
+        """加入一筆事件（呼叫者必須持有 _lock）"""
+        stable_id = entry.stable_id
+        events = self._events.get(stable_id)
+        if events is None:
+            events = deque()
+            self._events[stable_id] = events
+        if len(events) >= self.capacity_per_client:
+            self._drop(events.popleft())
+
+        events.append(entry)
+        self._order.append((entry.seq, stable_id))
+        self.total_bytes += entry.size
+        self.total_events += 1
+
+        while self.total_bytes > self.max_bytes and self._order:
+            self._evict_oldest()
+
+        # 被 ring buffer 淘汰的事件仍留在 _order 中，數量過多時重建
+        if len(self._order) > 2 * self.total_events + 1024:
+            self._order = deque(
+                (e.seq, e.stable_id)
+                for e in heapq.merge(*self._events.values(), key=lambda e: e.seq)
+            )
+
+    def append(
+        self,
+        stable_id: Optional[str],
+        event: str,
+        status_code: int,
+        detail: str = "",
+        created_at: Optional[float] = None,
+    ) -> str:
+        """新增一筆事件，返回 event ID"""
+        entry = self._new_entry(stable_id, event, status_code, detail, created_at)
+        with self._lock:
+            self._insert(entry)
+        return entry.event_id
+
+    def append_many(self, records: Iterable[tuple]) -> List[str]:
+        """
+        一次新增多筆事件（只取得一次 lock），返回 event ID 列表
+
+        Args:
+            records: (stable_id, event, status_code, detail, created_at) tuple
+        """
+        entries = [self._new_entry(*record) for record in records]
+        with self._lock:
+            for entry in entries:
+                self._insert(entry)
+        return [entry.event_id for entry in entries]
+
+    def _drop(self, entry: ClientEvent):
+        self.total_bytes -= entry.size
+        self.total_events -= 1
+        self.evicted_events += 1
+
+    def _evict_oldest(self):
+        seq, stable_id = self._order.popleft()
+        events = self._events.get(stable_id)
+        if events and events[0].seq == seq:
+            self._drop(events.popleft())
+            if not events:
+                del self._events[stable_id]
+
+    def count(self, stable_id: Optional[str] = None) -> int:
+        """事件數量（可依 client 過濾）"""
+        if stable_id is None:
+            return self.total_events
+        return len(self._events.get(stable_id, ()))
+
+    def recent(self, stable_id: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """取得最新的事件（新到舊），格式與 CommandInfo 相同"""
+        with self._lock:
+            if stable_id is not None:
+                sources = [reversed(self._events.get(stable_id, ()))]
+            else:
+                sources = [reversed(events) for events in self._events.values()]
+
+            newest_first = heapq.merge(*sources, key=lambda e: e.seq, reverse=True)
+            entries = list(itertools.islice(newest_first, limit))
+        return [e.to_history_entry() for e in entries]
@@ -1,21 +1,84 @@
+"""
+Client API history middleware
+
+每個 client API 呼叫記錄為一筆 client event（`pt1 history -v`）。
+
+JSON body（POST/PUT/PATCH）由 middleware 一次讀完後以單一 message 交給 route，
+並且只解碼與解析一次：
+- 不超過 PT1_HISTORY_JSON_MAX_BYTES（預設 256 KiB）的 body 由 middleware 解析，
+  結果放在 request.state.json_body，route 以 read_json_body() 取用，不再重新解析
+- 更大的 body 不在 middleware 解析；route 以 read_json_body() 解析後，middleware
+  在請求結束時由 request.state 取得 client_id / command_id 等欄位
+
+AuditPolicy（services/audit_policy.py）依 route 取樣率與 client 頻率限制決定
+是否記錄；要記錄的事件由 AuditWriter（services/audit_writer.py）在背景批次
+寫入，請求路徑上只有一次 enqueue。
+"""
+
 import json
-from typing import Optional, Callable, Awaitable
+import time
+from typing import Any, Callable, Awaitable, Tuple
 
 from fastapi import Request, HTTPException
 
-from pt1_server.services.providers import get_command_manager
+from pt1_server.services.audit_policy import get_audit_policy
+from pt1_server.services.audit_writer import AuditRecord, get_audit_writer
+from pt1_server.services.config import env_int
+
+JSON_BODY_STATE = "json_body"
+
+
+def json_parse_max_bytes() -> int:
+    """middleware 會預先解析的 JSON body 大小上限"""
+    return env_int("PT1_HISTORY_JSON_MAX_BYTES", 256 * 1024, minimum=0)
+
+
+def decode_body(body: bytes, path: str = "") -> Tuple[str, bool]:
+    """
+    解碼 request body，處理非 UTF-8 編碼（如 Windows-1252）
+
+    Returns:
+        (text, is_utf8)；UTF-8 解碼失敗時以 latin-1 解碼（可處理所有單 byte，不會失敗）
+    """
+    try:
+        return body.decode("utf-8"), True
+    except UnicodeDecodeError as e:
+        print(f"[DEBUG] UnicodeDecodeError on {path}: {e}")
+        print(f"[DEBUG] Raw body (first 500 bytes): {body[:500]!r}")
+        return body.decode("latin-1"), False
+
+
+async def read_json_body(request: Request) -> Any:
+    """
+    取得 request 的 JSON payload
+
+    middleware 已解析時直接返回；否則讀取 body 解析一次，並留在 request.state
+    供 middleware 記錄 client event。
+
+    Raises:
+        json.JSONDecodeError: body 不是有效的 JSON
+    """
+    data = getattr(request.state, JSON_BODY_STATE, None)
+    if data is None:
+        body_str, _ = decode_body(await request.body(), request.url.path)
+        data = json.loads(body_str)
+        setattr(request.state, JSON_BODY_STATE, data)
+    return data
 
 
 def _extract_command_id(path_parts: list[str]) -> str:
     if len(path_parts) < 2:
         return ""
-    if (
-        path_parts[1] in {"upload_files", "get_result", "list_files"}
-        and len(path_parts) >= 3
-    ):
-        return path_parts[2]
-    if path_parts[1] == "download_file" and len(path_parts) >= 3:
-        return path_parts[2]
+    if path_parts[0] in {
+        "upload_files",
+        "get_result",
+        "list_files",
+        "download_file",
+        "uploads",
+    }:
+        return path_parts[1]
+    if path_parts[0] == "artifacts" and len(path_parts) >= 3:
+        return path_parts[1]
     return ""
 
 
@@ -43,6 +106,14 @@ def _collect_query_args(request: Request) -> list[str]:
     return args
 
 
+def _batch_results(data: dict) -> list[dict]:
+    """/submit_results 的 results 列表（忽略格式不對的項目）"""
+    results = data.get("results")
+    if not isinstance(results, list):
+        return []
+    return [r for r in results if isinstance(r, dict)]
+
+
 def _safe_json_args(path: str, data: dict) -> list[str]:
     args = []
     if path == "/register_client":
@@ -59,6 +130,14 @@ def _safe_json_args(path: str, data: dict) -> list[str]:
                 args.append(f"{key}={_truncate_value(str(value))}")
         return args
 
+    if path == "/submit_results":
+        results = _batch_results(data)
+        command_ids = ",".join(str(r.get("command_id", "")) for r in results)
+        args.append(f"count={len(results)}")
+        if command_ids:
+            args.append(f"command_ids={_truncate_value(command_ids)}")
+        return args
+
     for key in ("client_id", "stable_id", "command_id", "limit"):
         value = data.get(key)
         if value:
@@ -70,9 +149,12 @@ def _safe_json_args(path: str, data: dict) -> list[str]:
 def client_history_middleware_factory() -> (
     Callable[[Request, Callable[..., Awaitable]], Awaitable]
 ):
+    # AuditWriter 在第一次記錄時才建立：它會建立 CommandManager 與 state store，
+    # 在 import 時建立會讓 PT1_WORKERS>1 的父 process 也建立一個非 shared 的實例
+    max_parse_bytes = json_parse_max_bytes()
+
     async def log_client_calls(request: Request, call_next: Callable[..., Awaitable]):
         path = request.url.path
-        cmd_manager = get_command_manager()
         method = request.method
         stable_id = None
         detail_args: list[str] = []
@@ -93,71 +175,73 @@ def client_history_middleware_factory() -> (
         command_id = _extract_command_id(path_parts)
         if command_id:
             detail_args.append(f"command_id={_truncate_value(command_id)}")
-            command_info = cmd_manager.get_command(command_id)
-            if command_info:
-                stable_id = command_info.stable_id
 
-        data = {}
-        body = b""
         content_type = request.headers.get("content-type", "")
         if method in {"POST", "PUT", "PATCH"} and "application/json" in content_type:
+            # 一次讀完 body 再以單一 message 交給 route，避免逐 chunk 經過 middleware
             body = await request.body()
-            if body:
-                # 先解碼 bytes 為 str，處理非 UTF-8 編碼（如 Windows-1252）
+            if body and len(body) <= max_parse_bytes:
+                body_str, is_utf8 = decode_body(body, path)
+                if not is_utf8:
+                    # 確保下游收到的 body 是 UTF-8 編碼
+                    body = body_str.encode("utf-8")
                 try:
-                    body_str = body.decode("utf-8")
-                except UnicodeDecodeError as e:
-                    # latin-1 可處理所有單 byte (0x00-0xFF)，不會失敗
-                    body_str = body.decode("latin-1")
-                    print(f"[DEBUG] UnicodeDecodeError on {path}: {e}")
-                    print(f"[DEBUG] Raw body (first 500 bytes): {body[:500]!r}")
-                # 無論 JSON 是否有效，都確保 body 是 UTF-8 編碼
-                body = body_str.encode("utf-8")
-                try:
-                    data = json.loads(body_str)
+                    setattr(request.state, JSON_BODY_STATE, json.loads(body_str))
                 except json.JSONDecodeError as e:
                     print(f"[DEBUG] JSONDecodeError on {path}: {e}")
                     print(f"[DEBUG] body_str (first 500 chars): {body_str[:500]!r}")
-                    data = {}
-
-            json_stable_id = data.get("client_id") or data.get("stable_id")
-            if json_stable_id:
-                stable_id = json_stable_id
-
-            json_command_id = data.get("command_id")
-            if json_command_id:
-                command_info = cmd_manager.get_command(json_command_id)
-                if command_info:
-                    stable_id = command_info.stable_id
-                else:
-                    stable_id = (
-                        stable_id or data.get("client_id") or data.get("stable_id")
-                    )
-
-            detail_args.extend(_safe_json_args(path, data))
 
             async def receive():
                 return {"type": "http.request", "body": body}
 
             request = Request(request.scope, receive)
 
-        detail = "&".join(detail_args)
+        def log_event(status_code: int):
+            # 較大的 body 由 route 解析，因此在請求結束後才取得 JSON 欄位；
+            # command_id 對應的 client 由 audit writer 在背景解析
+            data = getattr(request.state, JSON_BODY_STATE, None)
+            json_stable_id = json_command_id = None
+            if isinstance(data, dict):
+                json_stable_id = data.get("client_id") or data.get("stable_id")
+                json_command_id = data.get("command_id")
+                if path == "/submit_results":
+                    # 整批結果屬於同一個 client，以第一個命令對應 client
+                    results = _batch_results(data)
+                    json_command_id = results[0].get("command_id") if results else None
+
+            # router 匹配後會把 route 寫入同一個 scope
+            route = getattr(request.scope.get("route"), "path", None)
+            client_key = json_stable_id or stable_id
+            if not client_key and request.client:
+                client_key = request.client.host
+            if not get_audit_policy().should_log(route, status_code, client_key):
+                return
+
+            json_args = _safe_json_args(path, data) if isinstance(data, dict) else []
+            get_audit_writer().submit(
+                AuditRecord(
+                    time.time(),
+                    event_label,
+                    status_code,
+                    stable_id,
+                    command_id,
+                    json_stable_id,
+                    json_command_id,
+                    detail_args + json_args,
+                )
+            )
 
         try:
             response = await call_next(request)
         except HTTPException as exc:
-            cmd_manager.log_client_event(
-                stable_id, event_label, exc.status_code, detail
-            )
+            log_event(exc.status_code)
             raise
         except Exception:
-            cmd_manager.log_client_event(stable_id, event_label, 500, detail)
+            log_event(500)
             raise
 
         if not (path == "/next_command" and response.status_code == 200):
-            cmd_manager.log_client_event(
-                stable_id, event_label, response.status_code, detail
-            )
+            log_event(response.status_code)
         return response
 
     return log_client_calls
@@ -1,10 +1,37 @@
-from typing import Dict, Optional
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
 from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from enum import Enum
+import asyncio
+import heapq
+import threading
 import uuid
 import time
 
+from starlette.concurrency import run_in_threadpool
+
+from .client_event_log import ClientEventLog
+from .config import env_int
+from .notifier import KeyedNotifier
+from .search_index import KIND_RESULT, SearchIndex, get_search_index
+from .storage import StateStore, get_state_store, preload_limit
+
+# SharedStateStore change feed 的 channel（與 shared_state.py 相同）
+CHANGE_COMMAND = "command"
+CHANGE_STATUS = "status"
+
+
+def command_lease_seconds() -> int:
+    """派送後未確認的命令多久放回佇列（預設 120 秒，heartbeat 會延長）"""
+    return env_int("PT1_COMMAND_LEASE_SECONDS", 120)
+
+
+def lease_sweep_interval_seconds() -> int:
+    """背景檢查過期 lease 的間隔（預設 30 秒）"""
+    return env_int("PT1_LEASE_SWEEP_SECONDS", 30)
+
 
 class ResultType(Enum):
     TEXT = "text"
@@ -19,6 +46,7 @@ class FileInfo(BaseModel):
     size: int
     content_type: str
     upload_timestamp: float
+    sha256: Optional[str] = None
 
 
 class CommandInfo(BaseModel):
@@ -32,29 +60,135 @@ class CommandInfo(BaseModel):
     result: str = ""
     result_type: ResultType = ResultType.TEXT
     files: list[FileInfo] = []
+    # executing 命令的 lease 到期時間；到期前沒有 heartbeat 或結果就放回 pending
+    lease_expires_at: Optional[float] = None
 
 
 class CommandManager:
-    """統一管理所有 command 相關操作"""
-
-    def __init__(self):
+    """統一管理所有 command 相關操作
+
+    除了 command_history 之外，另外維護幾個索引讓 polling 路徑不必掃描整個歷史：
+    - _pending_queues: 每個 stable_id 一個 FIFO queue（依 queue 順序）
+    - _active_commands: 每個 stable_id 的 pending/executing command ID
+    - _executing: 所有 executing command ID
+
+    所有狀態變更都必須經過 _set_status()，以保持索引與 command_history 一致。
+    修改索引的操作都持有 _lock：sync endpoint 在 threadpool 中執行，
+    claim_next() 的「取出 pending → 標記 executing」必須是原子操作，
+    同一個命令才不會被兩個重疊的 poll 同時取得。
+
+    claim_next() 派送的命令帶有 lease（PT1_COMMAND_LEASE_SECONDS）。client 以
+    heartbeat 延長（renew_leases()），送出結果即確認；lease 過期的命令由
+    requeue_expired_leases() 放回 pending，重新派送。
+
+    變更會寫入 StateStore（預設不保存；PT1_STATE_BACKEND=sqlite 時寫入 SQLite），
+    啟動時從 store 載入未完成與最近的命令。直接修改 CommandInfo 欄位
+    （例如 files）後需呼叫 save_command()。
+    """
+
+    ACTIVE_STATUSES = ("pending", "executing")
+
+    def __init__(
+        self,
+        store: Optional[StateStore] = None,
+        search_index: Optional[SearchIndex] = None,
+    ):
         self.command_history: Dict[str, CommandInfo] = {}
-        # 移除 command_queues，所有狀態都透過 command_history 管理
+        self._lock = threading.RLock()
+        self.lease_seconds = command_lease_seconds()
+        self._pending_queues: Dict[str, Deque[str]] = {}
+        self._active_commands: Dict[str, Set[str]] = {}
+        # dict 保留插入順序，等同於依 scheduled_at 排序的集合
+        self._executing: Dict[str, None] = {}
+        # (lease_expires_at, command_id) 的 min-heap；續約時加入新項目，
+        # 舊項目在到期時檢查 CommandInfo 的 lease_expires_at 後丟棄
+        self._leases: List[Tuple[float, str]] = []
+        # client API 呼叫事件獨立存放，不與真正的 command 混在一起
+        self.client_events = ClientEventLog()
+        # 依 stable_id 喚醒 long-polling 中的 /next_command
+        self.command_waiters = KeyedNotifier()
+        # 依 command_id 通知狀態變化（/command_events 串流使用）
+        self.status_waiters = KeyedNotifier()
+
+        self.store = store if store is not None else get_state_store()
+        # 完成的命令結果寫入全文搜尋索引
+        self.search_index = (
+            search_index if search_index is not None else get_search_index()
+        )
+        for data in self.store.load_commands(preload_limit()):
+            self._restore(CommandInfo(**data))
+
+    def _restore(self, command_info: CommandInfo):
+        """把從 store 載入的命令放回 command_history 並重建索引"""
+        command_id = command_info.command_id
+        stable_id = command_info.stable_id
+        self.command_history[command_id] = command_info
+        if command_info.status in self.ACTIVE_STATUSES:
+            self._active_commands.setdefault(stable_id, set()).add(command_id)
+        if command_info.status == "pending":
+            self._pending_queues.setdefault(stable_id, deque()).append(command_id)
+        elif command_info.status == "executing":
+            self._executing[command_id] = None
+            if command_info.lease_expires_at is not None:
+                heapq.heappush(
+                    self._leases, (command_info.lease_expires_at, command_id)
+                )
 
     def _generate_short_id(self) -> str:
         """產生簡短的 command ID（使用 UUID 前 8 字元）"""
         return str(uuid.uuid4())[:8]
 
+    def _set_status(self, command_info: CommandInfo, status: str):
+        """更新 command 狀態並同步維護索引"""
+        command_id = command_info.command_id
+        stable_id = command_info.stable_id
+        previous = command_info.status
+        command_info.status = status
+        if status == "executing":
+            if previous != "executing":
+                command_info.scheduled_at = command_info.scheduled_at or time.time()
+                command_info.lease_expires_at = time.time() + self.lease_seconds
+        else:
+            command_info.lease_expires_at = None
+        self.store.save_command(command_info)
+        if previous != status:
+            self.status_waiters.notify(command_id)
+
+        if previous == "executing" and status != "executing":
+            self._executing.pop(command_id, None)
+
+        if status in self.ACTIVE_STATUSES:
+            self._active_commands.setdefault(stable_id, set()).add(command_id)
+        elif previous in self.ACTIVE_STATUSES:
+            active = self._active_commands.get(stable_id)
+            if active is not None:
+                active.discard(command_id)
+                if not active:
+                    del self._active_commands[stable_id]
+
+        if status == "pending" and previous != "pending":
+            self._pending_queues.setdefault(stable_id, deque()).append(command_id)
+            self.command_waiters.notify(stable_id)
+        elif status == "executing" and previous != "executing":
+            self._executing[command_id] = None
+            heapq.heappush(self._leases, (command_info.lease_expires_at, command_id))
+        # 離開 pending 的命令不立即從 deque 移除，由 get_next_pending_command_id 延遲清除
+
     def get_pending_commands_count(self, stable_id: str) -> int:
         """取得 client 的 pending/executing 命令數量"""
-        count = 0
-        for command_info in self.command_history.values():
-            if command_info.stable_id == stable_id and command_info.status in [
-                "pending",
-                "executing",
-            ]:
-                count += 1
-        return count
+        return len(self._active_commands.get(stable_id, ()))
+
+    def active_command_counts(self) -> Dict[str, Dict[str, int]]:
+        """每個 client 的 pending / executing 命令數（只走訪 active 命令）"""
+        counts = {}
+        for stable_id, command_ids in list(self._active_commands.items()):
+            client_counts = {status: 0 for status in self.ACTIVE_STATUSES}
+            for command_id in list(command_ids):
+                command_info = self.command_history.get(command_id)
+                if command_info is not None and command_info.status in client_counts:
+                    client_counts[command_info.status] += 1
+            counts[stable_id] = client_counts
+        return counts
 
     def queue_command(self, stable_id: str, command: str) -> str:
         """排隊新的 command（允許多個並行命令）"""
@@ -70,31 +204,34 @@ class CommandManager:
             status="pending",
         )
 
-        # 儲存到 command history
-        self.command_history[command_id] = command_info
-
-        # 不再需要 command_queues，所有命令都透過 command_history 管理
+        # 儲存到 command history，並放入該 client 的 FIFO queue
+        with self._lock:
+            self.command_history[command_id] = command_info
+            self._pending_queues.setdefault(stable_id, deque()).append(command_id)
+            self._active_commands.setdefault(stable_id, set()).add(command_id)
+            self.store.save_command(command_info)
+        self.command_waiters.notify(stable_id)
 
         return command_id
 
     def get_next_pending_command_id(self, stable_id: str) -> Optional[str]:
         """取得 client 的下一個 pending command ID（按時間順序）"""
-        # 找出所有該 client 的 pending 命令，按時間排序
-        pending_commands = []
-
-        for command_id, command_info in self.command_history.items():
-            if command_info.stable_id == stable_id and command_info.status == "pending":
-                pending_commands.append((command_info.created_at, command_id))
-
-        if not pending_commands:
+        with self._lock:
+            queue = self._pending_queues.get(stable_id)
+            if not queue:
+                return None
+
+            # 清除已不再是 pending 的項目（例如被直接標記為 completed）
+            while queue:
+                command_id = queue[0]
+                command_info = self.command_history.get(command_id)
+                if command_info is not None and command_info.status == "pending":
+                    return command_id
+                queue.popleft()
+
+            del self._pending_queues[stable_id]
             return None
 
-        # 按時間排序，取最早的
-        pending_commands.sort()
-        _, earliest_command_id = pending_commands[0]
-
-        return earliest_command_id
-
     def get_next_command(self, stable_id: str) -> Optional[tuple]:
         """取得 client 的下一個 pending 命令（返回 command, command_id）"""
         command_id = self.get_next_pending_command_id(stable_id)
@@ -104,6 +241,104 @@ class CommandManager:
         command_info = self.command_history[command_id]
         return command_info.command, command_id
 
+    def claim_next(self, stable_id: str) -> Optional[CommandInfo]:
+        """
+        取出 client 的下一個 pending 命令並標記為 executing（派送時使用）
+
+        整個操作持有 _lock，每個命令只會被一個呼叫端取得；先把 lease 已過期的
+        命令放回佇列，讓它們依建立順序重新派送。
+        """
+        with self._lock:
+            self.requeue_expired_leases()
+            command_id = self.get_next_pending_command_id(stable_id)
+            if not command_id:
+                return None
+
+            command_info = self.command_history[command_id]
+            self._set_status(command_info, "executing")
+            return command_info
+
+    def claim_batch(self, stable_id: str, limit: int) -> List[CommandInfo]:
+        """依 queue 順序取出最多 limit 個 pending 命令並標記為 executing"""
+        claimed = []
+        with self._lock:
+            while len(claimed) < limit:
+                command_info = self.claim_next(stable_id)
+                if command_info is None:
+                    break
+                claimed.append(command_info)
+        return claimed
+
+    def renew_leases(self, stable_id: str) -> int:
+        """延長 client 所有 executing 命令的 lease（heartbeat 時呼叫），返回命令數"""
+        lease_expires_at = time.time() + self.lease_seconds
+        renewed = 0
+        with self._lock:
+            for command_id in list(self._active_commands.get(stable_id, ())):
+                command_info = self.command_history.get(command_id)
+                if command_info is not None and command_info.status == "executing":
+                    command_info.lease_expires_at = lease_expires_at
+                    heapq.heappush(self._leases, (lease_expires_at, command_id))
+                    self.store.save_command(command_info)
+                    renewed += 1
+        return renewed
+
+    def requeue_expired_leases(self) -> List[str]:
+        """
+        把 lease 已過期的 executing 命令放回 pending
+
+        只檢查 _leases 中已到期的項目，沒有命令過期時成本為 O(1)。
+
+        Returns:
+            放回佇列的 command ID
+        """
+        now = time.time()
+        requeued = []
+        with self._lock:
+            while self._leases and self._leases[0][0] < now:
+                _, command_id = heapq.heappop(self._leases)
+                command_info = self.command_history.get(command_id)
+                if (
+                    command_info is None
+                    or command_info.status != "executing"
+                    or command_info.lease_expires_at is None
+                    or command_info.lease_expires_at >= now
+                ):
+                    # 已完成或已續約（續約時另外加入了新項目）
+                    continue
+                command_info.scheduled_at = None
+                self._set_status(command_info, "pending")
+                requeued.append(command_id)
+
+            # 放回的命令排在佇列尾端，依建立時間重新排序以維持 FIFO
+            # （同時清除已不是 pending 的項目）
+            for client_id in {self.command_history[c].stable_id for c in requeued}:
+                pending = [
+                    self.command_history[c]
+                    for c in self._pending_queues[client_id]
+                    if c in self.command_history
+                    and self.command_history[c].status == "pending"
+                ]
+                pending.sort(key=lambda command_info: command_info.created_at)
+                self._pending_queues[client_id] = deque(
+                    command_info.command_id for command_info in pending
+                )
+        return requeued
+
+    async def run_lease_sweeper(self):
+        """背景 task：定期把 lease 過期（client 失聯）的命令放回佇列"""
+        while True:
+            await asyncio.sleep(lease_sweep_interval_seconds())
+            try:
+                requeued = await run_in_threadpool(self.requeue_expired_leases)
+                if requeued:
+                    print(
+                        f"[Commands] Requeued {len(requeued)} command(s) "
+                        f"with expired lease: {', '.join(requeued)}"
+                    )
+            except Exception as e:
+                print(f"[Commands] Lease sweeper error: {e}")
+
     def complete_command(
         self, command_id: str, result: str, status: str, result_type: ResultType
     ) -> bool:
@@ -112,37 +347,108 @@ class CommandManager:
             return False
 
         # 更新 command 資訊
-        command_info = self.command_history[command_id]
-        command_info.result = result
-        command_info.status = status
-        command_info.result_type = result_type
-        command_info.finished_at = time.time()
-
-        # 不需要從 queue 中移除，因為 get_pending_commands_count 會自動清理
+        with self._lock:
+            command_info = self.command_history[command_id]
+            command_info.result = result
+            command_info.result_type = result_type
+            command_info.finished_at = time.time()
+            self._set_status(command_info, status)
+        self.search_index.add_result(command_info)
 
         return True
 
     def get_command(self, command_id: str) -> Optional[CommandInfo]:
-        """取得 command 資訊"""
-        return self.command_history.get(command_id)
+        """取得 command 資訊（不在記憶體中時從 store 讀取）"""
+        command_info = self.command_history.get(command_id)
+        if command_info is None:
+            data = self.store.get_command(command_id)
+            if data is not None:
+                command_info = CommandInfo(**data)
+                self._restore(command_info)
+        return command_info
+
+    def save_command(self, command_info: CommandInfo):
+        """直接修改 CommandInfo 欄位後，把變更寫入 store"""
+        self.store.save_command(command_info)
+
+    def list_commands(
+        self, stable_id: Optional[str] = None, limit: int = 50
+    ) -> Tuple[List[CommandInfo], int]:
+        """由新到舊列出命令，返回 (最多 limit 筆, 總數)"""
+        history = list(self.command_history.values())
+        if stable_id:
+            history = [cmd for cmd in history if cmd.stable_id == stable_id]
+        history.sort(key=lambda x: x.created_at, reverse=True)
+        return history[:limit], len(history)
+
+    def command_count(self) -> int:
+        """目前保存的命令數量"""
+        return len(self.command_history)
+
+    @staticmethod
+    def _files_result_type(result: str, file_count: int) -> ResultType:
+        """有檔案的命令的 result_type"""
+        if result:
+            return ResultType.MIXED
+        return ResultType.FILES if file_count > 1 else ResultType.FILE
+
+    def attach_files(self, command_info: CommandInfo, files: list[FileInfo]):
+        """把上傳完成的檔案加入 command，依檔案數量更新 result_type 並寫入 store"""
+        command_info.files.extend(files)
+        if command_info.files:
+            command_info.result_type = self._files_result_type(
+                command_info.result, len(command_info.files)
+            )
+        self.save_command(command_info)
+
+    def clear_files(self, command_id: str):
+        """結果檔案已被刪除（retention）時清空 command 的檔案列表"""
+        command_info = self.get_command(command_id)
+        if command_info is not None and command_info.files:
+            command_info.files = []
+            self.save_command(command_info)
+
+    def evict_command(self, command_id: str, delete: bool = True) -> bool:
+        """
+        從記憶體移除已完成的命令
+
+        Args:
+            command_id: Command ID
+            delete: True 時一併從 store 與搜尋索引刪除；False 只釋放記憶體
+                    （persistent store 仍可由 get_command() 讀回）
+
+        Returns:
+            True 表示已移除；pending/executing 命令不會被移除
+        """
+        with self._lock:
+            command_info = self.command_history.get(command_id)
+            if command_info is not None:
+                if command_info.status in self.ACTIVE_STATUSES:
+                    return False
+                del self.command_history[command_id]
+        if delete:
+            self.store.delete_commands([command_id])
+            self.search_index.remove(KIND_RESULT, command_id)
+        return command_info is not None or delete
 
     def update_command_status(self, command_id: str, status: str) -> bool:
         """更新 command 狀態"""
         if command_id not in self.command_history:
             return False
 
-        command_info = self.command_history[command_id]
-        command_info.status = status
-
-        # 當狀態變成 executing 時，記錄 scheduled_at
-        if status == "executing" and command_info.scheduled_at is None:
-            command_info.scheduled_at = time.time()
+        # 當狀態變成 executing 時，_set_status 會記錄 scheduled_at 與 lease
+        with self._lock:
+            self._set_status(self.command_history[command_id], status)
 
         return True
 
     def check_timed_out_commands(self, timeout_seconds: int = 120) -> list:
         """檢查已超時的命令（2 分鐘內未完成的 executing 狀態命令）
 
+        只掃描 _executing（executing 命令），不掃描整個 command_history。
+        _executing 不保證依 scheduled_at 排序（啟動時依 created_at 順序載入），
+        因此檢查每一個命令。
+
         參數：
             timeout_seconds: 命令超時秒數（預設 120 秒）
 
@@ -152,38 +458,220 @@ class CommandManager:
         now = time.time()
         timed_out = []
 
-        for command_id, command_info in self.command_history.items():
-            if command_info.status == "executing" and command_info.scheduled_at:
+        # 在 lock 中掃描：lease 到期重新排隊會同時把 scheduled_at 設為 None
+        with self._lock:
+            for command_id in self._executing:
+                command_info = self.command_history.get(command_id)
+                if (
+                    command_info is None
+                    or command_info.status != "executing"
+                    or command_info.scheduled_at is None
+                ):
+                    continue
                 elapsed = now - command_info.scheduled_at
-                if elapsed > timeout_seconds:
-                    timed_out.append(
-                        {
-                            "command_id": command_id,
-                            "stable_id": command_info.stable_id,
-                            "command": command_info.command,
-                            "elapsed": elapsed,
-                        }
-                    )
+                if elapsed <= timeout_seconds:
+                    continue
+                timed_out.append(
+                    {
+                        "command_id": command_id,
+                        "stable_id": command_info.stable_id,
+                        "command": command_info.command,
+                        "elapsed": elapsed,
+                    }
+                )
 
         return timed_out
 
     def log_client_event(
         self, stable_id: Optional[str], event: str, status_code: int, detail: str = ""
     ) -> str:
-        """Log a client API call as history event."""
-        event_id = self._generate_short_id()
-        created_at = time.time()
-        status = f"client_call_{status_code}"
+        """Log a client API call as history event.
+
+        Events go to the bounded ClientEventLog, not command_history.
+        """
+        return self.client_events.append(stable_id, event, status_code, detail)
+
+
+class SharedCommandManager(CommandManager):
+    """多 worker 模式（PT1_STATE_BACKEND=shared）的 CommandManager
+
+    命令只存在共用的 SharedStateStore，不在記憶體保存 command_history 與索引，
+    每個操作直接讀寫 store，所有 worker 看到相同的佇列：
+
+    - claim_next() 在同一個 transaction 中放回 lease 過期的命令、取出並標記
+      executing，同一個命令不會被兩個 worker 派送
+    - 狀態只更新變動的欄位，不會以舊資料覆蓋其他 worker 寫入的結果或檔案
+    - 其他 worker 的變更經由 store 的 change feed 喚醒本 process 的
+      command_waiters / status_waiters
+    """
+
+    def __init__(
+        self,
+        store: Optional[StateStore] = None,
+        search_index: Optional[SearchIndex] = None,
+    ):
+        super().__init__(store, search_index)
+        self.store.add_change_listener(self._on_change)
+
+    def _on_change(self, channel: str, key: str):
+        """由 store 的 watcher thread 呼叫"""
+        if channel == CHANGE_COMMAND:
+            self.command_waiters.notify(key)
+        elif channel == CHANGE_STATUS:
+            self.status_waiters.notify(key)
+
+    def _set_status(
+        self, command_info: CommandInfo, status: str, columns: Tuple[str, ...] = ()
+    ):
+        command_id = command_info.command_id
+        stable_id = command_info.stable_id
+        previous = command_info.status
+        command_info.status = status
+        if status == "executing":
+            if previous != "executing":
+                command_info.scheduled_at = command_info.scheduled_at or time.time()
+                command_info.lease_expires_at = time.time() + self.lease_seconds
+        else:
+            command_info.lease_expires_at = None
+
+        changes = []
+        if previous != status:
+            changes.append((CHANGE_STATUS, command_id))
+        if status == "pending" and previous != "pending":
+            changes.append((CHANGE_COMMAND, stable_id))
+        self.store.update_command(
+            command_info,
+            ("status", "scheduled_at", "lease_expires_at") + columns,
+            changes,
+        )
+
+        # 本 process 的等待者立即喚醒，不等 change feed
+        if previous != status:
+            self.status_waiters.notify(command_id)
+        if status == "pending" and previous != "pending":
+            self.command_waiters.notify(stable_id)
+
+    def _load(self, data: Optional[dict]) -> Optional[CommandInfo]:
+        return CommandInfo(**data) if data is not None else None
+
+    def get_pending_commands_count(self, stable_id: str) -> int:
+        counts = self.store.active_command_counts(stable_id).get(stable_id, {})
+        return sum(counts.values())
+
+    def active_command_counts(self) -> Dict[str, Dict[str, int]]:
+        return self.store.active_command_counts()
 
+    def queue_command(self, stable_id: str, command: str) -> str:
         command_info = CommandInfo(
-            command_id=event_id,
-            stable_id=stable_id or "unknown",
-            command=event,
-            created_at=created_at,
-            finished_at=created_at,
-            status=status,
-            result=detail or "",
+            command_id=self._generate_short_id(),
+            stable_id=stable_id,
+            command=command,
+            created_at=time.time(),
+            status="pending",
+        )
+        self.store.save_command(command_info, [(CHANGE_COMMAND, stable_id)])
+        self.command_waiters.notify(stable_id)
+        return command_info.command_id
+
+    def get_next_pending_command_id(self, stable_id: str) -> Optional[str]:
+        data = self.store.next_pending_command(stable_id)
+        return data["command_id"] if data else None
+
+    def get_next_command(self, stable_id: str) -> Optional[tuple]:
+        data = self.store.next_pending_command(stable_id)
+        return (data["command"], data["command_id"]) if data else None
+
+    def claim_next(self, stable_id: str) -> Optional[CommandInfo]:
+        claimed = self.claim_batch(stable_id, 1)
+        return claimed[0] if claimed else None
+
+    def claim_batch(self, stable_id: str, limit: int) -> List[CommandInfo]:
+        rows, requeued = self.store.claim_next_commands(
+            stable_id, time.time(), self.lease_seconds, limit
         )
+        claimed = [CommandInfo(**data) for data in rows]
+        for command_id in requeued + [c.command_id for c in claimed]:
+            self.status_waiters.notify(command_id)
+        return claimed
+
+    def renew_leases(self, stable_id: str) -> int:
+        return self.store.renew_leases(stable_id, time.time() + self.lease_seconds)
+
+    def requeue_expired_leases(self) -> List[str]:
+        """lease 過期的命令放回 pending；其他 worker 由 change feed 喚醒"""
+        requeued = self.store.requeue_expired_leases(time.time())
+        for command_id, client_id in requeued:
+            self.status_waiters.notify(command_id)
+            self.command_waiters.notify(client_id)
+        return [command_id for command_id, _ in requeued]
 
-        self.command_history[event_id] = command_info
-        return event_id
+    def complete_command(
+        self, command_id: str, result: str, status: str, result_type: ResultType
+    ) -> bool:
+        command_info = self.get_command(command_id)
+        if command_info is None:
+            return False
+
+        command_info.result = result
+        command_info.result_type = result_type
+        command_info.finished_at = time.time()
+        self._set_status(command_info, status, ("result", "result_type", "finished_at"))
+        self.search_index.add_result(command_info)
+        return True
+
+    def get_command(self, command_id: str) -> Optional[CommandInfo]:
+        return self._load(self.store.get_command(command_id))
+
+    def save_command(self, command_info: CommandInfo):
+        """呼叫端只會修改 files 與 result_type，只寫入這兩個欄位"""
+        self.store.update_command(command_info, ("files", "result_type"))
+
+    def attach_files(self, command_info: CommandInfo, files: list[FileInfo]):
+        """在 store 的同一個 transaction 中加入檔案，不以本 worker 讀到的舊檔案
+        列表覆蓋其他 worker 同時加入的檔案"""
+        updated = self.store.append_command_files(
+            command_info.command_id,
+            [jsonable_encoder(file_info) for file_info in files],
+            lambda result, count: self._files_result_type(result, count).value,
+        )
+        if updated is None:
+            return
+        merged, result_type = updated
+        command_info.files = [FileInfo(**data) for data in merged]
+        command_info.result_type = ResultType(result_type)
+
+    def update_command_status(self, command_id: str, status: str) -> bool:
+        command_info = self.get_command(command_id)
+        if command_info is None:
+            return False
+        self._set_status(command_info, status)
+        return True
+
+    def check_timed_out_commands(self, timeout_seconds: int = 120) -> list:
+        now = time.time()
+        return [
+            {
+                "command_id": data["command_id"],
+                "stable_id": data["stable_id"],
+                "command": data["command"],
+                "elapsed": now - data["scheduled_at"],
+            }
+            for data in self.store.executing_commands(now - timeout_seconds)
+        ]
+
+    def list_commands(
+        self, stable_id: Optional[str] = None, limit: int = 50
+    ) -> Tuple[List[CommandInfo], int]:
+        rows, total = self.store.list_commands(stable_id, limit)
+        return [CommandInfo(**data) for data in rows], total
+
+    def command_count(self) -> int:
+        return self.store.count_commands()
+
+
+def create_command_manager() -> CommandManager:
+    """依 state store 建立 CommandManager（共用 store 時使用 SharedCommandManager）"""
+    store = get_state_store()
+    if store.shared:
+        return SharedCommandManager(store)
+    return CommandManager(store)
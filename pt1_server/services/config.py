@@ -0,0 +1,32 @@
+"""
+Environment settings
+
+各 service 讀取 PT1_* 數值設定的共用函數：未設定、格式錯誤或小於下限時
+使用預設值。
+"""
+
+import os
+
+
+def env_int(name: str, default: int, minimum: int = 1) -> int:
+    """整數設定；minimum=0 用於「0 表示不限制」的設定"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = int(value)
+    except ValueError:
+        return default
+    return parsed if parsed >= minimum else default
+
+
+def env_float(name: str, default: float, minimum: float = 0.0) -> float:
+    """浮點數設定"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        parsed = float(value)
+    except ValueError:
+        return default
+    return parsed if parsed >= minimum else default
@@ -0,0 +1,317 @@
+"""
+In-process metrics (Prometheus text exposition format)
+
+不依賴 prometheus_client；計數器是一般的 dict 與 list：
+
+- MetricsMiddleware（純 ASGI middleware）記錄每個 route 的請求數、延遲分布、
+  request / response bytes，route 以路徑樣板（/get_result/{command_id}）為
+  label，未匹配的路徑一律記為 "unmatched"，避免 label 數量無限增長
+- verify_token 記錄 session token 驗證的次數與耗時
+- save_upload_file / write_chunk 記錄上傳的 bytes 與耗時
+
+所有記錄都發生在 event loop thread（middleware、async dependency 與 async
+上傳函數），因此不需要 lock，每個請求的額外成本只有幾個 dict 操作。
+命令佇列、客戶端、transcript 大小等 gauge 在 /metrics 被讀取時才計算。
+"""
+
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 請求延遲（秒）
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+# session token 驗證（秒）
+TOKEN_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.01)
+
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Sequence[Tuple[str, str]]
+
+
+class Histogram:
+    """固定 bucket 的直方圖；counts 最後一格為 +Inf"""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, labels: Labels) -> Iterable[Tuple[str, Labels, float]]:
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f"{name}_bucket", [*labels, ("le", _format_value(bound))], cumulative
+        cumulative += self.counts[-1]
+        yield f"{name}_bucket", [*labels, ("le", "+Inf")], cumulative
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, cumulative
+
+
+def _format_value(value: float) -> str:
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+class MetricsWriter:
+    """累積 Prometheus text format 輸出"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def family(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        samples: Iterable[Tuple[Labels, float]],
+    ):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self._lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def histograms(
+        self,
+        name: str,
+        help_text: str,
+        histograms: Iterable[Tuple[Labels, Histogram]],
+    ):
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in histograms:
+            for sample_name, sample_labels, value in histogram.samples(name, labels):
+                self._lines.append(
+                    f"{sample_name}{_format_labels(sample_labels)} {_format_value(value)}"
+                )
+
+    def render(self) -> str:
+        return "\n".join(self._lines) + "\n"
+
+
+class Metrics:
+    """請求、token 驗證與上傳的累計計數"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        # (method, route, status) -> count
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        # (method, route) -> Histogram / bytes
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.request_bytes: Dict[Tuple[str, str], int] = {}
+        self.response_bytes: Dict[Tuple[str, str], int] = {}
+        self.in_flight = 0
+        # result (valid / invalid / missing) -> count
+        self.token_checks: Dict[str, int] = {}
+        self.token_latency = Histogram(TOKEN_BUCKETS)
+        self.upload_files = 0
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+
+    def observe_request(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        received: int,
+        sent: int,
+    ):
+        key = (method, route)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.request_bytes[key] = 0
+            self.response_bytes[key] = 0
+        histogram.observe(seconds)
+        self.request_bytes[key] += received
+        self.response_bytes[key] += sent
+        status_key = (method, route, status)
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+    def observe_token_check(self, result: str, seconds: Optional[float] = None):
+        self.token_checks[result] = self.token_checks.get(result, 0) + 1
+        if seconds is not None:
+            self.token_latency.observe(seconds)
+
+    def observe_upload(self, size: int, seconds: float, files: int = 1):
+        self.upload_files += files
+        self.upload_bytes += size
+        self.upload_seconds += seconds
+
+    def write(self, writer: MetricsWriter):
+        """輸出累計計數（gauge 由 /metrics endpoint 另外加入）"""
+        writer.family(
+            "pt1_uptime_seconds",
+            "gauge",
+            "Seconds since the server process started",
+            [((), time.time() - self.started_at)],
+        )
+        writer.family(
+            "pt1_http_requests_total",
+            "counter",
+            "HTTP requests by route template and status code",
+            [
+                ((("method", m), ("route", r), ("status", str(s))), count)
+                for (m, r, s), count in sorted(self.requests.items())
+            ],
+        )
+        writer.family(
+            "pt1_http_requests_in_flight",
+            "gauge",
+            "HTTP requests currently being handled",
+            [((), self.in_flight)],
+        )
+        writer.histograms(
+            "pt1_http_request_duration_seconds",
+            "HTTP request latency by route template (until the last body byte)",
+            [
+                ((("method", m), ("route", r)), histogram)
+                for (m, r), histogram in sorted(self.latency.items())
+            ],
+        )
+        writer.family(
+            "pt1_http_request_bytes_total",
+            "counter",
+            "HTTP request body bytes received by route template",
+            [
+                ((("method", m), ("route", r)), size)
+                for (m, r), size in sorted(self.request_bytes.items())
+            ],
+        )
+        writer.family(
+            "pt1_http_response_bytes_total",
+            "counter",
+            "HTTP response body bytes sent by route template",
+            [
+                ((("method", m), ("route", r)), size)
+                for (m, r), size in sorted(self.response_bytes.items())
+            ],
+        )
+        writer.family(
+            "pt1_token_verifications_total",
+            "counter",
+            "Session token verifications by result",
+            [
+                ((("result", r),), count)
+                for r, count in sorted(self.token_checks.items())
+            ],
+        )
+        writer.histograms(
+            "pt1_token_verification_seconds",
+            "Time spent verifying session tokens",
+            [((), self.token_latency)],
+        )
+        writer.family(
+            "pt1_upload_files_total",
+            "counter",
+            "Single-request file and transcript uploads written to disk",
+            [((), self.upload_files)],
+        )
+        writer.family(
+            "pt1_upload_bytes_total",
+            "counter",
+            "Uploaded bytes written to disk (before compression)",
+            [((), self.upload_bytes)],
+        )
+        writer.family(
+            "pt1_upload_seconds_total",
+            "counter",
+            "Time spent receiving and writing uploads",
+            [((), self.upload_seconds)],
+        )
+
+
+class MetricsMiddleware:
+    """
+    純 ASGI middleware：記錄每個請求的 route、狀態碼、延遲與 body bytes
+
+    延遲量測到 response body 最後一個 chunk 送出為止（包含 streaming response）。
+    """
+
+    def __init__(self, app, metrics: Optional[Metrics] = None):
+        self.app = app
+        self.metrics = metrics or get_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        start = time.perf_counter()
+        status = 500
+        received = 0
+        sent = 0
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            metrics.in_flight -= 1
+            # router 匹配後會把 route 寫入同一個 scope
+            route = scope.get("route")
+            metrics.observe_request(
+                scope["method"],
+                getattr(route, "path", UNMATCHED_ROUTE),
+                status,
+                time.perf_counter() - start,
+                received,
+                sent,
+            )
+
+
+# Global instance
+_metrics = None
+
+
+def get_metrics() -> Metrics:
+    """取得 process 內的 Metrics 單例"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
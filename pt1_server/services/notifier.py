@@ -0,0 +1,80 @@
+"""
+Keyed asyncio wakeups
+
+讓 long-polling 的 request 可以在 event loop 上等待某個 key（例如 stable_id），
+並由任何 thread（包含 FastAPI threadpool 中的 sync endpoint）喚醒。
+"""
+
+import asyncio
+import threading
+from typing import Dict, Iterable, Set
+
+
+class Waiter:
+    """一次等待的註冊資訊，需在檢查狀態「之前」建立以避免漏掉通知"""
+
+    def __init__(self, notifier: "KeyedNotifier", keys: Iterable[str]):
+        self._notifier = notifier
+        self.keys = tuple(keys)
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def __enter__(self) -> "Waiter":
+        self._notifier._register(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._notifier._unregister(self)
+
+    async def wait(self, timeout: float) -> bool:
+        """等待通知；被喚醒返回 True，逾時返回 False"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # event loop 已關閉
+            pass
+
+
+class KeyedNotifier:
+    """依 key 管理等待者，notify() 可從任何 thread 呼叫"""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[Waiter]] = {}
+        self._lock = threading.Lock()
+
+    def listen(self, *keys: str) -> Waiter:
+        """建立等待者（作為 context manager 使用）"""
+        return Waiter(self, keys)
+
+    def notify(self, key: str):
+        """喚醒所有等待 key 的 request"""
+        with self._lock:
+            waiters = list(self._waiters.get(key, ()))
+        for waiter in waiters:
+            waiter._wake()
+
+    def waiter_count(self, key: str) -> int:
+        with self._lock:
+            return len(self._waiters.get(key, ()))
+
+    def _register(self, waiter: Waiter):
+        with self._lock:
+            for key in waiter.keys:
+                self._waiters.setdefault(key, set()).add(waiter)
+
+    def _unregister(self, waiter: Waiter):
+        with self._lock:
+            for key in waiter.keys:
+                waiters = self._waiters.get(key)
+                if waiters is None:
+                    continue
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
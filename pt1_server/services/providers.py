@@ -4,9 +4,11 @@ Services providers for dependency injection
 """
 
 import threading
-from typing import TypeVar, Type, Optional, Dict, Any
-from .command_manager import CommandManager
+from typing import Any, Callable, Dict, Optional, Type, TypeVar
 
+from starlette.concurrency import run_in_threadpool
+
+from .command_manager import CommandManager, create_command_manager
 
 T = TypeVar("T")
 
@@ -19,8 +21,10 @@ class SingletonProvider:
         self._locks: Dict[Type, threading.Lock] = {}
         self._main_lock = threading.Lock()
 
-    def get_instance(self, cls: Type[T]) -> T:
-        """取得單例實例"""
+    def get_instance(
+        self, cls: Type[T], factory: Optional[Callable[[], T]] = None
+    ) -> T:
+        """取得單例實例（factory 未指定時呼叫 cls()）"""
         if cls not in self._instances:
             with self._main_lock:
                 if cls not in self._locks:
@@ -28,7 +32,7 @@ class SingletonProvider:
 
             with self._locks[cls]:
                 if cls not in self._instances:
-                    self._instances[cls] = cls()
+                    self._instances[cls] = (factory or cls)()
 
         return self._instances[cls]
 
@@ -39,7 +43,18 @@ _provider = SingletonProvider()
 
 def get_command_manager() -> CommandManager:
     """FastAPI 依賴注入函數 - 取得 CommandManager 單例"""
-    return _provider.get_instance(CommandManager)
+    return _provider.get_instance(CommandManager, create_command_manager)
+
+
+async def call_store(cmd_manager: CommandManager, func, *args):
+    """shared state store 的讀寫是同步 SQLite IO（可能等待其他 worker 的 lock），
+    在 threadpool 中執行；記憶體模式直接在 event loop 上呼叫
+
+    async endpoint 中所有會讀寫 CommandManager 狀態的呼叫都應經過這裡
+    """
+    if cmd_manager.store.shared:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
 
 
 def reset_providers():
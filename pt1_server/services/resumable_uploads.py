@@ -0,0 +1,286 @@
+"""
+Resumable chunked uploads
+
+大型檔案的可續傳上傳協定：
+
+1. init:     建立 upload，返回 upload_id
+2. chunk:    依序 PUT 資料（Content-Range），中斷後可查詢已收到的 bytes 再接續
+3. finalize: 驗證大小與 SHA-256，移入 content-addressed artifact store
+
+進度狀態存在 UPLOAD_DIR/<command_id>/.partial/：
+    <upload_id>.json  上傳資訊（檔名、大小、hash）
+    <upload_id>.part  已收到的資料（檔案大小即為已收到的 bytes 數）
+
+同一個 upload 的 chunk 依序寫入：同一個 process 內以 upload_id 的 asyncio.Lock
+排隊，多 worker 模式另外以 .part 檔的 flock 排除其他 worker；取得 lock 後才檢查
+offset。
+
+超過 PT1_UPLOAD_TTL_SECONDS（預設 1 天）沒有更新的 partial upload 由背景
+sweeper 清除。
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from pt1_server.services.config import env_int
+from pt1_server.services.metrics import get_metrics
+from pt1_server.services.storage import get_state_store
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PARTIAL_DIR_NAME = ".partial"
+# 建議 client 使用的 chunk 大小
+RECOMMENDED_CHUNK_SIZE = 4 * 1024 * 1024
+
+_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+
+def upload_ttl_seconds() -> int:
+    """partial upload 保留時間（預設 86400 秒）"""
+    return env_int("PT1_UPLOAD_TTL_SECONDS", 86400)
+
+
+def upload_sweep_interval_seconds() -> int:
+    """sweeper 執行間隔（預設 300 秒）"""
+    return env_int("PT1_UPLOAD_SWEEP_SECONDS", 300)
+
+
+class ResumableUploadManager:
+    def __init__(self, upload_dir: Optional[Path] = None, shared: bool = False):
+        self.upload_dir = Path(upload_dir or Path.cwd() / "uploads")
+        self.shared = shared
+        # upload_id -> [asyncio.Lock, 使用中的請求數]（只在 event loop 上存取）
+        self._write_locks: Dict[str, List] = {}
+
+    def _partial_dir(self, command_id: str) -> Path:
+        return self.upload_dir / command_id / PARTIAL_DIR_NAME
+
+    def _paths(self, command_id: str, upload_id: str) -> Tuple[Path, Path]:
+        if not _UPLOAD_ID_PATTERN.match(upload_id):
+            raise HTTPException(status_code=404, detail=f"Upload {upload_id} not found")
+        partial_dir = self._partial_dir(command_id)
+        return partial_dir / f"{upload_id}.json", partial_dir / f"{upload_id}.part"
+
+    def init_upload(
+        self,
+        command_id: str,
+        filename: str,
+        size: int,
+        sha256: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> dict:
+        """建立新的 upload，返回狀態（含 upload_id）"""
+        partial_dir = self._partial_dir(command_id)
+        partial_dir.mkdir(parents=True, exist_ok=True)
+
+        upload_id = uuid.uuid4().hex[:16]
+        state = {
+            "upload_id": upload_id,
+            "command_id": command_id,
+            "filename": os.path.basename(filename),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "content_type": content_type or "application/octet-stream",
+            "created_at": time.time(),
+        }
+        state_path, part_path = self._paths(command_id, upload_id)
+        part_path.touch()
+        tmp_path = state_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+        state["received"] = 0
+        return state
+
+    def get_state(self, command_id: str, upload_id: str) -> dict:
+        """取得 upload 狀態，received 為已收到的 bytes 數"""
+        state_path, part_path = self._paths(command_id, upload_id)
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            state["received"] = part_path.stat().st_size
+        except (OSError, json.JSONDecodeError):
+            raise HTTPException(status_code=404, detail=f"Upload {upload_id} not found")
+        return state
+
+    @contextlib.asynccontextmanager
+    async def _write_lock(self, upload_id: str):
+        """同一個 upload 的 write_chunk 依序執行（本 process）"""
+        entry = self._write_locks.get(upload_id)
+        if entry is None:
+            entry = self._write_locks[upload_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._write_locks[upload_id]
+
+    def _open_part(self, part_path: Path):
+        """以 append 模式開啟 .part 檔；多 worker 模式持有 flock 直到關閉"""
+        f = open(part_path, "ab")
+        if self.shared and fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            except BaseException:
+                f.close()
+                raise
+        return f
+
+    async def write_chunk(
+        self,
+        command_id: str,
+        upload_id: str,
+        start: int,
+        chunks: AsyncIterator[bytes],
+    ) -> int:
+        """
+        從 start 位置接續寫入資料（只允許 append）
+
+        Returns:
+            寫入後已收到的 bytes 數
+
+        Raises:
+            HTTPException 409: start 與已收到的 bytes 數不一致
+            HTTPException 413: 超過 init 時宣告的大小
+        """
+        async with self._write_lock(upload_id):
+            state = await run_in_threadpool(self.get_state, command_id, upload_id)
+            _, part_path = self._paths(command_id, upload_id)
+            f = await run_in_threadpool(self._open_part, part_path)
+            with f:
+                # 取得 lock 後重新讀取已收到的 bytes 數（其他請求可能剛寫完）
+                received = os.fstat(f.fileno()).st_size
+                if start != received:
+                    raise HTTPException(
+                        status_code=409,
+                        detail={"message": "Offset mismatch", "received": received},
+                    )
+
+                started = time.perf_counter()
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    received += len(chunk)
+                    if received > state["size"]:
+                        f.truncate(start)
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Upload exceeds declared size of {state['size']} bytes",
+                        )
+                    await run_in_threadpool(f.write, chunk)
+        get_metrics().observe_upload(
+            received - start, time.perf_counter() - started, files=0
+        )
+        return received
+
+    def finalize(self, command_id: str, upload_id: str) -> Tuple[Path, dict, str]:
+        """
+        驗證 upload 的大小與 SHA-256
+
+        驗證通過後由呼叫端移走 .part 檔，再呼叫 abort() 清除狀態。
+
+        Returns:
+            (part_path, state, sha256)
+        """
+        state = self.get_state(command_id, upload_id)
+        if state["received"] != state["size"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Upload incomplete", "received": state["received"]},
+            )
+
+        _, part_path = self._paths(command_id, upload_id)
+        digest = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(RECOMMENDED_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+
+        if state["sha256"] and state["sha256"] != sha256:
+            self.abort(command_id, upload_id)
+            raise HTTPException(
+                status_code=422,
+                detail=f"SHA-256 mismatch (expected {state['sha256']}, got {sha256})",
+            )
+
+        return part_path, state, sha256
+
+    def abort(self, command_id: str, upload_id: str) -> bool:
+        """刪除 partial upload"""
+        state_path, part_path = self._paths(command_id, upload_id)
+        deleted = False
+        for path in (part_path, state_path):
+            try:
+                path.unlink()
+                deleted = True
+            except OSError:
+                pass
+        return deleted
+
+    def sweep_expired(self, ttl_seconds: Optional[int] = None) -> int:
+        """清除超過 TTL 未更新的 partial upload，返回清除的數量"""
+        cutoff = time.time() - (ttl_seconds or upload_ttl_seconds())
+        removed = 0
+
+        for partial_dir in self.upload_dir.glob(f"*/{PARTIAL_DIR_NAME}"):
+            for state_path in partial_dir.glob("*.json"):
+                part_path = state_path.with_suffix(".part")
+                try:
+                    last_update = max(
+                        state_path.stat().st_mtime,
+                        part_path.stat().st_mtime if part_path.exists() else 0,
+                    )
+                except OSError:
+                    continue
+                if last_update < cutoff:
+                    self.abort(partial_dir.parent.name, state_path.stem)
+                    removed += 1
+            try:
+                partial_dir.rmdir()  # 只有空目錄會被刪除
+            except OSError:
+                pass
+
+        return removed
+
+    async def run_sweeper(self):
+        """背景 task：定期清除過期的 partial upload"""
+        while True:
+            await asyncio.sleep(upload_sweep_interval_seconds())
+            try:
+                removed = await run_in_threadpool(self.sweep_expired)
+                if removed:
+                    print(f"[Uploads] Removed {removed} expired partial upload(s)")
+            except Exception as e:
+                print(f"[Uploads] Sweeper error: {e}")
+
+
+# Global instance
+_resumable_upload_manager = None
+
+
+def get_resumable_upload_manager() -> ResumableUploadManager:
+    """Dependency injection for FastAPI"""
+    global _resumable_upload_manager
+    if _resumable_upload_manager is None:
+        _resumable_upload_manager = ResumableUploadManager(
+            shared=get_state_store().shared
+        )
+    return _resumable_upload_manager
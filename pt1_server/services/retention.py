@@ -0,0 +1,411 @@
+"""
+Retention sweeper
+
+背景 task 定期依保留期限與容量上限清除舊資料，避免磁碟與記憶體無限成長：
+
+- transcripts: agent 執行記錄（uploads/transcripts）
+- uploads: 命令的結果檔案（manifest 與 blob、舊版 uploads/<command_id>/ 目錄）
+- history: 已完成的命令（command_history、state store 與搜尋索引）
+
+每一類都可以設定保留天數、每個 client 的上限與總上限，超過上限時由最舊的
+開始刪除。history 的數量上限用來限制記憶體：persistent store（SQLite）時
+超過上限的命令只從記憶體移除，仍可由 get_command() 讀回；memory store 時
+直接刪除（連同結果檔案）。
+
+檔案 IO 在 threadpool 中以小批次（RETENTION_BATCH_SIZE）執行，批次之間讓出
+event loop；command_history 只在 event loop 上修改。
+
+設定（環境變數，0 表示不限制）：
+    PT1_RETENTION_INTERVAL_SECONDS        檢查間隔（預設 600）
+    PT1_RETENTION_TRANSCRIPT_DAYS         transcript 保留天數（預設 30）
+    PT1_RETENTION_TRANSCRIPT_CLIENT_MB    每個 client 的 transcript 容量（預設不限制）
+    PT1_RETENTION_TRANSCRIPT_TOTAL_MB     transcript 總容量（預設不限制）
+    PT1_RETENTION_UPLOAD_DAYS             結果檔案保留天數（預設 30）
+    PT1_RETENTION_UPLOAD_CLIENT_MB        每個 client 的結果檔案容量（預設不限制）
+    PT1_RETENTION_UPLOAD_TOTAL_MB         結果檔案總容量（預設不限制）
+    PT1_RETENTION_HISTORY_DAYS            已完成命令保留天數（預設 90）
+    PT1_RETENTION_HISTORY_CLIENT_COUNT    每個 client 在記憶體中的已完成命令數（預設不限制）
+    PT1_RETENTION_HISTORY_TOTAL_COUNT     記憶體中的已完成命令總數（預設 100000）
+"""
+
+import asyncio
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .artifact_store import (
+    BLOB_DIR_NAME,
+    MANIFEST_NAME,
+    ArtifactStore,
+    get_artifact_store,
+)
+from .command_manager import CommandManager
+from .config import env_int
+from .providers import get_command_manager
+from .resumable_uploads import PARTIAL_DIR_NAME
+from .transcript_manager import TranscriptManager, get_transcript_manager
+
+# 每次在 threadpool 中處理的項目數
+RETENTION_BATCH_SIZE = 100
+
+_MB = 1024 * 1024
+_DAY = 86400
+
+
+class RetentionPolicy(NamedTuple):
+    """單一類別的保留設定（0 表示不限制）"""
+
+    max_age_seconds: int = 0
+    client_limit: int = 0
+    total_limit: int = 0
+
+    @classmethod
+    def from_env(
+        cls, prefix: str, days: int, unit: int, limit_suffix: str, total: int = 0
+    ) -> "RetentionPolicy":
+        return cls(
+            max_age_seconds=env_int(f"{prefix}_DAYS", days, minimum=0) * _DAY,
+            client_limit=env_int(f"{prefix}_CLIENT_{limit_suffix}", 0, minimum=0)
+            * unit,
+            total_limit=env_int(f"{prefix}_TOTAL_{limit_suffix}", total, minimum=0)
+            * unit,
+        )
+
+
+class Item(NamedTuple):
+    key: str
+    client_id: str
+    timestamp: float
+    size: int
+
+
+def select_evictions(
+    items: Iterable[Item], policy: RetentionPolicy, now: Optional[float] = None
+) -> List[Item]:
+    """
+    依 policy 選出要刪除的項目（由舊到新）
+
+    先刪除超過保留期限的項目，再由新到舊累計每個 client 與全部的用量，
+    超過上限之後的（較舊的）項目都刪除。
+    """
+    items = sorted(items, key=lambda item: item.timestamp, reverse=True)
+    cutoff = (now or time.time()) - policy.max_age_seconds
+    evicted = []
+    client_usage: Dict[str, int] = {}
+    total_usage = 0
+
+    for item in items:
+        if policy.max_age_seconds and item.timestamp < cutoff:
+            evicted.append(item)
+            continue
+        used = client_usage.get(item.client_id, 0) + item.size
+        if policy.client_limit and used > policy.client_limit:
+            evicted.append(item)
+            continue
+        if policy.total_limit and total_usage + item.size > policy.total_limit:
+            evicted.append(item)
+            continue
+        client_usage[item.client_id] = used
+        total_usage += item.size
+
+    evicted.reverse()
+    return evicted
+
+
+def _format_bytes(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+    if size < _MB:
+        return f"{size / 1024:.1f} KB"
+    return f"{size / _MB:.1f} MB"
+
+
+class RetentionSweeper:
+    def __init__(
+        self,
+        cmd_manager: CommandManager,
+        transcript_mgr: TranscriptManager,
+        artifact_store: ArtifactStore,
+    ):
+        self.cmd_manager = cmd_manager
+        self.transcript_mgr = transcript_mgr
+        self.artifact_store = artifact_store
+        self.upload_dir = artifact_store.upload_dir
+
+        self.interval = env_int("PT1_RETENTION_INTERVAL_SECONDS", 600)
+        self.transcript_policy = RetentionPolicy.from_env(
+            "PT1_RETENTION_TRANSCRIPT", days=30, unit=_MB, limit_suffix="MB"
+        )
+        self.upload_policy = RetentionPolicy.from_env(
+            "PT1_RETENTION_UPLOAD", days=30, unit=_MB, limit_suffix="MB"
+        )
+        self.history_policy = RetentionPolicy.from_env(
+            "PT1_RETENTION_HISTORY",
+            days=90,
+            unit=1,
+            limit_suffix="COUNT",
+            total=100000,
+        )
+
+        # 累計清除量：{類別: {"items": n, "bytes": n}}
+        self.totals: Dict[str, Dict[str, int]] = {
+            name: {"items": 0, "bytes": 0}
+            for name in ("transcripts", "uploads", "history", "history_unloaded")
+        }
+        self.last_report: Dict[str, Dict[str, int]] = {}
+        self.last_run: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Transcripts
+    # ------------------------------------------------------------------
+
+    def _scan_transcripts(self) -> List[Item]:
+        index = self.transcript_mgr.index
+        entries, _ = index.list(limit=len(index))
+        items = []
+        for entry in entries:
+            found = self.transcript_mgr.get_transcript_file(entry["transcript_id"])
+            try:
+                size = found[0].stat().st_size if found else 0
+                timestamp = datetime.fromisoformat(entry["created_time"]).timestamp()
+            except (OSError, ValueError):
+                continue
+            items.append(
+                Item(entry["transcript_id"], entry["client_id"], timestamp, size)
+            )
+        return items
+
+    def _delete_transcripts(self, items: List[Item]) -> int:
+        reclaimed = 0
+        for item in items:
+            if self.transcript_mgr.delete_transcript(item.key):
+                reclaimed += item.size
+        return reclaimed
+
+    # ------------------------------------------------------------------
+    # Uploads
+    # ------------------------------------------------------------------
+
+    def _command_client(self, command_id: str) -> str:
+        """在 threadpool 中查詢 command 的 client（不修改 command_history）"""
+        command_info = self.cmd_manager.command_history.get(command_id)
+        if command_info is not None:
+            return command_info.stable_id
+        data = self.cmd_manager.store.get_command(command_id)
+        return data["stable_id"] if data else "unknown"
+
+    def _scan_uploads(self) -> List[Item]:
+        transcript_dir = self.transcript_mgr.transcript_dir.resolve()
+        items = []
+        for command_dir in self.upload_dir.iterdir():
+            if (
+                not command_dir.is_dir()
+                or command_dir.name == BLOB_DIR_NAME
+                or command_dir.resolve() == transcript_dir
+            ):
+                continue
+            command_id = command_dir.name
+            # 有未完成的上傳時跳過（由 resumable upload sweeper 處理）
+            if (command_dir / PARTIAL_DIR_NAME).exists():
+                continue
+            try:
+                timestamp = command_dir.stat().st_mtime
+                size = self.artifact_store.command_usage(command_id) + sum(
+                    path.stat().st_size
+                    for path in command_dir.iterdir()
+                    if path.is_file() and path.name != MANIFEST_NAME
+                )
+            except OSError:
+                continue
+            items.append(
+                Item(command_id, self._command_client(command_id), timestamp, size)
+            )
+        return items
+
+    def _delete_command_files(self, command_ids: Iterable[str]) -> int:
+        """刪除 command 的結果檔案，返回實際釋放的 bytes 數"""
+        reclaimed = 0
+        for command_id in command_ids:
+            command_dir = self.upload_dir / command_id
+            reclaimed += self.artifact_store.remove_command(command_id)
+            if not command_dir.is_dir():
+                continue
+            for path in command_dir.rglob("*"):
+                try:
+                    if path.is_file():
+                        reclaimed += path.stat().st_size
+                except OSError:
+                    pass
+            shutil.rmtree(command_dir, ignore_errors=True)
+        return reclaimed
+
+    def _collect_shared_blobs(self) -> int:
+        self.artifact_store.rebuild_refcounts()
+        return self.artifact_store.collect_garbage()
+
+    # ------------------------------------------------------------------
+    # Sweep
+    # ------------------------------------------------------------------
+
+    async def _in_batches(self, items: List, func) -> int:
+        """在 threadpool 中分批執行 func，批次之間讓出 event loop"""
+        total = 0
+        for start in range(0, len(items), RETENTION_BATCH_SIZE):
+            total += await run_in_threadpool(
+                func, items[start : start + RETENTION_BATCH_SIZE]
+            )
+            await asyncio.sleep(0)
+        return total
+
+    async def _sweep_transcripts(self, report: dict):
+        items = await run_in_threadpool(self._scan_transcripts)
+        evicted = select_evictions(items, self.transcript_policy)
+        reclaimed = await self._in_batches(evicted, self._delete_transcripts)
+        report["transcripts"] = {"items": len(evicted), "bytes": reclaimed}
+
+    async def _sweep_uploads(self, report: dict):
+        items = await run_in_threadpool(self._scan_uploads)
+        evicted = [item.key for item in select_evictions(items, self.upload_policy)]
+        reclaimed = await self._in_batches(evicted, self._delete_command_files)
+        # 檔案已不存在，清空 command 的檔案列表
+        for start in range(0, len(evicted), RETENTION_BATCH_SIZE):
+            for command_id in evicted[start : start + RETENTION_BATCH_SIZE]:
+                self.cmd_manager.clear_files(command_id)
+            await asyncio.sleep(0)
+        report["uploads"] = {"items": len(evicted), "bytes": reclaimed}
+
+    async def _sweep_history(self, report: dict):
+        cmd_manager = self.cmd_manager
+        policy = self.history_policy
+        persistent = cmd_manager.store.persistent
+        now = time.time()
+        cutoff = now - policy.max_age_seconds
+
+        items = [
+            Item(
+                command_info.command_id,
+                command_info.stable_id,
+                command_info.finished_at or command_info.created_at,
+                1,
+            )
+            for command_info in list(cmd_manager.command_history.values())
+            if command_info.status not in cmd_manager.ACTIVE_STATUSES
+        ]
+        evicted = select_evictions(items, policy, now=now)
+
+        deleted: Dict[str, None] = {}
+        unloaded = 0
+        for start in range(0, len(evicted), RETENTION_BATCH_SIZE):
+            for item in evicted[start : start + RETENTION_BATCH_SIZE]:
+                # 數量上限只限制記憶體；persistent store 中的資料保留到過期為止
+                expired = policy.max_age_seconds and item.timestamp < cutoff
+                delete = bool(expired) or not persistent
+                if cmd_manager.evict_command(item.key, delete=delete):
+                    if delete:
+                        deleted[item.key] = None
+                    else:
+                        unloaded += 1
+            await asyncio.sleep(0)
+
+        # 不在記憶體中的過期命令
+        if persistent and policy.max_age_seconds:
+            while True:
+                command_ids = await run_in_threadpool(
+                    cmd_manager.store.expired_command_ids,
+                    cutoff,
+                    RETENTION_BATCH_SIZE,
+                )
+                command_ids = [c for c in command_ids if c not in deleted]
+                if not command_ids:
+                    break
+                for command_id in command_ids:
+                    cmd_manager.evict_command(command_id)
+                    deleted[command_id] = None
+                # 等待刪除寫入資料庫，下一批查詢才不會再取到相同的命令
+                await run_in_threadpool(cmd_manager.store.flush)
+
+        reclaimed = await self._in_batches(list(deleted), self._delete_command_files)
+        report["history"] = {"items": len(deleted), "bytes": reclaimed}
+        report["history_unloaded"] = {"items": unloaded, "bytes": 0}
+
+    async def sweep(self) -> Dict[str, Dict[str, int]]:
+        """執行一次完整的清除，返回各類別清除的項目數與 bytes 數"""
+        report: Dict[str, Dict[str, int]] = {}
+        await self._sweep_transcripts(report)
+        await self._sweep_uploads(report)
+        await self._sweep_history(report)
+        if self.artifact_store.shared:
+            # 多 worker 模式的 blob 只由 garbage collection 刪除（計入 uploads）
+            report["uploads"]["bytes"] += await run_in_threadpool(
+                self._collect_shared_blobs
+            )
+
+        for name, counts in report.items():
+            self.totals[name]["items"] += counts["items"]
+            self.totals[name]["bytes"] += counts["bytes"]
+        self.last_report = report
+        self.last_run = time.time()
+        return report
+
+    def describe(self) -> str:
+        """目前設定的簡短說明（啟動時顯示）"""
+
+        def limits(policy: RetentionPolicy, unit: int, label: str) -> str:
+            parts = [
+                (
+                    f"{policy.max_age_seconds // _DAY}d"
+                    if policy.max_age_seconds
+                    else "no age limit"
+                )
+            ]
+            if policy.client_limit:
+                parts.append(f"{policy.client_limit // unit}{label}/client")
+            if policy.total_limit:
+                parts.append(f"{policy.total_limit // unit}{label} total")
+            return " ".join(parts)
+
+        return (
+            f"transcripts {limits(self.transcript_policy, _MB, 'MB')}, "
+            f"uploads {limits(self.upload_policy, _MB, 'MB')}, "
+            f"history {limits(self.history_policy, 1, ' commands')}"
+        )
+
+    @staticmethod
+    def format_report(report: Dict[str, Dict[str, int]]) -> str:
+        return (
+            f"{report['transcripts']['items']} transcript(s) "
+            f"({_format_bytes(report['transcripts']['bytes'])}), "
+            f"{report['uploads']['items']} upload folder(s) "
+            f"({_format_bytes(report['uploads']['bytes'])}), "
+            f"{report['history']['items']} command(s) "
+            f"({_format_bytes(report['history']['bytes'])} of files), "
+            f"{report['history_unloaded']['items']} command(s) unloaded from memory"
+        )
+
+    async def run(self):
+        """背景 task：定期執行清除"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await self.sweep()
+                if any(counts["items"] for counts in report.values()):
+                    print(f"[Retention] Reclaimed {self.format_report(report)}")
+            except Exception as e:
+                print(f"[Retention] Sweeper error: {e}")
+
+
+# Global instance
+_retention_sweeper = None
+
+
+def get_retention_sweeper() -> RetentionSweeper:
+    """取得 retention sweeper 單例"""
+    global _retention_sweeper
+    if _retention_sweeper is None:
+        _retention_sweeper = RetentionSweeper(
+            get_command_manager(), get_transcript_manager(), get_artifact_store()
+        )
+    return _retention_sweeper
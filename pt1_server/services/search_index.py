@@ -0,0 +1,408 @@
+"""
+Full-text search index
+
+Agent transcript 與命令結果寫入 SQLite FTS5 索引，/search 可以跨所有 client
+搜尋，不必逐一下載內容：
+
+- documents: 每份文件一列（kind、ref_id、client_id、created_at、title）
+- documents_fts: FTS5 表（title、body），每份文件依行切成約 8 KB 的區塊，
+  rowid = documents.id << 20 | 區塊序號，刪除文件時以 rowid 範圍刪除
+
+FTS5 的 snippet() 成本隨單一列中符合的次數急遽增加（例如每行都有 "error"
+的大型 transcript），切成區塊後每個 snippet 只處理一個區塊；多個字詞的查詢
+因此需要出現在同一個區塊內。搜尋先以區塊比對並依文件合併，只為返回的
+文件計算 snippet。
+
+寫入與 SQLiteStateStore 相同採 write-behind：add_*()/remove() 只把工作放進
+pending map（同一份文件多次變更會合併），背景 thread 批次寫在同一個
+transaction 中，不會拖慢上傳與 submit_result。Transcript 內容在背景 thread
+中才讀取解碼，搜尋結果因此會有最多一個 flush 間隔的延遲。
+
+設定（環境變數）：
+    PT1_SEARCH_BACKEND        sqlite | none（預設 sqlite）
+    PT1_SEARCH_DB             索引檔路徑（預設 ./pt1_search.db）
+    PT1_SEARCH_FLUSH_MS       批次寫入間隔毫秒數（預設 500）
+    PT1_SEARCH_MAX_DOC_CHARS  每份文件最多索引的字元數（預設 4000000）
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .config import env_int
+
+KIND_TRANSCRIPT = "transcript"
+KIND_RESULT = "result"
+
+# snippet 中標示符合字詞的記號
+HIGHLIGHT_START = "**"
+HIGHLIGHT_END = "**"
+SNIPPET_TOKENS = 24
+# 每個索引區塊的字元數（在換行處切開）
+CHUNK_CHARS = 8 * 1024
+# rowid 中區塊序號佔用的 bits
+_CHUNK_BITS = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id         INTEGER PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    ref_id     TEXT NOT NULL,
+    client_id  TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    title      TEXT NOT NULL DEFAULT '',
+    UNIQUE (kind, ref_id)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_client_time
+    ON documents (client_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_time ON documents (created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, body, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+# body 可以是字串，或在背景 thread 中才呼叫的 loader（參數為最多字元數）
+Body = Union[str, Callable[[int], Optional[str]]]
+
+
+class SearchIndex:
+    """Search index 介面；預設實作不建立索引（PT1_SEARCH_BACKEND=none）"""
+
+    enabled = False
+
+    def add_transcript(
+        self, transcript_id: str, client_id: str, created_at: float, body: Body
+    ):
+        pass
+
+    def add_result(self, command_info):
+        pass
+
+    def remove(self, kind: str, ref_id: str):
+        pass
+
+    def is_empty(self) -> bool:
+        return False
+
+    def search(
+        self,
+        query: str,
+        client_id: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50,
+        order: str = "newest",
+    ) -> List[dict]:
+        return []
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _split_chunks(text: str, size: int = CHUNK_CHARS) -> List[str]:
+    """把文字切成約 size 字元的區塊，盡量在換行處切開"""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            newline = text.rfind("\n", start, end)
+            if newline > start:
+                end = newline + 1
+        chunks.append(text[start:end])
+        start = end
+    # 空白內容仍保留一列，讓 title（命令）可以被搜尋
+    return chunks or [""]
+
+
+def _quote_terms(query: str) -> str:
+    """把每個字詞轉成 FTS5 phrase，讓 C:\\Windows、foo-bar 之類的輸入也能搜尋"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class SQLiteSearchIndex(SearchIndex):
+    """SQLite FTS5 index with a background writer thread"""
+
+    enabled = True
+
+    def __init__(
+        self, path: str, flush_interval: float = 0.5, max_doc_chars: int = 4000000
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_doc_chars = max_doc_chars
+        self._connect().executescript(_SCHEMA)
+
+        # (kind, ref_id) -> 文件內容；None 表示刪除
+        self._pending: Dict[Tuple[str, str], Optional[tuple]] = {}
+        self._cond = threading.Condition()
+        self._pending_generation = 0
+        self._written_generation = 0
+        self._closed = False
+
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="pt1-search-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---- writes ------------------------------------------------------------
+
+    def _enqueue(self, key: Tuple[str, str], document: Optional[tuple]):
+        with self._cond:
+            self._pending[key] = document
+            self._pending_generation += 1
+            if self._pending_generation == self._written_generation + 1:
+                self._cond.notify()
+
+    def add_transcript(
+        self, transcript_id: str, client_id: str, created_at: float, body: Body
+    ):
+        self._enqueue(
+            (KIND_TRANSCRIPT, transcript_id), (client_id, created_at, "", body)
+        )
+
+    def add_result(self, command_info):
+        self._enqueue(
+            (KIND_RESULT, command_info.command_id),
+            (
+                command_info.stable_id,
+                command_info.finished_at or command_info.created_at,
+                command_info.command,
+                command_info.result or "",
+            ),
+        )
+
+    def remove(self, kind: str, ref_id: str):
+        self._enqueue((kind, ref_id), None)
+
+    def flush(self):
+        with self._cond:
+            target = self._pending_generation
+            self._cond.notify_all()
+            while self._written_generation < target and self._writer.is_alive():
+                self._cond.wait(1)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+
+    def _write_document(
+        self, conn: sqlite3.Connection, key: Tuple[str, str], document: Optional[tuple]
+    ):
+        kind, ref_id = key
+        row = conn.execute(
+            "SELECT id FROM documents WHERE kind = ? AND ref_id = ?", (kind, ref_id)
+        ).fetchone()
+        if row is not None:
+            first = row[0] << _CHUNK_BITS
+            conn.execute(
+                "DELETE FROM documents_fts WHERE rowid BETWEEN ? AND ?",
+                (first, first + (1 << _CHUNK_BITS) - 1),
+            )
+            conn.execute("DELETE FROM documents WHERE id = ?", row)
+        if document is None:
+            return
+
+        client_id, created_at, title, body = document
+        if callable(body):
+            body = body(self.max_doc_chars)
+            if body is None:
+                # 內容已不存在（例如上傳後立即被刪除）
+                return
+        body = body[: self.max_doc_chars]
+
+        cursor = conn.execute(
+            "INSERT INTO documents (kind, ref_id, client_id, created_at, title) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (kind, ref_id, client_id, created_at, title),
+        )
+        first = cursor.lastrowid << _CHUNK_BITS
+        conn.executemany(
+            "INSERT INTO documents_fts (rowid, title, body) VALUES (?, ?, ?)",
+            (
+                (first + number, title if number == 0 else "", chunk)
+                for number, chunk in enumerate(_split_chunks(body))
+            ),
+        )
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            with self._cond:
+                while (
+                    self._written_generation == self._pending_generation
+                    and not self._closed
+                ):
+                    self._cond.wait()
+                if (
+                    self._closed
+                    and self._written_generation == self._pending_generation
+                ):
+                    break
+
+            # 等待 flush_interval，讓同一段時間內的寫入合併成一次 commit
+            time.sleep(self.flush_interval)
+
+            with self._cond:
+                generation = self._pending_generation
+                pending = self._pending
+                self._pending = {}
+
+            try:
+                with conn:
+                    for key, document in pending.items():
+                        self._write_document(conn, key, document)
+            except Exception as e:
+                print(f"[Search] ERROR: Failed to write batch: {e}")
+
+            with self._cond:
+                self._written_generation = generation
+                self._cond.notify_all()
+        conn.close()
+
+    # ---- reads -------------------------------------------------------------
+
+    def is_empty(self) -> bool:
+        with self._read_lock:
+            row = self._read_conn.execute("SELECT 1 FROM documents LIMIT 1").fetchone()
+        return row is None
+
+    def search(
+        self,
+        query: str,
+        client_id: Optional[str] = None,
+        kind: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 50,
+        order: str = "newest",
+    ) -> List[dict]:
+        """
+        搜尋 transcript 與命令結果
+
+        Args:
+            query: FTS5 查詢（支援 "phrase"、AND/OR/NOT、prefix*）；
+                   語法錯誤時改為把每個字詞當作 phrase 搜尋
+            client_id: 只搜尋此 client
+            kind: transcript 或 result
+            since: created_at 下限（epoch 秒）
+            until: created_at 上限（epoch 秒，不含）
+            limit: 最多返回筆數
+            order: newest（由新到舊）或 rank（相關度）
+
+        Returns:
+            符合的文件列表（含 snippet）
+
+        Raises:
+            ValueError: 查詢無法解析
+        """
+        conditions = ["f.documents_fts MATCH ?"]
+        params: list = []
+        if client_id:
+            conditions.append("d.client_id = ?")
+            params.append(client_id)
+        if kind:
+            conditions.append("d.kind = ?")
+            params.append(kind)
+        if since is not None:
+            conditions.append("d.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("d.created_at < ?")
+            params.append(until)
+        order_by = "MIN(f.rank)" if order == "rank" else "d.created_at DESC"
+
+        # 以區塊比對，依文件合併並記錄第一個符合的區塊
+        sql = (
+            "SELECT d.kind, d.ref_id, d.client_id, d.created_at, d.title, "
+            "MIN(f.rowid) "
+            f"FROM documents_fts f JOIN documents d ON d.id = f.rowid >> {_CHUNK_BITS} "
+            f"WHERE {' AND '.join(conditions)} "
+            f"GROUP BY d.id ORDER BY {order_by} LIMIT ?"
+        )
+        snippet_sql = (
+            f"SELECT snippet(documents_fts, -1, ?, ?, '...', {SNIPPET_TOKENS}) "
+            "FROM documents_fts WHERE documents_fts MATCH ? AND rowid = ?"
+        )
+
+        last_error = None
+        for match in (query, _quote_terms(query)):
+            try:
+                with self._read_lock:
+                    rows = self._read_conn.execute(
+                        sql, [match] + params + [limit]
+                    ).fetchall()
+                    results = []
+                    for row in rows:
+                        snippet = self._read_conn.execute(
+                            snippet_sql, (HIGHLIGHT_START, HIGHLIGHT_END, match, row[5])
+                        ).fetchone()
+                        results.append(
+                            {
+                                "kind": row[0],
+                                "id": row[1],
+                                "client_id": row[2],
+                                "created_at": row[3],
+                                "title": row[4],
+                                "snippet": snippet[0] if snippet else "",
+                            }
+                        )
+                return results
+            except sqlite3.OperationalError as e:
+                last_error = e
+        raise ValueError(f"Invalid search query: {last_error}")
+
+
+# Global instance
+_search_index: Optional[SearchIndex] = None
+_search_index_lock = threading.Lock()
+
+
+def create_search_index() -> SearchIndex:
+    """依環境變數建立 search index"""
+    backend = os.getenv("PT1_SEARCH_BACKEND", "sqlite").lower()
+    if backend == "none":
+        return SearchIndex()
+    if backend != "sqlite":
+        print(f"[Search] Warning: Unknown PT1_SEARCH_BACKEND '{backend}', using sqlite")
+
+    path = os.getenv("PT1_SEARCH_DB", os.path.join(os.getcwd(), "pt1_search.db"))
+    flush_ms = env_int("PT1_SEARCH_FLUSH_MS", 500)
+    max_doc_chars = env_int("PT1_SEARCH_MAX_DOC_CHARS", 4000000)
+    try:
+        return SQLiteSearchIndex(
+            path, flush_interval=flush_ms / 1000, max_doc_chars=max_doc_chars
+        )
+    except sqlite3.Error as e:
+        # 例如 Python 內建的 SQLite 沒有編譯 FTS5
+        print(f"[Search] Warning: Full-text search disabled: {e}")
+        return SearchIndex()
+
+
+def get_search_index() -> SearchIndex:
+    """取得 search index 單例"""
+    global _search_index
+    if _search_index is None:
+        with _search_index_lock:
+            if _search_index is None:
+                _search_index = create_search_index()
+    return _search_index
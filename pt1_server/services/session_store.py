@@ -0,0 +1,375 @@
+"""
+Session token store
+
+session token 保存在記憶體 dict 中，驗證只做一次 dict 查詢與時間比較，不需要
+lock 也沒有磁碟 I/O。持久化以 append-only journal（`.session_tokens.jsonl`，
+每行一個 session）寫入：
+
+- create() 只把新 session 放進記憶體與待寫入清單；背景 thread 每
+  PT1_SESSION_FLUSH_MS 毫秒把待寫入的 session 一次 append 到 journal
+- 過期的 session 依 expires_at 放在 heap 中，背景 thread 每
+  PT1_SESSION_SWEEP_SECONDS 秒從 heap 取出並刪除；journal 不記錄刪除，
+  載入時直接略過已過期的 session
+- journal 行數超過有效 session 數的兩倍（且多於 1000 行）時，以 temp file +
+  rename 重寫成只含有效 session 的 journal（compaction）
+
+舊版的 `.session_tokens.json` 在第一次啟動時轉換為 journal 後刪除。
+
+多 worker 模式（PT1_STATE_BACKEND=shared）使用 SharedSessionTokenStore：
+session 在 create() 時直接寫入共用的 state store，其他 worker 建立的 session
+在第一次驗證時由 store 讀入記憶體，之後仍是 dict 查詢。store 中也沒有的 token
+（無效或偽造的 token）在 MISS_CACHE_SECONDS 秒內直接判定無效，不再查詢 store；
+需要查詢 store 時 verify_token 在 threadpool 中執行（needs_lookup()）。
+"""
+
+import heapq
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .config import env_int
+from .storage import get_state_store
+
+COMPACT_MIN_LINES = 1000
+# 多 worker 模式下 store 查無的 token 記住的秒數與數量上限
+MISS_CACHE_SECONDS = 5
+MISS_CACHE_MAX_ENTRIES = 10_000
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _format_time(dt: datetime) -> str:
+    return dt.isoformat() + "Z"
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def _to_timestamp(dt: datetime) -> float:
+    return (dt - _EPOCH).total_seconds()
+
+
+def _from_timestamp(value: float) -> datetime:
+    return _EPOCH + timedelta(seconds=value)
+
+
+class SessionToken(NamedTuple):
+    refresh_token: str
+    expires_at: datetime  # naive UTC
+    created_at: datetime  # naive UTC
+
+
+def _journal_line(token: str, entry: SessionToken) -> str:
+    return json.dumps(
+        {
+            "token": token,
+            "refresh_token": entry.refresh_token,
+            "expires_at": _format_time(entry.expires_at),
+            "created_at": _format_time(entry.created_at),
+        }
+    )
+
+
+class SessionTokenStore:
+    """記憶體 session token 表，以 journal 持久化"""
+
+    def __init__(
+        self,
+        journal_path: str,
+        legacy_path: Optional[str] = None,
+        flush_interval: float = 0.05,
+        sweep_interval: float = 60,
+    ):
+        self.journal_path = journal_path
+        self.legacy_path = legacy_path
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+
+        self._tokens: Dict[str, SessionToken] = {}
+        self._heap: List[Tuple[datetime, str]] = []
+        self._pending: List[Tuple[str, SessionToken]] = []
+        # _lock 保護 _tokens / _heap / _pending 的修改；_write_lock 保護 journal 檔案
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._journal = None
+        self._journal_lines = 0
+
+        self._load()
+
+        self._stop = threading.Event()
+        self._writer = threading.Thread(
+            target=self._write_loop, name="pt1-session-writer", daemon=True
+        )
+        self._writer.start()
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    # ---- loading -----------------------------------------------------------
+
+    def _load(self):
+        now = datetime.utcnow()
+        expired = 0
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._journal_lines += 1
+                    try:
+                        item = json.loads(line)
+                        token = item["token"]
+                        entry = SessionToken(
+                            item["refresh_token"],
+                            _parse_time(item["expires_at"]),
+                            _parse_time(item["created_at"]),
+                        )
+                    except (ValueError, KeyError, TypeError) as e:
+                        # 寫入中斷留下的不完整行
+                        print(
+                            f"[Auth] Warning: Skipping invalid session journal line: {e}"
+                        )
+                        continue
+                    if entry.expires_at <= now:
+                        expired += 1
+                        continue
+                    self._tokens[token] = entry
+        elif self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"[Auth] Warning: Failed to load session tokens: {e}")
+                data = {}
+            for token, item in data.items():
+                try:
+                    entry = SessionToken(
+                        item["refresh_token"],
+                        _parse_time(item["expires_at"]),
+                        _parse_time(item["created_at"]),
+                    )
+                except (KeyError, ValueError) as e:
+                    print(f"[Auth] Warning: Skipping invalid session token entry: {e}")
+                    continue
+                if entry.expires_at <= now:
+                    expired += 1
+                    continue
+                self._tokens[token] = entry
+            self.compact()
+            os.remove(self.legacy_path)
+            print(f"[Auth] Converted {self.legacy_path} to {self.journal_path}")
+
+        self._heap = [
+            (entry.expires_at, token) for token, entry in self._tokens.items()
+        ]
+        heapq.heapify(self._heap)
+        print(
+            f"[Auth] Loaded {len(self._tokens)} session token(s) from disk (skipped {expired} expired)"
+        )
+
+    # ---- hot path ----------------------------------------------------------
+
+    def is_valid(self, token: str, now: datetime) -> bool:
+        """token 存在且未過期（過期的 token 由背景 sweep 刪除）"""
+        entry = self._tokens.get(token)
+        return entry is not None and entry.expires_at > now
+
+    def needs_lookup(self, token: str) -> bool:
+        """is_valid() 是否需要同步 IO（呼叫端應在 threadpool 中執行）"""
+        return False
+
+    def create(self, token: str, entry: SessionToken):
+        with self._lock:
+            self._tokens[token] = entry
+            heapq.heappush(self._heap, (entry.expires_at, token))
+            self._pending.append((token, entry))
+
+    # ---- background --------------------------------------------------------
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """刪除已過期的 session，返回刪除數量"""
+        now = now or datetime.utcnow()
+        removed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, token = heapq.heappop(self._heap)
+                entry = self._tokens.get(token)
+                if entry is not None and entry.expires_at == expires_at:
+                    del self._tokens[token]
+                    removed += 1
+        return removed
+
+    def flush(self):
+        """把待寫入的 session append 到 journal"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            lines = [_journal_line(token, entry) for token, entry in pending]
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write("\n".join(lines) + "\n")
+            self._journal.flush()
+            self._journal_lines += len(lines)
+
+    def compact(self):
+        """以目前有效的 session 重寫 journal"""
+        with self._write_lock:
+            with self._lock:
+                snapshot = list(self._tokens.items())
+                self._pending = []
+            tmp_path = self.journal_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for token, entry in snapshot:
+                    f.write(_journal_line(token, entry) + "\n")
+            os.replace(tmp_path, self.journal_path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._journal_lines = len(snapshot)
+
+    def _needs_compaction(self) -> bool:
+        return self._journal_lines > max(COMPACT_MIN_LINES, 2 * len(self._tokens))
+
+    def _write_loop(self):
+        elapsed = 0.0
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                elapsed += self.flush_interval
+                if elapsed >= self.sweep_interval:
+                    elapsed = 0.0
+                    removed = self.sweep()
+                    if removed:
+                        print(f"[Auth] Cleaned up {removed} expired session token(s)")
+                    if self._needs_compaction():
+                        self.compact()
+            except Exception as e:
+                print(f"[Auth] Warning: Failed to persist session tokens: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._writer.join(timeout=5)
+        self.flush()
+        with self._write_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class SharedSessionTokenStore(SessionTokenStore):
+    """多 worker 模式：session 寫入共用的 state store，不使用 journal"""
+
+    def __init__(self, store, journal_path: str, sweep_interval: float = 60):
+        self.store = store
+        # store 查無的 token -> 到期時間（time.monotonic()）
+        self._misses: Dict[str, float] = {}
+        super().__init__(journal_path, sweep_interval=sweep_interval)
+
+    def _load(self):
+        # 切換到 shared 模式前的 journal 併入 store（INSERT OR REPLACE，重複執行無妨）
+        super()._load()
+        for token, entry in self._tokens.items():
+            self._save(token, entry)
+        now = _to_timestamp(datetime.utcnow())
+        for token, refresh_token, expires_at, created_at in self.store.load_sessions(
+            now
+        ):
+            self._tokens[token] = SessionToken(
+                refresh_token, _from_timestamp(expires_at), _from_timestamp(created_at)
+            )
+        self._heap = [
+            (entry.expires_at, token) for token, entry in self._tokens.items()
+        ]
+        heapq.heapify(self._heap)
+
+    def _save(self, token: str, entry: SessionToken):
+        self.store.save_session(
+            token,
+            entry.refresh_token,
+            _to_timestamp(entry.expires_at),
+            _to_timestamp(entry.created_at),
+        )
+
+    def _recent_miss(self, token: str) -> bool:
+        expires = self._misses.get(token)
+        return expires is not None and expires > time.monotonic()
+
+    def needs_lookup(self, token: str) -> bool:
+        return token not in self._tokens and not self._recent_miss(token)
+
+    def is_valid(self, token: str, now: datetime) -> bool:
+        entry = self._tokens.get(token)
+        if entry is None:
+            if self._recent_miss(token):
+                return False
+            # 可能是其他 worker 建立的 session
+            row = self.store.get_session(token)
+            if row is None:
+                with self._lock:
+                    if len(self._misses) >= MISS_CACHE_MAX_ENTRIES:
+                        self._misses.clear()
+                    self._misses[token] = time.monotonic() + MISS_CACHE_SECONDS
+                return False
+            entry = SessionToken(
+                row[0], _from_timestamp(row[1]), _from_timestamp(row[2])
+            )
+            with self._lock:
+                self._tokens[token] = entry
+                heapq.heappush(self._heap, (entry.expires_at, token))
+        return entry.expires_at > now
+
+    def create(self, token: str, entry: SessionToken):
+        # 先寫入 store，返回前其他 worker 就能驗證
+        self._save(token, entry)
+        with self._lock:
+            self._misses.pop(token, None)
+            self._tokens[token] = entry
+            heapq.heappush(self._heap, (entry.expires_at, token))
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        now = now or datetime.utcnow()
+        removed = super().sweep(now)
+        self.store.delete_expired_sessions(_to_timestamp(now))
+        return removed
+
+    def flush(self):
+        pass
+
+    def compact(self):
+        pass
+
+
+def create_session_store() -> SessionTokenStore:
+    """依環境變數建立 SessionTokenStore（檔案位於目前工作目錄）"""
+    store = get_state_store()
+    if store.shared:
+        return SharedSessionTokenStore(
+            store,
+            os.path.join(os.getcwd(), ".session_tokens.jsonl"),
+            sweep_interval=env_int("PT1_SESSION_SWEEP_SECONDS", 60),
+        )
+    return SessionTokenStore(
+        os.path.join(os.getcwd(), ".session_tokens.jsonl"),
+        legacy_path=os.path.join(os.getcwd(), ".session_tokens.json"),
+        flush_interval=env_int("PT1_SESSION_FLUSH_MS", 50) / 1000,
+        sweep_interval=env_int("PT1_SESSION_SWEEP_SECONDS", 60),
+    )
+
+
+# Global instance
+_session_store = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionTokenStore:
+    """取得 SessionTokenStore 單例"""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = create_session_store()
+    return _session_store
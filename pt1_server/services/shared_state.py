@@ -0,0 +1,488 @@
+"""
+Shared state for multi-worker deployments
+
+PT1_STATE_BACKEND=shared（PT1_WORKERS 大於 1 時自動使用）時，命令、客戶端
+註冊表與 session token 存放在所有 worker process 共用的 SQLite（WAL）中，
+而不是各 process 的記憶體：
+
+- 寫入是同步的 transaction，commit 後其他 worker 立即可以讀到
+- 派送命令以 BEGIN IMMEDIATE transaction 取出並標記 executing，
+  兩個 worker 不會把同一個命令交給兩個 poll
+- 狀態變化另外寫入 changes 表；每個 worker 的 watcher thread 每
+  PT1_SHARED_POLL_MS 毫秒檢查（PRAGMA data_version 沒變時不查詢），
+  喚醒本 process 中等待的 long-poll 與 /command_events
+
+SharedStateStore 實作 StateStore 介面再加上共用狀態需要的查詢；其他共用
+backend（例如 Redis）只要提供相同的方法即可替換。
+
+另外提供 file_lock()（跨 process 的 read-modify-write，例如 tokens.json）與
+LeaderLock（只由一個 worker 執行 retention 等背景工作）。
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支援多 worker，file lock 不做任何事
+    fcntl = None
+
+from .storage import (
+    _CLIENT_COLUMNS,
+    _COMMAND_COLUMNS,
+    _SCHEMA,
+    StateStore,
+    _client_row,
+    _command_from_row,
+    _command_row,
+    _migrate_schema,
+)
+
+# changes 表的 channel
+CHANGE_COMMAND = "command"  # key: stable_id，有新的 pending 命令
+CHANGE_STATUS = "status"  # key: command_id，命令狀態改變
+
+# changes 表保留的秒數（watcher 落後超過這個時間的通知會遺失）
+CHANGE_RETENTION_SECONDS = 300
+
+_SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token         TEXT PRIMARY KEY,
+    refresh_token TEXT NOT NULL,
+    expires_at    REAL NOT NULL,
+    created_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at);
+
+CREATE TABLE IF NOT EXISTS changes (
+    seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel    TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+ChangeListener = Callable[[str, str], None]
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """以 <path>.lock 取得跨 process 的排他 lock"""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class LeaderLock:
+    """非阻塞的 leader lock；取得後持有到 process 結束"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if fcntl is None:
+            return True
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+
+class SharedStateStore(StateStore):
+    """多個 worker process 共用的 SQLite state store（同步寫入）"""
+
+    persistent = True
+    shared = True
+
+    def __init__(self, path: str, poll_interval: float = 0.1):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._conn = self._connect()
+        self._conn.executescript(_SCHEMA + _SHARED_SCHEMA)
+        _migrate_schema(self._conn)
+        # 同一個 process 內共用一個連線
+        self._lock = threading.Lock()
+
+        self._listeners: List[ChangeListener] = []
+        self._last_seq = self._conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM changes"
+        ).fetchone()[0]
+        self._stop = threading.Event()
+        self._watcher = threading.Thread(
+            target=self._watch_loop, name="pt1-shared-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None：由程式明確控制 transaction
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self, immediate: bool = False):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _publish(conn: sqlite3.Connection, changes: Iterable[Tuple[str, str]]):
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO changes (channel, key, created_at) VALUES (?, ?, ?)",
+            [(channel, key, now) for channel, key in changes],
+        )
+
+    # ---- commands ----------------------------------------------------------
+
+    def load_commands(self, finished_limit: int) -> List[dict]:
+        # 共用模式不在記憶體中保存命令
+        return []
+
+    def get_command(self, command_id: str) -> Optional[dict]:
+        rows = self._query(
+            f"SELECT {', '.join(_COMMAND_COLUMNS)} FROM commands WHERE command_id = ?",
+            (command_id,),
+        )
+        return _command_from_row(rows[0]) if rows else None
+
+    def save_command(self, command_info, changes: Iterable[Tuple[str, str]] = ()):
+        """寫入命令並在同一個 transaction 中發布 changes"""
+        row = _command_row(command_info)
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO commands ({', '.join(_COMMAND_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COMMAND_COLUMNS))})",
+                row,
+            )
+            if changes:
+                self._publish(conn, changes)
+
+    def update_command(
+        self,
+        command_info,
+        columns: Iterable[str],
+        changes: Iterable[Tuple[str, str]] = (),
+    ):
+        """
+        只更新指定欄位（例如 status 或 files），避免以另一個 worker 讀到的舊資料
+        覆蓋其他欄位
+        """
+        values = dict(zip(_COMMAND_COLUMNS, _command_row(command_info)))
+        columns = list(columns)
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE commands SET {', '.join(f'{c} = ?' for c in columns)} "
+                "WHERE command_id = ?",
+                [values[c] for c in columns] + [command_info.command_id],
+            )
+            if changes:
+                self._publish(conn, changes)
+
+    def append_command_files(
+        self,
+        command_id: str,
+        files: List[dict],
+        result_type_for: Callable[[str, int], str],
+    ) -> Optional[Tuple[List[dict], str]]:
+        """
+        把 files 加到命令目前的檔案列表，並以 result_type_for(result, 檔案數)
+        重新計算 result_type
+
+        讀取與寫入在同一個 BEGIN IMMEDIATE transaction 中，兩個 worker 同時
+        加入檔案時不會互相覆蓋。
+
+        Returns:
+            (更新後的檔案列表, result_type)；命令不存在時返回 None
+        """
+        with self._transaction(immediate=True) as conn:
+            row = conn.execute(
+                "SELECT result, files FROM commands WHERE command_id = ?",
+                (command_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            merged = json.loads(row[1] or "[]") + list(files)
+            result_type = result_type_for(row[0] or "", len(merged))
+            conn.execute(
+                "UPDATE commands SET files = ?, result_type = ? WHERE command_id = ?",
+                (json.dumps(merged), result_type, command_id),
+            )
+        return merged, result_type
+
+    def delete_commands(self, command_ids: Iterable[str]):
+        with self._transaction() as conn:
+            conn.executemany(
+                "DELETE FROM commands WHERE command_id = ?",
+                [(command_id,) for command_id in command_ids],
+            )
+
+    def expired_command_ids(self, cutoff: float, limit: int) -> List[str]:
+        rows = self._query(
+            "SELECT command_id FROM commands "
+            "WHERE status NOT IN ('pending', 'executing') AND created_at < ? "
+            "ORDER BY created_at LIMIT ?",
+            (cutoff, limit),
+        )
+        return [row[0] for row in rows]
+
+    def next_pending_command(self, stable_id: str) -> Optional[dict]:
+        rows = self._query(
+            f"SELECT {', '.join(_COMMAND_COLUMNS)} FROM commands "
+            "WHERE stable_id = ? AND status = 'pending' "
+            "ORDER BY created_at, rowid LIMIT 1",
+            (stable_id,),
+        )
+        return _command_from_row(rows[0]) if rows else None
+
+    def claim_next_commands(
+        self, stable_id: str, now: float, lease_seconds: float, limit: int = 1
+    ) -> Tuple[List[dict], List[str]]:
+        """
+        依建立順序取出 client 最早的 limit 個 pending 命令並標記為 executing，
+        lease 到 now + lease_seconds
+
+        BEGIN IMMEDIATE 先取得資料庫的寫入 lock，查詢與更新之間其他 worker
+        無法修改，因此每個命令只會被派送一次。同一個 transaction 中先把這個
+        client lease 已過期的 executing 命令放回 pending。
+
+        Returns:
+            (取出的命令, 放回佇列的 command ID)
+        """
+        lease_expires_at = now + lease_seconds
+        with self._transaction(immediate=True) as conn:
+            requeued = [c for c, _ in self._requeue_expired(conn, now, stable_id)]
+            rows = conn.execute(
+                f"SELECT {', '.join(_COMMAND_COLUMNS)} FROM commands "
+                "WHERE stable_id = ? AND status = 'pending' "
+                "ORDER BY created_at, rowid LIMIT ?",
+                (stable_id, limit),
+            ).fetchall()
+            claimed = [_command_from_row(row) for row in rows]
+            for data in claimed:
+                data["status"] = "executing"
+                data["scheduled_at"] = now
+                data["lease_expires_at"] = lease_expires_at
+            if claimed:
+                conn.executemany(
+                    "UPDATE commands SET status = 'executing', scheduled_at = ?, "
+                    "lease_expires_at = ? WHERE command_id = ?",
+                    [(now, lease_expires_at, d["command_id"]) for d in claimed],
+                )
+                self._publish(conn, [(CHANGE_STATUS, d["command_id"]) for d in claimed])
+        return claimed, requeued
+
+    def _requeue_expired(
+        self, conn: sqlite3.Connection, now: float, stable_id: Optional[str] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        把 lease 已過期的 executing 命令放回 pending（需在 transaction 中呼叫），
+        返回 (command_id, stable_id)
+        """
+        where, params = ("AND stable_id = ?", (stable_id,)) if stable_id else ("", ())
+        rows = conn.execute(
+            "UPDATE commands SET status = 'pending', scheduled_at = NULL, "
+            "lease_expires_at = NULL "
+            f"WHERE status = 'executing' AND lease_expires_at < ? {where} "
+            "RETURNING command_id, stable_id",
+            (now,) + params,
+        ).fetchall()
+        if rows:
+            self._publish(
+                conn,
+                [(CHANGE_STATUS, command_id) for command_id, _ in rows]
+                + [(CHANGE_COMMAND, client_id) for client_id in {r[1] for r in rows}],
+            )
+        return rows
+
+    def requeue_expired_leases(self, now: float) -> List[Tuple[str, str]]:
+        """所有 client lease 已過期的 executing 命令放回 pending"""
+        with self._transaction(immediate=True) as conn:
+            return self._requeue_expired(conn, now)
+
+    def renew_leases(self, stable_id: str, lease_expires_at: float) -> int:
+        """延長 client 所有 executing 命令的 lease，返回延長的命令數"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE commands SET lease_expires_at = ? "
+                "WHERE stable_id = ? AND status = 'executing'",
+                (lease_expires_at, stable_id),
+            ).rowcount
+
+    def list_commands(
+        self, stable_id: Optional[str], limit: int
+    ) -> Tuple[List[dict], int]:
+        """由新到舊的命令與總數"""
+        where, params = ("WHERE stable_id = ?", (stable_id,)) if stable_id else ("", ())
+        rows = self._query(
+            f"SELECT {', '.join(_COMMAND_COLUMNS)} FROM commands {where} "
+            "ORDER BY created_at DESC LIMIT ?",
+            params + (limit,),
+        )
+        total = self._query(f"SELECT COUNT(*) FROM commands {where}", params)[0][0]
+        return [_command_from_row(row) for row in rows], total
+
+    def count_commands(self) -> int:
+        return self._query("SELECT COUNT(*) FROM commands")[0][0]
+
+    def active_command_counts(
+        self, stable_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, int]]:
+        where, params = (
+            ("AND stable_id = ?", (stable_id,)) if stable_id is not None else ("", ())
+        )
+        rows = self._query(
+            "SELECT stable_id, status, COUNT(*) FROM commands "
+            f"WHERE status IN ('pending', 'executing') {where} "
+            "GROUP BY stable_id, status",
+            params,
+        )
+        counts: Dict[str, Dict[str, int]] = {}
+        for client_id, status, count in rows:
+            counts.setdefault(client_id, {"pending": 0, "executing": 0})[status] = count
+        return counts
+
+    def executing_commands(self, scheduled_before: float) -> List[dict]:
+        """scheduled_at 早於指定時間的 executing 命令（由舊到新）"""
+        rows = self._query(
+            f"SELECT {', '.join(_COMMAND_COLUMNS)} FROM commands "
+            "WHERE status = 'executing' AND scheduled_at < ? ORDER BY scheduled_at",
+            (scheduled_before,),
+        )
+        return [_command_from_row(row) for row in rows]
+
+    # ---- clients -----------------------------------------------------------
+
+    def load_clients(self) -> List[dict]:
+        rows = self._query(f"SELECT {', '.join(_CLIENT_COLUMNS)} FROM clients")
+        return [self._client_from_row(row) for row in rows]
+
+    def get_client(self, stable_id: str) -> Optional[dict]:
+        rows = self._query(
+            f"SELECT {', '.join(_CLIENT_COLUMNS)} FROM clients WHERE stable_id = ?",
+            (stable_id,),
+        )
+        return self._client_from_row(rows[0]) if rows else None
+
+    def count_clients(self) -> int:
+        return self._query("SELECT COUNT(*) FROM clients")[0][0]
+
+    @staticmethod
+    def _client_from_row(row: tuple) -> dict:
+        data = dict(zip(_CLIENT_COLUMNS, row))
+        data["terminated"] = bool(data["terminated"])
+        return data
+
+    def save_client(self, client_info):
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO clients ({', '.join(_CLIENT_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_CLIENT_COLUMNS))})",
+                _client_row(client_info),
+            )
+
+    # ---- sessions ----------------------------------------------------------
+
+    def save_session(
+        self, token: str, refresh_token: str, expires_at: float, created_at: float
+    ):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions "
+                "(token, refresh_token, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (token, refresh_token, expires_at, created_at),
+            )
+
+    def get_session(self, token: str) -> Optional[Tuple[str, float, float]]:
+        """返回 (refresh_token, expires_at, created_at)"""
+        rows = self._query(
+            "SELECT refresh_token, expires_at, created_at FROM sessions WHERE token = ?",
+            (token,),
+        )
+        return rows[0] if rows else None
+
+    def load_sessions(self, now: float) -> List[Tuple[str, str, float, float]]:
+        return self._query(
+            "SELECT token, refresh_token, expires_at, created_at FROM sessions "
+            "WHERE expires_at > ?",
+            (now,),
+        )
+
+    def delete_expired_sessions(self, now: float) -> int:
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM sessions WHERE expires_at <= ?", (now,)
+            ).rowcount
+
+    # ---- change feed -------------------------------------------------------
+
+    def add_change_listener(self, listener: ChangeListener):
+        """listener(channel, key) 在 watcher thread 中被呼叫"""
+        self._listeners.append(listener)
+
+    def _watch_loop(self):
+        conn = self._connect()
+        data_version = None
+        last_prune = 0.0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                # data_version 只在其他連線 commit 後改變
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version == data_version:
+                    continue
+                data_version = version
+
+                rows = conn.execute(
+                    "SELECT seq, channel, key FROM changes WHERE seq > ? ORDER BY seq",
+                    (self._last_seq,),
+                ).fetchall()
+                for seq, channel, key in rows:
+                    self._last_seq = seq
+                    for listener in self._listeners:
+                        listener(channel, key)
+
+                now = time.time()
+                if now - last_prune > 60:
+                    last_prune = now
+                    with self._transaction() as write_conn:
+                        write_conn.execute(
+                            "DELETE FROM changes WHERE created_at < ?",
+                            (now - CHANGE_RETENTION_SECONDS,),
+                        )
+            except sqlite3.Error as e:
+                print(f"[Storage] ERROR: Shared state watcher failed: {e}")
+        conn.close()
+
+    def close(self):
+        self._stop.set()
+        self._watcher.join(timeout=5)
+        with self._lock:
+            self._conn.close()
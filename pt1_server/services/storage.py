@@ -0,0 +1,402 @@
+"""
+State storage backends
+
+CommandManager 與 client registry 的持久化層。記憶體中的資料結構仍是主要的
+讀取來源，storage 以 write-behind 方式保存變更：
+
+- MemoryStateStore: 不保存（預設，與原本行為相同）
+- SQLiteStateStore: SQLite WAL，背景 thread 以 group commit 批次寫入
+- SharedStateStore: 多個 worker 共用的 SQLite，同步寫入且不在記憶體保存命令
+  （services/shared_state.py）
+
+設定（環境變數）：
+    PT1_STATE_BACKEND   memory | sqlite | shared（預設 memory；PT1_WORKERS > 1 時為 shared）
+    PT1_STATE_DB        SQLite 檔案路徑（預設 ./pt1_state.db）
+    PT1_STATE_FLUSH_MS  group commit 間隔毫秒數（預設 50）
+    PT1_STATE_PRELOAD   啟動時載入的已完成命令數量（預設 10000）
+    PT1_SHARED_POLL_MS  shared 模式檢查其他 worker 變更的間隔毫秒數（預設 100）
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+from .config import env_int
+
+
+class StateStore:
+    """Storage 介面；預設實作不保存任何資料"""
+
+    # True 表示從記憶體移除的命令仍可由 get_command() 讀回
+    persistent = False
+    # True 表示多個 worker process 共用同一份狀態（見 shared_state.py）
+    shared = False
+
+    def load_commands(self, finished_limit: int) -> List[dict]:
+        """載入所有 pending/executing 命令與最近 finished_limit 筆其他命令"""
+        return []
+
+    def get_command(self, command_id: str) -> Optional[dict]:
+        return None
+
+    def save_command(self, command_info):
+        pass
+
+    def delete_commands(self, command_ids: Iterable[str]):
+        pass
+
+    def expired_command_ids(self, cutoff: float, limit: int) -> List[str]:
+        """created_at 早於 cutoff 的已完成命令（由舊到新，最多 limit 筆）"""
+        return []
+
+    def load_clients(self) -> List[dict]:
+        return []
+
+    def save_client(self, client_info):
+        pass
+
+    def flush(self):
+        """等待所有已排入的寫入完成"""
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """純記憶體模式（重啟後資料消失）"""
+
+
+_COMMAND_COLUMNS = (
+    "command_id",
+    "stable_id",
+    "command",
+    "status",
+    "created_at",
+    "scheduled_at",
+    "finished_at",
+    "result",
+    "result_type",
+    "files",
+    "lease_expires_at",
+)
+
+_CLIENT_COLUMNS = (
+    "stable_id",
+    "client_id",
+    "hostname",
+    "username",
+    "first_seen",
+    "last_seen",
+    "status",
+    "terminated",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    command_id   TEXT PRIMARY KEY,
+    stable_id    TEXT NOT NULL,
+    command      TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    scheduled_at REAL,
+    finished_at  REAL,
+    result       TEXT NOT NULL DEFAULT '',
+    result_type  TEXT NOT NULL DEFAULT 'text',
+    files        TEXT NOT NULL DEFAULT '[]',
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_commands_client_status
+    ON commands (stable_id, status, created_at);
+CREATE INDEX IF NOT EXISTS idx_commands_created_at ON commands (created_at);
+
+CREATE TABLE IF NOT EXISTS clients (
+    stable_id  TEXT PRIMARY KEY,
+    client_id  TEXT NOT NULL,
+    hostname   TEXT NOT NULL,
+    username   TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    status     TEXT NOT NULL,
+    terminated INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _command_row(command_info) -> tuple:
+    return (
+        command_info.command_id,
+        command_info.stable_id,
+        command_info.command,
+        command_info.status,
+        command_info.created_at,
+        command_info.scheduled_at,
+        command_info.finished_at,
+        command_info.result,
+        command_info.result_type.value,
+        (
+            json.dumps(jsonable_encoder(command_info.files))
+            if command_info.files
+            else "[]"
+        ),
+        command_info.lease_expires_at,
+    )
+
+
+def _migrate_schema(conn: sqlite3.Connection):
+    """舊版資料庫補上後來新增的欄位（多個 worker 可能同時執行）"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(commands)")}
+    if "lease_expires_at" not in columns:
+        try:
+            conn.execute("ALTER TABLE commands ADD COLUMN lease_expires_at REAL")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e):
+                raise
+
+
+def _command_from_row(row: tuple) -> dict:
+    data = dict(zip(_COMMAND_COLUMNS, row))
+    data["files"] = json.loads(data["files"] or "[]")
+    return data
+
+
+def _client_row(client_info) -> tuple:
+    return (
+        client_info.stable_id,
+        client_info.client_id,
+        client_info.hostname,
+        client_info.username,
+        client_info.first_seen,
+        client_info.last_seen,
+        client_info.status,
+        int(client_info.terminated),
+    )
+
+
+class SQLiteStateStore(StateStore):
+    """SQLite WAL backend with write-behind group commit
+
+    save_command()/save_client() 只把物件放進 dirty map（同一筆資料多次修改會合併），
+    背景 thread 每 flush_interval 秒把所有 dirty 資料寫在同一個 transaction 中。
+    程式崩潰時最多遺失最後一個 flush 間隔內的變更。
+    """
+
+    persistent = True
+
+    def __init__(self, path: str, flush_interval: float = 0.05):
+        self.path = path
+        self.flush_interval = flush_interval
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        _migrate_schema(conn)
+        conn.commit()
+
+        self._dirty_commands: Dict[str, object] = {}
+        self._dirty_clients: Dict[str, object] = {}
+        self._deleted_commands: set = set()
+        self._cond = threading.Condition()
+        self._pending_generation = 0
+        self._written_generation = 0
+        self._closed = False
+
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+
+        self._writer = threading.Thread(
+            target=self._write_loop, name="pt1-state-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---- reads -------------------------------------------------------------
+
+    def load_commands(self, finished_limit: int) -> List[dict]:
+        columns = ", ".join(_COMMAND_COLUMNS)
+        with self._read_lock:
+            active = self._read_conn.execute(
+                f"SELECT {columns} FROM commands "
+                "WHERE status IN ('pending', 'executing') ORDER BY created_at"
+            ).fetchall()
+            recent = self._read_conn.execute(
+                f"SELECT {columns} FROM commands "
+                "WHERE status NOT IN ('pending', 'executing') "
+                "ORDER BY created_at DESC LIMIT ?",
+                (finished_limit,),
+            ).fetchall()
+        rows = list(reversed(recent)) + active
+        return [_command_from_row(row) for row in rows]
+
+    def get_command(self, command_id: str) -> Optional[dict]:
+        columns = ", ".join(_COMMAND_COLUMNS)
+        with self._read_lock:
+            row = self._read_conn.execute(
+                f"SELECT {columns} FROM commands WHERE command_id = ?", (command_id,)
+            ).fetchone()
+        return _command_from_row(row) if row else None
+
+    def expired_command_ids(self, cutoff: float, limit: int) -> List[str]:
+        with self._read_lock:
+            rows = self._read_conn.execute(
+                "SELECT command_id FROM commands "
+                "WHERE status NOT IN ('pending', 'executing') AND created_at < ? "
+                "ORDER BY created_at LIMIT ?",
+                (cutoff, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_clients(self) -> List[dict]:
+        columns = ", ".join(_CLIENT_COLUMNS)
+        with self._read_lock:
+            rows = self._read_conn.execute(f"SELECT {columns} FROM clients").fetchall()
+        clients = []
+        for row in rows:
+            data = dict(zip(_CLIENT_COLUMNS, row))
+            data["terminated"] = bool(data["terminated"])
+            clients.append(data)
+        return clients
+
+    # ---- writes ------------------------------------------------------------
+
+    def _mark_dirty(self):
+        self._pending_generation += 1
+        # writer 只在閒置時需要喚醒，批次期間的寫入不必再 notify
+        if self._pending_generation == self._written_generation + 1:
+            self._cond.notify()
+
+    def save_command(self, command_info):
+        with self._cond:
+            self._deleted_commands.discard(command_info.command_id)
+            self._dirty_commands[command_info.command_id] = command_info
+            self._mark_dirty()
+
+    def delete_commands(self, command_ids: Iterable[str]):
+        with self._cond:
+            for command_id in command_ids:
+                self._dirty_commands.pop(command_id, None)
+                self._deleted_commands.add(command_id)
+            self._mark_dirty()
+
+    def save_client(self, client_info):
+        with self._cond:
+            self._dirty_clients[client_info.stable_id] = client_info
+            self._mark_dirty()
+
+    def flush(self):
+        with self._cond:
+            target = self._pending_generation
+            self._cond.notify_all()
+            while self._written_generation < target and self._writer.is_alive():
+                self._cond.wait(1)
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            with self._cond:
+                while (
+                    self._written_generation == self._pending_generation
+                    and not self._closed
+                ):
+                    self._cond.wait()
+                if (
+                    self._closed
+                    and self._written_generation == self._pending_generation
+                ):
+                    break
+
+            # 等待 flush_interval，讓同一段時間內的寫入合併成一次 commit
+            time.sleep(self.flush_interval)
+
+            with self._cond:
+                generation = self._pending_generation
+                commands = list(self._dirty_commands.values())
+                clients = list(self._dirty_clients.values())
+                deleted = list(self._deleted_commands)
+                self._dirty_commands = {}
+                self._dirty_clients = {}
+                self._deleted_commands = set()
+
+            try:
+                command_rows = [_command_row(c) for c in commands]
+                client_rows = [_client_row(c) for c in clients]
+                with conn:
+                    if command_rows:
+                        conn.executemany(
+                            f"INSERT OR REPLACE INTO commands ({', '.join(_COMMAND_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(_COMMAND_COLUMNS))})",
+                            command_rows,
+                        )
+                    if client_rows:
+                        conn.executemany(
+                            f"INSERT OR REPLACE INTO clients ({', '.join(_CLIENT_COLUMNS)}) "
+                            f"VALUES ({', '.join('?' * len(_CLIENT_COLUMNS))})",
+                            client_rows,
+                        )
+                    if deleted:
+                        conn.executemany(
+                            "DELETE FROM commands WHERE command_id = ?",
+                            [(command_id,) for command_id in deleted],
+                        )
+            except sqlite3.Error as e:
+                print(f"[Storage] ERROR: Failed to write batch: {e}")
+
+            with self._cond:
+                self._written_generation = generation
+                self._cond.notify_all()
+        conn.close()
+
+
+# Global instance
+_state_store: Optional[StateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def create_state_store() -> StateStore:
+    """依環境變數建立 storage backend"""
+    backend = os.getenv("PT1_STATE_BACKEND", "memory").lower()
+    if backend == "sqlite":
+        path = os.getenv("PT1_STATE_DB", os.path.join(os.getcwd(), "pt1_state.db"))
+        flush_ms = env_int("PT1_STATE_FLUSH_MS", 50)
+        print(f"[Storage] Using SQLite state store: {path}")
+        return SQLiteStateStore(path, flush_interval=flush_ms / 1000)
+    if backend == "shared":
+        from .shared_state import SharedStateStore
+
+        path = os.getenv("PT1_STATE_DB", os.path.join(os.getcwd(), "pt1_state.db"))
+        poll_ms = env_int("PT1_SHARED_POLL_MS", 100)
+        print(f"[Storage] Using shared state store: {path} (pid {os.getpid()})")
+        return SharedStateStore(path, poll_interval=poll_ms / 1000)
+    if backend != "memory":
+        print(f"[Storage] Warning: Unknown PT1_STATE_BACKEND '{backend}', using memory")
+    return MemoryStateStore()
+
+
+def get_state_store() -> StateStore:
+    """取得 storage 單例"""
+    global _state_store
+    if _state_store is None:
+        with _state_store_lock:
+            if _state_store is None:
+                _state_store = create_state_store()
+    return _state_store
+
+
+def preload_limit() -> int:
+    """啟動時載入記憶體的已完成命令數量"""
+    return env_int("PT1_STATE_PRELOAD", 10000)
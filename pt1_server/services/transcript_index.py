@@ -0,0 +1,311 @@
+"""
+Transcript metadata index
+
+list_transcripts 不再每次掃描整個 transcript 目錄，而是使用記憶體中的索引：
+
+- _entries: transcript_id -> entry（client、大小、時間、metadata）
+- _global / _by_client: 依上傳順序（seq）排列的 transcript_id 列表
+
+列表由新到舊走訪，成本為 O(limit)；cursor 是上一頁最後一筆的 seq。
+刪除只移除 _entries，列表中的項目在走訪時略過，累積過多時再整理。
+
+索引以 append-only JSONL（index.jsonl）保存，每行一筆 add 或 del 記錄；
+刪除記錄過多時重寫檔案。索引檔不存在時（舊版資料）掃描目錄一次建立。
+
+多 worker 模式（shared=True）時每個 worker 各自維護記憶體索引：寫入前以
+index.jsonl.lock 取得檔案 lock 並先讀入其他 worker 新增的記錄，讀取前檢查檔案
+是否變大（接著讀取新增的行）或被重寫（inode 改變，重新載入）。
+"""
+
+import contextlib
+import json
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .shared_state import file_lock
+
+INDEX_FILENAME = "index.jsonl"
+
+
+def _client_from_transcript_id(transcript_id: str) -> str:
+    """transcript_id 格式為 <client_id>_<YYYYmmdd>_<HHMMSS>_<ms>"""
+    parts = transcript_id.rsplit("_", 3)
+    return parts[0] if len(parts) == 4 else "unknown"
+
+
+class TranscriptIndex:
+    def __init__(self, transcript_dir: Path, shared: bool = False):
+        self.transcript_dir = Path(transcript_dir)
+        self.index_path = self.transcript_dir / INDEX_FILENAME
+        self.shared = shared
+        self._reset()
+        self._lock = threading.Lock()
+
+        with self._file_lock():
+            if self.index_path.exists():
+                self._load()
+            else:
+                self._rebuild_from_directory()
+
+    def _reset(self):
+        self._entries: Dict[str, dict] = {}
+        self._global: List[Tuple[int, str]] = []
+        self._by_client: Dict[str, List[Tuple[int, str]]] = {}
+        self._next_seq = 1
+        self._total_size = 0
+        self._dead_records = 0  # 檔案中已失效的記錄數（del 與被刪除的 add）
+        # 已讀入的索引檔位置與 inode（shared 模式追蹤其他 worker 的寫入）
+        self._offset = 0
+        self._inode = None
+
+    def _file_lock(self):
+        if self.shared:
+            return file_lock(str(self.index_path))
+        return contextlib.nullcontext()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        with open(self.index_path, "rb") as f:
+            self._inode = os.fstat(f.fileno()).st_ino
+            self._read_records(f)
+        self._compact_lists()
+
+    def _read_records(self, f):
+        """從 self._offset 讀取到檔案結尾（不含尚未寫完的最後一行）"""
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            self._offset += len(line)
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 寫入中斷留下的不完整行
+                continue
+            if record.get("op") == "add":
+                self._add(record["entry"])
+            elif record.get("op") == "del":
+                self._remove(record["transcript_id"])
+                self._dead_records += 2
+
+    def _follow(self):
+        """shared 模式：讀入其他 worker 寫入的記錄（呼叫端持有 self._lock）"""
+        if not self.shared:
+            return
+        try:
+            stat_result = os.stat(self.index_path)
+        except OSError:
+            return
+        if stat_result.st_ino != self._inode:
+            # 其他 worker 重寫了索引檔
+            self._reset()
+            self._load()
+        elif stat_result.st_size > self._offset:
+            with open(self.index_path, "rb") as f:
+                self._read_records(f)
+
+    def _rebuild_from_directory(self):
+        """由 transcript 檔案與 _metadata.json 建立索引（只在沒有索引檔時執行）"""
+        files = []
+        for pattern in ("*.txt", "*.txt.gz"):
+            for path in self.transcript_dir.glob(pattern):
+                try:
+                    files.append((path.stat(), path))
+                except OSError:
+                    continue
+        files.sort(key=lambda item: item[0].st_mtime)
+
+        for stat_info, path in files:
+            transcript_id = path.name.split(".txt", 1)[0]
+            metadata = {}
+            metadata_path = self.transcript_dir / f"{transcript_id}_metadata.json"
+            if metadata_path.exists():
+                try:
+                    with open(metadata_path, "r", encoding="utf-8") as f:
+                        metadata = json.load(f)
+                except Exception:
+                    pass
+            self._add(
+                {
+                    "transcript_id": transcript_id,
+                    "client_id": metadata.get("client_id")
+                    or _client_from_transcript_id(transcript_id),
+                    "file_size": stat_info.st_size,
+                    "created_time": datetime.fromtimestamp(
+                        stat_info.st_ctime
+                    ).isoformat(),
+                    "modified_time": datetime.fromtimestamp(
+                        stat_info.st_mtime
+                    ).isoformat(),
+                    "metadata": metadata,
+                }
+            )
+        self._rewrite()
+
+    # ------------------------------------------------------------------
+    # In-memory structures
+    # ------------------------------------------------------------------
+
+    def _add(self, entry: dict):
+        transcript_id = entry["transcript_id"]
+        if transcript_id in self._entries:
+            self._remove(transcript_id)
+        seq = entry.get("seq") or self._next_seq
+        entry["seq"] = seq
+        self._next_seq = max(self._next_seq, seq + 1)
+        self._entries[transcript_id] = entry
+        self._total_size += entry.get("file_size", 0)
+        self._global.append((seq, transcript_id))
+        self._by_client.setdefault(entry["client_id"], []).append((seq, transcript_id))
+
+    def _remove(self, transcript_id: str) -> Optional[dict]:
+        # 列表中的項目保留，走訪時以 _entries 判斷是否仍存在
+        entry = self._entries.pop(transcript_id, None)
+        if entry is not None:
+            self._total_size -= entry.get("file_size", 0)
+        return entry
+
+    def _is_live(self, item: Tuple[int, str]) -> bool:
+        entry = self._entries.get(item[1])
+        return entry is not None and entry["seq"] == item[0]
+
+    def _compact_lists(self):
+        """移除列表中已刪除的項目"""
+        self._global = [item for item in self._global if self._is_live(item)]
+        for client_id in list(self._by_client):
+            items = [item for item in self._by_client[client_id] if self._is_live(item)]
+            if items:
+                self._by_client[client_id] = items
+            else:
+                del self._by_client[client_id]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _append(self, record: dict):
+        with open(self.index_path, "ab") as f:
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+            self._offset = f.tell()
+
+    def _rewrite(self):
+        """只保留目前存在的 entry，原子地重寫索引檔"""
+        tmp_path = self.index_path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for _, transcript_id in self._global:
+                entry = self._entries.get(transcript_id)
+                if entry is not None:
+                    record = {"op": "add", "entry": entry}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.index_path)
+        stat_result = os.stat(self.index_path)
+        self._inode, self._offset = stat_result.st_ino, stat_result.st_size
+        self._dead_records = 0
+
+    def _maybe_compact(self):
+        if self._dead_records > max(1000, len(self._entries)):
+            self._compact_lists()
+            self._rewrite()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(
+        self,
+        transcript_id: str,
+        client_id: str,
+        file_size: int,
+        metadata: Optional[dict] = None,
+    ) -> dict:
+        now = datetime.now().isoformat()
+        entry = {
+            "transcript_id": transcript_id,
+            "client_id": client_id,
+            "file_size": file_size,
+            "created_time": now,
+            "modified_time": now,
+            "metadata": metadata or {},
+        }
+        with self._lock, self._file_lock():
+            self._follow()
+            self._add(entry)
+            self._append({"op": "add", "entry": entry})
+        return entry
+
+    def remove(self, transcript_id: str) -> bool:
+        with self._lock, self._file_lock():
+            self._follow()
+            if self._remove(transcript_id) is None:
+                return False
+            self._append({"op": "del", "transcript_id": transcript_id})
+            self._dead_records += 2
+            self._maybe_compact()
+        return True
+
+    def refresh(self):
+        """shared 模式：讀入其他 worker 的變更"""
+        if self.shared:
+            with self._lock:
+                self._follow()
+
+    def get(self, transcript_id: str) -> Optional[dict]:
+        self.refresh()
+        return self._entries.get(transcript_id)
+
+    def list(
+        self,
+        client_id: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[int] = None,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        由新到舊列出 transcript
+
+        Args:
+            client_id: 只列出此 client 的 transcript
+            limit: 最多返回筆數
+            cursor: 上一頁返回的 next_cursor（只列出 seq 小於它的項目）
+
+        Returns:
+            (entries, next_cursor)；沒有更多資料時 next_cursor 為 None
+        """
+        with self._lock:
+            self._follow()
+            items = (
+                self._global
+                if client_id is None
+                else self._by_client.get(client_id, [])
+            )
+            end = len(items) if cursor is None else bisect_left(items, (cursor, ""))
+
+            results = []
+            position = end - 1
+            while position >= 0 and len(results) < limit:
+                item = items[position]
+                if self._is_live(item):
+                    results.append(self._entries[item[1]])
+                position -= 1
+
+            # 確認後面是否還有資料，避免返回指向空頁的 cursor
+            while position >= 0 and not self._is_live(items[position]):
+                position -= 1
+            next_cursor = results[-1]["seq"] if results and position >= 0 else None
+
+        return results, next_cursor
+
+    def total_size(self) -> int:
+        """所有 transcript 的 file_size 總和"""
+        self.refresh()
+        return self._total_size
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._entries)
@@ -1,21 +1,85 @@
 """
 Agent Transcript Management Module
 Handles transcript upload, storage, and retrieval for agent sessions
+
+Transcripts are stored gzip-compressed as <transcript_id>.txt.gz; older
+uncompressed <transcript_id>.txt files are still read.
 """
 
+import codecs
+import gzip
+import io
 import os
 import asyncio
+import time
 from datetime import datetime
-from typing import List, Dict, Optional
+import struct
+from collections import deque
+from typing import BinaryIO, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
 from fastapi import UploadFile
 import json
 
+from .search_index import KIND_TRANSCRIPT, SearchIndex, get_search_index
+from .storage import get_state_store
+from .transcript_index import TranscriptIndex, INDEX_FILENAME
+from .uploads import save_upload_file, max_transcript_bytes
+
+COMPRESSED_SUFFIX = ".txt.gz"
+PLAIN_SUFFIX = ".txt"
+# 判斷編碼時讀取的 bytes 數
+ENCODING_SNIFF_BYTES = 64 * 1024
+# 串流讀取的 chunk 大小
+READ_CHUNK_SIZE = 64 * 1024
+
+_NEWLINES = {"utf-16-le": b"\n\x00", "utf-16-be": b"\x00\n"}
+
+
+def _cp1252_fallback(error: UnicodeDecodeError):
+    """UTF-8 解碼失敗的 bytes 改用 cp1252 解碼（舊 agent 可能混用編碼）"""
+    bad = error.object[error.start : error.end]
+    return bad.decode("cp1252", errors="replace"), error.end
+
+
+codecs.register_error("pt1_cp1252_fallback", _cp1252_fallback)
+
+
+def _text_codec(encoding: str) -> Tuple[str, str]:
+    """detect_encoding 的結果對應到解碼用的 (codec, errors)"""
+    if encoding.startswith("utf-16"):
+        # 由 BOM 判斷 byte order，並去掉 BOM
+        return "utf-16", "replace"
+    if encoding == "utf-8":
+        return "utf-8", "pt1_cp1252_fallback"
+    return encoding, "replace"
+
 
 class TranscriptManager:
-    def __init__(self, transcript_dir: str = "uploads/transcripts"):
+    def __init__(
+        self,
+        transcript_dir: str = "uploads/transcripts",
+        search_index: Optional[SearchIndex] = None,
+    ):
         self.transcript_dir = Path(transcript_dir)
         self.transcript_dir.mkdir(parents=True, exist_ok=True)
+        # 列表查詢使用索引，不再掃描目錄
+        self.index = TranscriptIndex(
+            self.transcript_dir, shared=get_state_store().shared
+        )
+        # 全文搜尋索引（內容在背景 thread 中讀取）
+        self.search_index = (
+            search_index if search_index is not None else get_search_index()
+        )
+
+    def _transcript_file(self, transcript_id: str) -> Optional[Tuple[Path, bool]]:
+        """返回 (path, compressed)，找不到時返回 None"""
+        compressed_path = self.transcript_dir / f"{transcript_id}{COMPRESSED_SUFFIX}"
+        if compressed_path.exists():
+            return compressed_path, True
+        plain_path = self.transcript_dir / f"{transcript_id}{PLAIN_SUFFIX}"
+        if plain_path.exists():
+            return plain_path, False
+        return None
 
     def _generate_transcript_id(self, client_id: str) -> str:
         """Generate transcript ID with timestamp"""
@@ -43,12 +107,14 @@ class TranscriptManager:
         """
         transcript_id = self._generate_transcript_id(client_id)
 
-        # Save transcript content
-        transcript_path = self.transcript_dir / f"{transcript_id}.txt"
-        content = await transcript_file.read()
-
-        with open(transcript_path, "wb") as f:
-            f.write(content)
+        # Save transcript content (streamed and gzip-compressed in chunks)
+        transcript_path = self.transcript_dir / f"{transcript_id}{COMPRESSED_SUFFIX}"
+        file_size, _ = await save_upload_file(
+            transcript_file,
+            transcript_path,
+            max_bytes=max_transcript_bytes(),
+            compress=True,
+        )
 
         # Save metadata if provided
         if metadata:
@@ -58,74 +124,251 @@ class TranscriptManager:
                 "transcript_id": transcript_id,
                 "filename": transcript_file.filename,
                 "upload_time": datetime.now().isoformat(),
-                "file_size": len(content),
+                "file_size": file_size,
                 **metadata,
             }
 
             with open(metadata_path, "w", encoding="utf-8") as f:
                 json.dump(metadata_info, f, indent=2, ensure_ascii=False)
+        else:
+            metadata_info = {}
+
+        self.index.add(transcript_id, client_id, file_size, metadata_info)
+        self.search_index.add_transcript(
+            transcript_id,
+            client_id,
+            time.time(),
+            lambda max_chars: self.read_transcript_text(transcript_id, max_chars),
+        )
 
         return transcript_id
 
     def list_transcripts(
-        self, client_id: Optional[str] = None, limit: int = 100
-    ) -> List[Dict]:
+        self,
+        client_id: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[int] = None,
+    ) -> Tuple[List[Dict], Optional[int]]:
         """
-        List available transcripts
+        List available transcripts (newest first)
 
         Args:
             client_id: Filter by specific client ID
             limit: Maximum number of transcripts to return
+            cursor: next_cursor from the previous page
 
         Returns:
-            List of transcript information
+            (list of transcript information, next_cursor or None)
         """
-        transcripts = []
+        entries, next_cursor = self.index.list(
+            client_id=client_id, limit=limit, cursor=cursor
+        )
 
-        # Get all transcript files
-        pattern = f"{client_id}_*.txt" if client_id else "*.txt"
-        transcript_files = list(self.transcript_dir.glob(pattern))
-
-        # Sort by modification time (newest first)
-        transcript_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-
-        for transcript_file in transcript_files[:limit]:
-            if transcript_file.name.endswith(".txt"):
-                transcript_id = transcript_file.stem
-
-                # Try to load metadata
-                metadata_path = self.transcript_dir / f"{transcript_id}_metadata.json"
-                metadata = {}
-
-                if metadata_path.exists():
-                    try:
-                        with open(metadata_path, "r", encoding="utf-8") as f:
-                            metadata = json.load(f)
-                    except (json.JSONDecodeError, Exception):
-                        pass
-
-                # Basic file info
-                stat_info = transcript_file.stat()
-                transcript_info = {
-                    "transcript_id": transcript_id,
-                    "client_id": (
-                        transcript_id.split("_")[0]
-                        if "_" in transcript_id
-                        else "unknown"
-                    ),
-                    "file_size": stat_info.st_size,
-                    "created_time": datetime.fromtimestamp(
-                        stat_info.st_ctime
-                    ).isoformat(),
-                    "modified_time": datetime.fromtimestamp(
-                        stat_info.st_mtime
-                    ).isoformat(),
-                    **metadata,
+        transcripts = []
+        for entry in entries:
+            transcripts.append(
+                {
+                    "transcript_id": entry["transcript_id"],
+                    "client_id": entry["client_id"],
+                    "file_size": entry["file_size"],
+                    "created_time": entry["created_time"],
+                    "modified_time": entry["modified_time"],
+                    **entry["metadata"],
                 }
+            )
+
+        return transcripts, next_cursor
+
+    def open_transcript(self, transcript_id: str) -> Optional[BinaryIO]:
+        """
+        Open transcript content as a binary stream (decompressed on the fly)
+
+        Args:
+            transcript_id: Transcript identifier
+
+        Returns:
+            Binary file object (caller closes it) or None if not found
+        """
+        found = self._transcript_file(transcript_id)
+        if found is None:
+            return None
+        path, compressed = found
+        return gzip.open(path, "rb") if compressed else open(path, "rb")
+
+    def get_transcript_file(self, transcript_id: str) -> Optional[Tuple[Path, bool]]:
+        """
+        Get the stored transcript file for serving it without decoding
+
+        Returns:
+            (path, compressed) or None if not found
+        """
+        return self._transcript_file(transcript_id)
+
+    def detect_encoding(self, transcript_id: str) -> Optional[str]:
+        """
+        Guess transcript text encoding from BOM or the first 64 KB
 
-                transcripts.append(transcript_info)
+        Returns:
+            Python codec name (utf-8-sig, utf-16-le, utf-16-be, utf-8 or cp1252),
+            or None if not found
+        """
+        stream = self.open_transcript(transcript_id)
+        if stream is None:
+            return None
+        with stream:
+            sample = stream.read(ENCODING_SNIFF_BYTES)
+
+        if sample.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        if sample.startswith(codecs.BOM_UTF16_LE):
+            return "utf-16-le"
+        if sample.startswith(codecs.BOM_UTF16_BE):
+            return "utf-16-be"
+        try:
+            # final=False: sample 結尾可能切在多 byte 字元中間
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return "cp1252"
 
-        return transcripts
+    def get_transcript_size(self, transcript_id: str) -> Optional[int]:
+        """
+        Uncompressed transcript size in bytes
+
+        For gzip files this is read from the gzip trailer (ISIZE), so no
+        decompression is needed for transcripts under 4 GB.
+        """
+        found = self._transcript_file(transcript_id)
+        if found is None:
+            return None
+        path, compressed = found
+        if not compressed:
+            return path.stat().st_size
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack("<I", f.read(4))[0]
+
+    def iter_transcript_bytes(
+        self, transcript_id: str, offset: int = 0, length: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Stream raw (uncompressed) transcript bytes from offset
+
+        gzip streams cannot seek randomly, so skipping to offset decompresses
+        and discards the preceding data; memory stays at one chunk.
+        """
+        stream = self.open_transcript(transcript_id)
+        if stream is None:
+            return
+        with stream:
+            if offset:
+                stream.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = (
+                    READ_CHUNK_SIZE
+                    if remaining is None
+                    else min(READ_CHUNK_SIZE, remaining)
+                )
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def iter_transcript_text(
+        self, transcript_id: str, encoding: str
+    ) -> Iterator[bytes]:
+        """Stream transcript content re-encoded as UTF-8"""
+        codec, errors = _text_codec(encoding)
+        decoder = codecs.getincrementaldecoder(codec)(errors=errors)
+        for chunk in self.iter_transcript_bytes(transcript_id):
+            text = decoder.decode(chunk)
+            if text:
+                yield text.encode("utf-8")
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text.encode("utf-8")
+
+    def read_transcript_text(
+        self, transcript_id: str, max_chars: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        Decode transcript text, stopping after max_chars characters
+
+        Returns:
+            Transcript text or None if not found
+        """
+        encoding = self.detect_encoding(transcript_id)
+        if encoding is None:
+            return None
+
+        codec, errors = _text_codec(encoding)
+        decoder = codecs.getincrementaldecoder(codec)(errors=errors)
+        parts = []
+        total = 0
+        for chunk in self.iter_transcript_bytes(transcript_id):
+            text = decoder.decode(chunk)
+            parts.append(text)
+            total += len(text)
+            if max_chars is not None and total >= max_chars:
+                break
+        else:
+            parts.append(decoder.decode(b"", final=True))
+
+        text = "".join(parts)
+        return text if max_chars is None else text[:max_chars]
+
+    def tail_offset(self, transcript_id: str, lines: int, encoding: str) -> int:
+        """
+        Byte offset where the last `lines` lines of the transcript start
+
+        Plain files are scanned backwards from the end; gzip files are
+        scanned forward once, keeping only the last newline positions.
+        """
+        newline = _NEWLINES.get(encoding, b"\n")
+        unit = len(newline)
+
+        size = self.get_transcript_size(transcript_id)
+        path, compressed = self._transcript_file(transcript_id)
+        positions: deque = deque(maxlen=lines + 1)
+
+        def scan(data: bytes, base: int) -> List[int]:
+            found = []
+            index = data.find(newline)
+            while index != -1:
+                if (base + index) % unit == 0:
+                    found.append(base + index)
+                index = data.find(newline, index + 1)
+            return found
+
+        if compressed:
+            base = 0
+            carry = b""
+            for chunk in self.iter_transcript_bytes(transcript_id):
+                data = carry + chunk
+                positions.extend(scan(data, base - len(carry)))
+                carry = data[-(unit - 1) :] if unit > 1 else b""
+                base += len(chunk)
+        else:
+            collected: List[int] = []
+            end = size
+            with open(path, "rb") as f:
+                while end > 0 and len(collected) < lines + 1:
+                    start = max(0, end - READ_CHUNK_SIZE)
+                    f.seek(start)
+                    data = f.read(end - start + unit - 1)
+                    block = [p for p in scan(data, start) if p < end]
+                    collected = block + collected
+                    end = start
+            positions.extend(collected)
+
+        # 結尾的換行不算一行
+        candidates = [p for p in positions if p != size - unit]
+        if len(candidates) < lines:
+            return 0
+        return candidates[-lines] + unit
 
     def get_transcript_content(self, transcript_id: str) -> Optional[str]:
         """
@@ -137,21 +380,15 @@ class TranscriptManager:
         Returns:
             Transcript content or None if not found
         """
-        transcript_path = self.transcript_dir / f"{transcript_id}.txt"
-
-        if not transcript_path.exists():
+        encoding = self.detect_encoding(transcript_id)
+        if encoding is None:
             return None
 
+        codec, errors = _text_codec(encoding)
         try:
-            with open(transcript_path, "r", encoding="utf-8") as f:
+            stream = self.open_transcript(transcript_id)
+            with io.TextIOWrapper(stream, encoding=codec, errors=errors) as f:
                 return f.read()
-        except UnicodeDecodeError:
-            # Try with different encoding if UTF-8 fails
-            try:
-                with open(transcript_path, "r", encoding="cp1252") as f:
-                    return f.read()
-            except Exception:
-                return None
         except Exception:
             return None
 
@@ -186,17 +423,18 @@ class TranscriptManager:
         Returns:
             True if deleted successfully, False otherwise
         """
-        transcript_path = self.transcript_dir / f"{transcript_id}.txt"
         metadata_path = self.transcript_dir / f"{transcript_id}_metadata.json"
 
         deleted = False
 
-        if transcript_path.exists():
-            try:
-                transcript_path.unlink()
-                deleted = True
-            except Exception:
-                pass
+        for suffix in (COMPRESSED_SUFFIX, PLAIN_SUFFIX):
+            transcript_path = self.transcript_dir / f"{transcript_id}{suffix}"
+            if transcript_path.exists():
+                try:
+                    transcript_path.unlink()
+                    deleted = True
+                except Exception:
+                    pass
 
         if metadata_path.exists():
             try:
@@ -204,6 +442,9 @@ class TranscriptManager:
             except Exception:
                 pass
 
+        self.index.remove(transcript_id)
+        self.search_index.remove(KIND_TRANSCRIPT, transcript_id)
+
         return deleted
 
     def cleanup_old_transcripts(self, days: int = 30) -> int:
@@ -224,12 +465,20 @@ class TranscriptManager:
         deleted_count = 0
 
         for file_path in self.transcript_dir.iterdir():
+            if file_path.name.startswith(INDEX_FILENAME):
+                continue
             if file_path.is_file() and file_path.stat().st_mtime < cutoff_timestamp:
                 try:
                     file_path.unlink()
                     deleted_count += 1
                 except Exception:
-                    pass
+                    continue
+                for suffix in (COMPRESSED_SUFFIX, PLAIN_SUFFIX):
+                    if file_path.name.endswith(suffix):
+                        transcript_id = file_path.name[: -len(suffix)]
+                        self.index.remove(transcript_id)
+                        self.search_index.remove(KIND_TRANSCRIPT, transcript_id)
+                        break
 
         return deleted_count
 
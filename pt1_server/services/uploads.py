@@ -0,0 +1,100 @@
+"""
+Streaming upload helpers
+
+把 UploadFile 以固定大小的 chunk 寫入同目錄下的暫存檔，完成後以 os.replace
+原子地改名為目標檔名；大小與 SHA-256 在寫入過程中逐步計算。
+每個上傳的記憶體用量上限為一個 chunk。
+
+compress=True 時以 gzip 壓縮後寫入（size 與 SHA-256 仍以原始內容計算），
+壓縮在 threadpool 中進行，不阻塞 event loop。
+
+設定（環境變數）：
+    PT1_MAX_UPLOAD_BYTES      單一檔案上傳大小上限（預設不限制）
+    PT1_MAX_TRANSCRIPT_BYTES  單一 transcript 大小上限（預設不限制）
+"""
+
+import gzip
+import hashlib
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from pt1_server.services.config import env_int
+from pt1_server.services.metrics import get_metrics
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+
+def max_upload_bytes() -> Optional[int]:
+    """單一檔案上傳大小上限（None 表示不限制）"""
+    return env_int("PT1_MAX_UPLOAD_BYTES", 0) or None
+
+
+def max_transcript_bytes() -> Optional[int]:
+    """單一 transcript 大小上限（None 表示不限制）"""
+    return env_int("PT1_MAX_TRANSCRIPT_BYTES", 0) or None
+
+
+def temp_path_for(dest: Path) -> Path:
+    """與目標檔案同目錄的暫存檔路徑（確保 os.replace 不跨檔案系統）"""
+    return dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+
+async def save_upload_file(
+    upload: UploadFile,
+    dest: Path,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+    compress: bool = False,
+) -> Tuple[int, str]:
+    """
+    以串流方式把上傳檔案寫到 dest
+
+    Args:
+        upload: FastAPI UploadFile
+        dest: 目標路徑（父目錄必須已存在）
+        max_bytes: 大小上限（原始大小），超過時回應 413
+        chunk_size: 每次讀取的 bytes 數
+        compress: 以 gzip 格式寫入
+
+    Returns:
+        (size, sha256_hexdigest)，皆為壓縮前的內容
+    """
+    tmp_path = temp_path_for(dest)
+    digest = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+
+    try:
+        with open(tmp_path, "wb") as raw, (
+            gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0)
+            if compress
+            else raw
+        ) as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File {upload.filename} exceeds limit of {max_bytes} bytes",
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+    get_metrics().observe_upload(size, time.perf_counter() - start)
+    return size, digest.hexdigest()
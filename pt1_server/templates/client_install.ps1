@@ -7,6 +7,9 @@ if (-not $serverUrl) {{
 # API Token for authentication
 $apiToken = "{api_token}"
 
+# Version of this script on the server; a persistent agent restarts when it changes
+$scriptVersion = "{script_version}"
+
 # Get environment info for stable identification
 $hostname = $env:COMPUTERNAME
 $username = $env:USERNAME
@@ -24,6 +27,88 @@ if (-not $stableId) {{
 
 # Execution unit runs silently unless executing commands
 
+# Files above this size use the resumable chunked upload protocol
+$resumableThreshold = 8MB
+
+# Resumable upload for large files: sends fixed-size chunks with Content-Range and,
+# after a dropped connection, asks the server how much it has and continues from there
+function Send-ResumableFile {{
+    param(
+        [string]$CommandId,
+        [string]$ServerUrl,
+        [string]$ApiToken,
+        [string]$FilePath,
+        [string]$Sha256,
+        [int]$MaxRetries = 5
+    )
+
+    Add-Type -AssemblyName System.Net.Http
+
+    $headers = @{{"X-API-Token"=$ApiToken}}
+    $item = Get-Item -LiteralPath $FilePath
+    $total = [long]$item.Length
+    $sha256 = $Sha256
+    if (-not $sha256) {{
+        $sha256 = (Get-FileHash -LiteralPath $FilePath -Algorithm SHA256).Hash.ToLower()
+    }}
+
+    $initBody = @{{
+        filename = $item.Name
+        size = $total
+        sha256 = $sha256
+    }} | ConvertTo-Json -Compress
+    $upload = Invoke-RestMethod -Uri "$ServerUrl/uploads/$CommandId" -Method POST -Body $initBody -ContentType "application/json" -Headers $headers -UseBasicParsing
+    $uploadUrl = "$ServerUrl/uploads/$CommandId/$($upload.upload_id)"
+    $chunkSize = [int]$upload.chunk_size
+    $offset = [long]$upload.received
+
+    $httpClient = [System.Net.Http.HttpClient]::new()
+    $httpClient.DefaultRequestHeaders.Add("X-API-Token", $ApiToken)
+    $stream = [System.IO.File]::OpenRead($FilePath)
+    $buffer = New-Object byte[] $chunkSize
+    $failures = 0
+
+    try {{
+        while ($offset -lt $total) {{
+            $stream.Position = $offset
+            $read = $stream.Read($buffer, 0, $chunkSize)
+            $content = [System.Net.Http.ByteArrayContent]::new($buffer, 0, $read)
+            $content.Headers.ContentType = [System.Net.Http.Headers.MediaTypeHeaderValue]::Parse("application/octet-stream")
+            $content.Headers.ContentRange = [System.Net.Http.Headers.ContentRangeHeaderValue]::new($offset, $offset + $read - 1, $total)
+
+            try {{
+                $response = $httpClient.PutAsync($uploadUrl, $content).Result
+                if ($response.IsSuccessStatusCode) {{
+                    $offset += $read
+                    $failures = 0
+                    continue
+                }}
+                # 409 = offset mismatch, resync below; anything else counts as a failure
+                if ([int]$response.StatusCode -ne 409) {{
+                    throw "Chunk upload failed with status: $($response.StatusCode)"
+                }}
+            }} catch {{
+                $failures++
+                if ($failures -gt $MaxRetries) {{
+                    throw
+                }}
+                Start-Sleep -Seconds ([Math]::Min(30, [Math]::Pow(2, $failures)))
+            }} finally {{
+                $content.Dispose()
+            }}
+
+            # Ask the server how many bytes it already has and continue from there
+            $status = Invoke-RestMethod -Uri $uploadUrl -Headers $headers -UseBasicParsing
+            $offset = [long]$status.received
+        }}
+    }} finally {{
+        $stream.Dispose()
+        $httpClient.Dispose()
+    }}
+
+    return Invoke-RestMethod -Uri "$uploadUrl/finalize" -Method POST -Headers $headers -UseBasicParsing
+}}
+
 # File upload helper function using .NET HttpClient for proper multipart handling
 function Upload-ResultFiles {{
     param(
@@ -37,41 +122,97 @@ function Upload-ResultFiles {{
         return $null
     }}
 
-    try {{
-        # Use Add-Type to ensure we have access to required .NET classes
-        Add-Type -AssemblyName System.Net.Http
+    $headers = @{{"X-API-Token"=$ApiToken}}
+    $uploadedFiles = @()
+    $smallFiles = @()
+
+    # Hash every file and ask the server which contents it already stores
+    $hashes = @{{}}
+    foreach ($filePath in $FilePaths) {{
+        if (Test-Path $filePath) {{
+            $hashes[$filePath] = (Get-FileHash -LiteralPath $filePath -Algorithm SHA256).Hash.ToLower()
+        }}
+    }}
+    $known = @()
+    if ($hashes.Count -gt 0) {{
+        try {{
+            $haveBody = @{{ hashes = @($hashes.Values) }} | ConvertTo-Json -Compress
+            $known = (Invoke-RestMethod -Uri "$ServerUrl/artifacts/have" -Method POST -Body $haveBody -ContentType "application/json" -Headers $headers -UseBasicParsing).have
+        }} catch {{
+            # Older server without the artifact store: upload everything
+            $known = @()
+        }}
+    }}
+
+    foreach ($filePath in $hashes.Keys) {{
+        $sha256 = $hashes[$filePath]
+
+        # Server already has these bytes: link instead of uploading
+        if ($known -contains $sha256) {{
+            try {{
+                $linkBody = @{{
+                    filename = (Split-Path $filePath -Leaf)
+                    sha256 = $sha256
+                }} | ConvertTo-Json -Compress
+                $result = Invoke-RestMethod -Uri "$ServerUrl/artifacts/$CommandId/link" -Method POST -Body $linkBody -ContentType "application/json" -Headers $headers -UseBasicParsing
+                $uploadedFiles += $result.uploaded_files
+                continue
+            }} catch {{
+                # Blob went away in the meantime, fall through to a normal upload
+            }}
+        }}
+
+        # Large files go through the resumable protocol one by one
+        if ((Get-Item -LiteralPath $filePath).Length -gt $resumableThreshold) {{
+            try {{
+                $result = Send-ResumableFile -CommandId $CommandId -ServerUrl $ServerUrl -ApiToken $ApiToken -FilePath $filePath -Sha256 $sha256
+                $uploadedFiles += $result.uploaded_files
+            }} catch {{
+                Write-Host "Error uploading $($filePath): $($_.Exception.Message)" -ForegroundColor Red
+            }}
+        }} else {{
+            $smallFiles += $filePath
+        }}
+    }}
+
+    if ($smallFiles.Count -gt 0) {{
+        try {{
+            # Use Add-Type to ensure we have access to required .NET classes
+            Add-Type -AssemblyName System.Net.Http
 
-        $httpClient = [System.Net.Http.HttpClient]::new()
-        # Add API token header
-        $httpClient.DefaultRequestHeaders.Add("X-API-Token", $ApiToken)
-        $form = [System.Net.Http.MultipartFormDataContent]::new()
+            $httpClient = [System.Net.Http.HttpClient]::new()
+            # Add API token header
+            $httpClient.DefaultRequestHeaders.Add("X-API-Token", $ApiToken)
+            $form = [System.Net.Http.MultipartFormDataContent]::new()
 
-        foreach ($filePath in $FilePaths) {{
-            if (Test-Path $filePath) {{
+            foreach ($filePath in $smallFiles) {{
                 $fileName = Split-Path $filePath -Leaf
                 $fileContent = [System.IO.File]::ReadAllBytes($filePath)
                 $byteArrayContent = [System.Net.Http.ByteArrayContent]::new($fileContent)
                 $byteArrayContent.Headers.ContentType = [System.Net.Http.Headers.MediaTypeHeaderValue]::Parse("application/octet-stream")
                 $form.Add($byteArrayContent, "files", $fileName)
             }}
-        }}
 
-        $response = $httpClient.PostAsync("$ServerUrl/upload_files/$CommandId", $form).Result
-        $responseContent = $response.Content.ReadAsStringAsync().Result
+            $response = $httpClient.PostAsync("$ServerUrl/upload_files/$CommandId", $form).Result
+            $responseContent = $response.Content.ReadAsStringAsync().Result
 
-        $httpClient.Dispose()
-        $form.Dispose()
+            $httpClient.Dispose()
+            $form.Dispose()
 
-        if ($response.IsSuccessStatusCode) {{
-            return ($responseContent | ConvertFrom-Json)
-        }} else {{
-            Write-Host "Upload failed with status: $($response.StatusCode)" -ForegroundColor Red
-            return $null
+            if ($response.IsSuccessStatusCode) {{
+                $uploadedFiles += ($responseContent | ConvertFrom-Json).uploaded_files
+            }} else {{
+                Write-Host "Upload failed with status: $($response.StatusCode)" -ForegroundColor Red
+            }}
+        }} catch {{
+            Write-Host "Error uploading files: $($_.Exception.Message)" -ForegroundColor Red
         }}
-    }} catch {{
-        Write-Host "Error uploading files: $($_.Exception.Message)" -ForegroundColor Red
+    }}
+
+    if ($uploadedFiles.Count -eq 0) {{
         return $null
     }}
+    return [pscustomobject]@{{ uploaded_files = $uploadedFiles }}
 }}
 
 # Smart file detection function - finds all recently modified files
@@ -105,7 +246,8 @@ function Find-OutputFiles {{
     return $outputFiles
 }}
 
-# Register client to server silently
+# Register client to server silently (once per process: a persistent agent only
+# registers when it starts or restarts with an updated script)
 try {{
     $registerData = @{{
         client_id = $stableId
@@ -118,23 +260,181 @@ try {{
     # Registration failed, continue with local stable ID
 }}
 
-# Main execution: wait for one command or timeout after 10 seconds
-$timeout = 10
-$elapsed = 0
-$commandExecuted = $false
+# Result type reported to the server, based on the output and new files
+function Get-ResultType {{
+    param($Result, $NewFiles)
+
+    if ($NewFiles -and $NewFiles.Count -gt 0) {{
+        if ($Result.Trim()) {{
+            return "mixed"
+        }}
+        return $(if ($NewFiles.Count -gt 1) {{ "files" }} else {{ "file" }})
+    }}
+    return "text"
+}}
+
+# Send the collected results in one /submit_results request, then upload their files.
+# Falls back to one /submit_result per command when the server has no batch endpoint.
+function Submit-PendingResults {{
+    if ($script:pendingResults.Count -eq 0) {{
+        return
+    }}
+    $batch = @($script:pendingResults)
+    $script:pendingResults.Clear()
+    $script:lastFlush = Get-Date
+
+    $headers = @{{"X-API-Token"=$apiToken}}
+    $batchSubmitted = $false
+    try {{
+        $results = @($batch | ForEach-Object {{
+            @{{
+                command_id = $_.CommandId
+                result = $_.Result
+                status = $_.Status
+                result_type = $_.ResultType
+            }}
+        }})
+        $body = @{{ results = $results }} | ConvertTo-Json -Compress -Depth 4
+        Invoke-RestMethod -Uri "$serverUrl/submit_results" -Method POST -Body $body -ContentType "application/json" -Headers $headers -UseBasicParsing | Out-Null
+        $batchSubmitted = $true
+        Write-Host "[$stableId] Submitted $($batch.Count) result(s)" -ForegroundColor Green
+    }} catch {{
+        # Older server without /submit_results: submit one by one below
+    }}
+
+    foreach ($item in $batch) {{
+        try {{
+            if (-not $batchSubmitted) {{
+                $resultData = @{{
+                    command_id = $item.CommandId
+                    result = $item.Result
+                    status = $item.Status
+                    result_type = $item.ResultType
+                }} | ConvertTo-Json -Compress
+
+                Invoke-RestMethod -Uri "$serverUrl/submit_result" -Method POST -Body $resultData -ContentType "application/json" -Headers $headers -UseBasicParsing | Out-Null
+                Write-Host "[$stableId] Result submitted successfully ($($item.CommandId))" -ForegroundColor Green
+            }}
+
+            # Upload files if any were created
+            if ($item.NewFiles -and $item.NewFiles.Count -gt 0) {{
+                Write-Host "[$stableId] Uploading $($item.NewFiles.Count) output files for $($item.CommandId)..." -ForegroundColor Yellow
+                $uploadResult = Upload-ResultFiles -CommandId $item.CommandId -ServerUrl $serverUrl -ApiToken $apiToken -FilePaths $item.NewFiles
+                if ($uploadResult) {{
+                    Write-Host "[$stableId] Files uploaded successfully: $($uploadResult.uploaded_files.Count) files" -ForegroundColor Green
+                }}
+            }}
+        }} catch {{
+            Write-Host "[$stableId] Failed to submit result for $($item.CommandId): $($_.Exception.Message)" -ForegroundColor Red
+        }}
+    }}
+}}
+
+# Upload transcript function (persistent mode records one transcript per batch)
+function Upload-RunTranscript {{
+    param(
+        [string]$TranscriptPath,
+        [string]$RunId,
+        [string]$ClientId,
+        [string]$ServerUrl
+    )
+
+    try {{
+        if (-not (Test-Path $TranscriptPath)) {{
+            return $false
+        }}
+
+        # Upload transcript to server silently
+        $uploadUri = "$ServerUrl/agent_transcript/$ClientId"
+        $fileBytes = [System.IO.File]::ReadAllBytes($TranscriptPath)
+        $fileEnc = [System.Text.Encoding]::GetEncoding('UTF-8').GetString($fileBytes)
+
+        $boundary = [System.Guid]::NewGuid().ToString()
+        $LF = "`r`n"
+        $bodyLines = (
+            "--$boundary",
+            "Content-Disposition: form-data; name=`"transcript_file`"; filename=`"$RunId-transcript.txt`"",
+            "Content-Type: text/plain",
+            "",
+            $fileEnc,
+            "--$boundary",
+            "Content-Disposition: form-data; name=`"run_id`"",
+            "",
+            $RunId,
+            "--$boundary--",
+            ""
+        ) -join $LF
+
+        Invoke-RestMethod -Uri $uploadUri -Method Post -ContentType "multipart/form-data; boundary=$boundary" -Headers @{{"X-API-Token"=$script:apiToken}} -Body $bodyLines -UseBasicParsing | Out-Null
+        return $true
+    }} catch {{
+        return $false
+    }}
+}}
+
+# Commands in a /next_command response
+# Servers without batch dispatch ignore max and only return command/command_id
+function Get-ResponseCommands {{
+    param($Response)
+
+    if ($Response.commands) {{
+        return @($Response.commands)
+    }}
+    if ($Response.command) {{
+        return @([pscustomobject]@{{ command = $Response.command; command_id = $Response.command_id }})
+    }}
+    return @()
+}}
+
+# Run a batch of commands in this process and submit their results.
+# Sets $script:gracefulExit when the batch contains the graceful exit signal.
+function Invoke-CommandBatch {{
+    param($Commands)
+
+    if ($Commands.Count -gt 1) {{
+        Write-Host "[$stableId] Received $($Commands.Count) commands" -ForegroundColor Cyan
+    }}
+
+    # Start heartbeat background job for the whole batch: it renews the lease of
+    # every command in the batch, including the ones still waiting to run
+    $heartbeatJob = $null
+    try {{
+        # Function to send periodic heartbeat
+        $heartbeatScript = {{
+            param($serverUrl, $stableId, $apiToken, $hostname, $username)
+            while ($true) {{
+                try {{
+                    Invoke-RestMethod -Uri "$serverUrl/heartbeat/$stableId" -Method POST -Headers @{{"X-API-Token"=$apiToken}} -Body @{{hostname=$hostname; username=$username}} -TimeoutSec 2 -UseBasicParsing | Out-Null
+                }} catch {{
+                    # Silently ignore heartbeat failures
+                }}
+                Start-Sleep -Seconds 10
+            }}
+        }}
+        $heartbeatJob = Start-Job -ScriptBlock $heartbeatScript -ArgumentList $serverUrl, $stableId, $apiToken, $hostname, $username
+    }} catch {{
+        # If heartbeat fails to start, continue anyway
+    }}
 
-while ($elapsed -lt $timeout -and -not $commandExecuted) {{
+    $script:lastFlush = Get-Date
     try {{
-        $response = Invoke-RestMethod -Uri "$serverUrl/next_command?client_id=$stableId&hostname=$hostname&username=$username" -Method GET -Headers @{{"X-API-Token"=$apiToken}} -TimeoutSec 5 -UseBasicParsing
+        foreach ($entry in $Commands) {{
+            $commandId = $entry.command_id
 
-        if ($response.command) {{
-            $commandId = $response.command_id
+            # Every command starts in the agent work directory, as it did when each
+            # command ran in a fresh process
+            Set-Location -LiteralPath $agentWorkDir
 
             # Check for graceful termination signal
-            if ($response.command -eq "@PT1:GRACEFUL_EXIT@") {{
+            if ($entry.command -eq "@PT1:GRACEFUL_EXIT@") {{
                 Write-Host "[$stableId] Received graceful exit signal" -ForegroundColor Cyan
                 Write-Host "[$stableId] Shutting down gracefully..." -ForegroundColor Cyan
 
+                # Results of commands already run in this batch go first; commands
+                # after the signal are not run and return to the queue when their
+                # lease expires
+                Submit-PendingResults
+
                 # Submit acknowledgment to server
                 try {{
                     $resultData = @{{
@@ -150,52 +450,25 @@ while ($elapsed -lt $timeout -and -not $commandExecuted) {{
                 }}
 
                 # Create graceful exit flag for win_agent to detect
-                $gracefulExitFlag = "GRACEFUL_EXIT.flag"
+                $gracefulExitFlag = Join-Path $agentWorkDir "GRACEFUL_EXIT.flag"
                 "GRACEFUL_TERMINATION" | Out-File -FilePath $gracefulExitFlag -Encoding UTF8
-                Write-Host "[$stableId] Created flag: $((Get-Location).Path)\$gracefulExitFlag" -ForegroundColor Gray
+                Write-Host "[$stableId] Created flag: $gracefulExitFlag" -ForegroundColor Gray
                 Write-Host "[$stableId] Goodbye!" -ForegroundColor Green
-                exit 0
+                $script:gracefulExit = $true
+                return
             }}
 
-            Write-Host "[$stableId] Executing: $($response.command)" -ForegroundColor Yellow
+            Write-Host "[$stableId] Executing: $($entry.command)" -ForegroundColor Yellow
 
             # Get files before execution for comparison
-            $beforeFiles = Find-OutputFiles -Command $response.command
-
-            # Start heartbeat background job during command execution
-            $heartbeatJob = $null
-            try {{
-                # Function to send periodic heartbeat
-                $heartbeatScript = {{
-                    param($serverUrl, $stableId, $apiToken, $hostname, $username)
-                    while ($true) {{
-                        try {{
-                            Invoke-RestMethod -Uri "$serverUrl/heartbeat/$stableId" -Method POST -Headers @{{"X-API-Token"=$apiToken}} -Body @{{hostname=$hostname; username=$username}} -TimeoutSec 2 -UseBasicParsing | Out-Null
-                        }} catch {{
-                            # Silently ignore heartbeat failures
-                        }}
-                        Start-Sleep -Seconds 10
-                    }}
-                }}
-                $heartbeatJob = Start-Job -ScriptBlock $heartbeatScript -ArgumentList $serverUrl, $stableId, $apiToken, $hostname, $username
-            }} catch {{
-                # If heartbeat fails to start, continue anyway
-            }}
+            $beforeFiles = Find-OutputFiles -Command $entry.command
 
             try {{
-                $result = Invoke-Expression $response.command 2>&1 | Out-String
+                $result = Invoke-Expression $entry.command 2>&1 | Out-String
                 $status = "completed"
             }} catch {{
                 $result = $_.Exception.Message
                 $status = "failed"
-            }} finally {{
-                # Stop heartbeat job
-                if ($heartbeatJob) {{
-                    try {{
-                        Stop-Job -Job $heartbeatJob -Force -ErrorAction SilentlyContinue
-                        Remove-Job -Job $heartbeatJob -Force -ErrorAction SilentlyContinue
-                    }} catch {{}}
-                }}
             }}
 
             Write-Host "[$stableId] Result:" -ForegroundColor Magenta
@@ -203,56 +476,149 @@ while ($elapsed -lt $timeout -and -not $commandExecuted) {{
             Write-Host ""
 
             # Find new output files
-            $afterFiles = Find-OutputFiles -Command $response.command
-            $newFiles = $afterFiles | Where-Object {{ $_ -notin $beforeFiles }}
+            $afterFiles = Find-OutputFiles -Command $entry.command
+            $newFiles = @($afterFiles | Where-Object {{ $_ -notin $beforeFiles }})
 
-            # Submit result to server if command_id is available
+            # Queue the result for submission if command_id is available
             if ($commandId) {{
+                [void]$script:pendingResults.Add([pscustomobject]@{{
+                    CommandId = $commandId
+                    Result = $result
+                    Status = $status
+                    ResultType = Get-ResultType -Result $result -NewFiles $newFiles
+                    NewFiles = $newFiles
+                }})
+            }}
+            Write-Host "[$stableId] Command completed" -ForegroundColor Green
+
+            if (((Get-Date) - $script:lastFlush).TotalSeconds -ge $resultFlushSeconds) {{
+                Submit-PendingResults
+            }}
+        }}
+        Submit-PendingResults
+    }} finally {{
+        # Stop heartbeat job
+        if ($heartbeatJob) {{
+            try {{
+                Stop-Job -Job $heartbeatJob -Force -ErrorAction SilentlyContinue
+                Remove-Job -Job $heartbeatJob -Force -ErrorAction SilentlyContinue
+            }} catch {{}}
+        }}
+    }}
+}}
+
+# The server hands out up to $batchSize queued commands per /next_command (max=N);
+# the whole batch runs in this process.
+$batchSize = 20
+# Results are sent together, but at least every $resultFlushSeconds so the first
+# results of a long batch are not held back until the last command finishes
+$resultFlushSeconds = 5
+$pendingResults = New-Object System.Collections.ArrayList
+$lastFlush = Get-Date
+$gracefulExit = $false
+$agentWorkDir = (Get-Location).Path
+
+if ($env:PT1_AGENT_MODE -eq "persistent") {{
+    # Persistent mode (started by win_agent.ps1): this process stays resident and keeps
+    # long-polling, so an idle agent costs one request per $longPollSeconds instead of a
+    # new PowerShell process, a script download and a registration per poll.
+    # Each poll reports $scriptVersion; when the server has a newer script it answers
+    # with its version instead of commands and this process exits so win_agent.ps1
+    # downloads the new script and starts it.
+    $longPollSeconds = 50
+    $runCount = 0
+
+    while ($true) {{
+        try {{
+            $response = Invoke-RestMethod -Uri "$serverUrl/next_command?client_id=$stableId&hostname=$hostname&username=$username&wait=$longPollSeconds&max=$batchSize&script_version=$scriptVersion" -Method GET -Headers @{{"X-API-Token"=$apiToken}} -TimeoutSec ($longPollSeconds + 10) -UseBasicParsing
+        }} catch {{
+            $statusCode = $null
+            if ($_.Exception.Response) {{
                 try {{
-                    # Determine result type
-                    $resultType = "text"
-                    if ($newFiles -and $newFiles.Count -gt 0) {{
-                        if ($result.Trim()) {{
-                            $resultType = "mixed"
-                        }} else {{
-                            $resultType = if ($newFiles.Count -gt 1) {{ "files" }} else {{ "file" }}
-                        }}
-                    }}
+                    $statusCode = $_.Exception.Response.StatusCode.value__
+                }} catch {{}}
+            }}
 
-                    $resultData = @{{
-                        command_id = $commandId
-                        result = $result
-                        status = $status
-                        result_type = $resultType
-                    }} | ConvertTo-Json -Compress
+            # Expired or revoked session token: let win_agent.ps1 handle it
+            if ($statusCode -eq 401) {{
+                Write-Host "[$stableId] Received 401 Unauthorized, stopping execution unit" -ForegroundColor Red
+                exit 1
+            }}
 
-                    Invoke-RestMethod -Uri "$serverUrl/submit_result" -Method POST -Body $resultData -ContentType "application/json" -Headers @{{"X-API-Token"=$apiToken}} -UseBasicParsing | Out-Null
-                    Write-Host "[$stableId] Result submitted successfully" -ForegroundColor Green
+            Write-Host "[$stableId] Error checking for commands: $($_.Exception.Message)" -ForegroundColor Red
+            Start-Sleep -Seconds 5
+            continue
+        }}
 
-                    # Upload files if any were created
-                    if ($newFiles -and $newFiles.Count -gt 0) {{
-                        Write-Host "[$stableId] Uploading $($newFiles.Count) output files..." -ForegroundColor Yellow
-                        $uploadResult = Upload-ResultFiles -CommandId $commandId -ServerUrl $serverUrl -ApiToken $apiToken -FilePaths $newFiles
-                        if ($uploadResult) {{
-                            Write-Host "[$stableId] Files uploaded successfully: $($uploadResult.uploaded_files.Count) files" -ForegroundColor Green
-                        }}
-                    }}
+        if ($response.script_version -and $response.script_version -ne $scriptVersion) {{
+            Write-Host "[$stableId] Client script updated on server ($scriptVersion -> $($response.script_version)), restarting" -ForegroundColor Cyan
+            exit 0
+        }}
 
-                }} catch {{
-                    Write-Host "[$stableId] Failed to submit result: $($_.Exception.Message)" -ForegroundColor Red
-                }}
+        # No command: the server already waited, poll again
+        # A full batch needs no special case: the next poll returns at once while
+        # commands are still queued
+        $commands = @(Get-ResponseCommands $response)
+        if ($commands.Count -eq 0) {{
+            continue
+        }}
+
+        # One transcript per batch, uploaded like win_agent.ps1 does in cycle mode
+        $runCount++
+        $runId = "run-{{0:000}}" -f $runCount
+        $transcriptPath = Join-Path $agentWorkDir "$runId-transcript.txt"
+        Start-Transcript -Path $transcriptPath -Force | Out-Null
+        try {{
+            Invoke-CommandBatch -Commands $commands
+        }} catch {{
+            Write-Host "[$stableId] Batch failed: $($_.Exception.Message)" -ForegroundColor Red
+        }} finally {{
+            Stop-Transcript | Out-Null
+            Upload-RunTranscript -TranscriptPath $transcriptPath -RunId $runId -ClientId $stableId -ServerUrl $serverUrl | Out-Null
+            Remove-Item $transcriptPath -Force -ErrorAction SilentlyContinue
+        }}
+
+        if ($gracefulExit) {{
+            exit 0
+        }}
+    }}
+}}
+
+# Cycle mode: long-poll for commands, give up after $longPollSeconds
+# The server holds /next_command open until a command is queued (wait=N); when the
+# batch was full, poll again without waiting until the queue is empty.
+$longPollSeconds = 25
+$deadline = (Get-Date).AddSeconds($longPollSeconds)
+$commandExecuted = $false
+$moreQueued = $false
+
+while (((Get-Date) -lt $deadline -and -not $commandExecuted) -or $moreQueued) {{
+    try {{
+        $wait = 0
+        if (-not $commandExecuted) {{
+            $wait = [int][Math]::Ceiling(($deadline - (Get-Date)).TotalSeconds)
+            if ($wait -lt 1) {{ $wait = 1 }}
+        }}
+        $response = Invoke-RestMethod -Uri "$serverUrl/next_command?client_id=$stableId&hostname=$hostname&username=$username&wait=$wait&max=$batchSize" -Method GET -Headers @{{"X-API-Token"=$apiToken}} -TimeoutSec ($wait + 10) -UseBasicParsing
+
+        $commands = @(Get-ResponseCommands $response)
+        $moreQueued = $false
+
+        if ($commands.Count -gt 0) {{
+            Invoke-CommandBatch -Commands $commands
+            if ($gracefulExit) {{
+                exit 0
             }}
 
             $commandExecuted = $true
-            Write-Host "[$stableId] Command completed" -ForegroundColor Green
-        }} else {{
-            Start-Sleep -Seconds 1
-            $elapsed++
+            # A full batch means more commands may be waiting
+            $moreQueued = ($commands.Count -ge $batchSize)
         }}
+        # No command: the server already waited, loop ends once the deadline passes
     }} catch {{
         Write-Host "[$stableId] Error checking for commands: $($_.Exception.Message)" -ForegroundColor Red
+        $moreQueued = $false
         Start-Sleep -Seconds 1
-        $elapsed++
     }}
 }}
 
@@ -8,6 +8,10 @@ if (-not $serverUrl) {{
 # Session Token for authentication (short-lived)
 $apiToken = "{api_token}"
 
+# persistent: one resident client_install.ps1 process that keeps long-polling
+# cycle: a new client_install.ps1 process (download + register) for every poll
+$agentMode = "{agent_mode}"
+
 # Get environment info for stable identification
 $hostname = $env:COMPUTERNAME
 $username = $env:USERNAME
@@ -45,6 +49,7 @@ Write-Host "====================================================================
 Write-Host "  Client ID   : $stableId" -ForegroundColor Cyan
 Write-Host "  Server URL  : $serverUrl" -ForegroundColor Cyan
 Write-Host "  Work Dir    : $workDir" -ForegroundColor Cyan
+Write-Host "  Mode        : $agentMode" -ForegroundColor Cyan
 Write-Host "===============================================================================" -ForegroundColor Green
 Write-Host "Press Ctrl+C to stop" -ForegroundColor Yellow
 Write-Host ""
@@ -91,7 +96,101 @@ function Upload-RunTranscript {{
     }}
 }}
 
-# Main execution loop with self-healing and auto-restart
+# Check for graceful exit flag (created by client_install.ps1)
+function Test-GracefulExit {{
+    param([string]$RunId)
+
+    $gracefulExitFlag = Join-Path $workDir "GRACEFUL_EXIT.flag"
+    if (Test-Path $gracefulExitFlag) {{
+        Write-Host "[$RunId] Detected flag: $gracefulExitFlag" -ForegroundColor Gray
+        Write-Host "[$RunId] Received graceful exit signal from server" -ForegroundColor Cyan
+        Write-Host "Agent stopping gracefully..." -ForegroundColor Green
+
+        # Clean up flag
+        Remove-Item $gracefulExitFlag -Force -ErrorAction SilentlyContinue
+        return $true
+    }}
+    return $false
+}}
+
+# HTTP status code of a failed web request, if any
+function Get-ErrorStatusCode {{
+    param($ErrorRecord)
+
+    if ($ErrorRecord.Exception.Response) {{
+        try {{
+            return $ErrorRecord.Exception.Response.StatusCode.value__
+        }} catch {{}}
+    }}
+    return $null
+}}
+
+if ($agentMode -eq "persistent") {{
+    # Persistent mode: the client script is downloaded once and only re-fetched
+    # (If-None-Match, 304 when unchanged) after the resident process exits, which it
+    # does when the server reports a new script version. Commands run and upload
+    # their transcripts inside the resident process.
+    $env:PT1_AGENT_MODE = "persistent"
+    $clientScriptPath = Join-Path $workDir "client.ps1"
+    $clientScriptEtag = $null
+    $runCount = 0
+
+    while ($true) {{
+        $runCount++
+        $runId = "session-{{0:000}}" -f $runCount
+
+        try {{
+            $headers = @{{"X-API-Token"=$apiToken}}
+            if ($clientScriptEtag -and (Test-Path $clientScriptPath)) {{
+                $headers["If-None-Match"] = $clientScriptEtag
+            }}
+            try {{
+                $download = Invoke-WebRequest -Uri "$serverUrl/client_install.ps1" -Headers $headers -UseBasicParsing
+                $download.Content | Out-File -FilePath $clientScriptPath -Encoding UTF8
+                $clientScriptEtag = [string]$download.Headers["ETag"]
+                Write-Host "[$runId] Client script version $([string]$download.Headers['X-PT1-Script-Version'])" -ForegroundColor Gray
+            }} catch {{
+                # 304 Not Modified: keep the script already on disk
+                if ((Get-ErrorStatusCode $_) -ne 304) {{
+                    throw
+                }}
+            }}
+
+            # Execute client script; it returns only to update, stop or recover
+            & powershell -NoProfile -ExecutionPolicy Bypass -File $clientScriptPath
+            $exitCode = $LASTEXITCODE
+
+            if (Test-GracefulExit -RunId $runId) {{
+                break
+            }}
+
+            # Exit code 0: the server has a new client script, download it and restart now
+            if ($exitCode -ne 0) {{
+                Write-Host "[$runId] Client script exited with code $exitCode" -ForegroundColor Red
+                Write-Host "[$runId] Auto-healing: Restarting in 10 seconds..." -ForegroundColor Yellow
+                Start-Sleep -Seconds 10
+            }}
+        }} catch {{
+            $errorMsg = $_.Exception.Message
+            $statusCode = Get-ErrorStatusCode $_
+
+            # Treat 401 as auth failure: stop agent to avoid infinite retries
+            if ($statusCode -eq 401 -or $errorMsg -like "*401*Unauthorized*") {{
+                Write-Host "[$runId] Received 401 Unauthorized, stopping agent (check API token/rotation)" -ForegroundColor Red
+                break
+            }}
+
+            Write-Host "[$runId] Run failed: $errorMsg" -ForegroundColor Red
+            Write-Host "[$runId] Auto-healing: Retrying in 10 seconds..." -ForegroundColor Yellow
+            Start-Sleep -Seconds 10
+        }}
+    }}
+
+    Remove-Item $clientScriptPath -Force -ErrorAction SilentlyContinue
+    exit 0
+}}
+
+# Cycle mode: main execution loop with self-healing and auto-restart
 $runCount = 0
 
 while ($true) {{
@@ -115,30 +214,17 @@ while ($true) {{
         Remove-Item $clientScriptPath -Force -ErrorAction SilentlyContinue
 
         # Check for graceful exit flag (created by client_install.ps1)
-        $gracefulExitFlag = Join-Path $workDir "GRACEFUL_EXIT.flag"
-        if (Test-Path $gracefulExitFlag) {{
-            Write-Host "[$runId] Detected flag: $gracefulExitFlag" -ForegroundColor Gray
-            Write-Host "[$runId] Received graceful exit signal from server" -ForegroundColor Cyan
-            Write-Host "Agent stopping gracefully..." -ForegroundColor Green
-
-            # Clean up flag
-            Remove-Item $gracefulExitFlag -Force -ErrorAction SilentlyContinue
-
+        if (Test-GracefulExit -RunId $runId) {{
             # Exit main loop and stop agent
             break
         }}
 
-        # Normal completion: quiet restart
-        Start-Sleep -Seconds 3
+        # Normal completion: restart immediately
+        # (idle cycles are paced by the server-side long-poll in client_install.ps1)
 
     }} catch {{
         $errorMsg = $_.Exception.Message
-        $statusCode = $null
-        if ($_.Exception.Response) {{
-            try {{
-                $statusCode = $_.Exception.Response.StatusCode.value__
-            }} catch {{}}
-        }}
+        $statusCode = Get-ErrorStatusCode $_
 
         # Treat 401 as auth failure: stop agent to avoid infinite retries
         if ($statusCode -eq 401 -or $errorMsg -like "*401*Unauthorized*") {{
@@ -0,0 +1,63 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+import pt1_server.auth as auth
+
+
+@pytest.fixture
+def tokens_file(tmp_path, monkeypatch):
+    path = tmp_path / "tokens.json"
+    monkeypatch.setattr(auth, "TOKENS_FILE", str(path))
+    monkeypatch.setattr(auth, "_active", None)
+    monkeypatch.setattr(auth, "_tokens_mtime_ns", None)
+    monkeypatch.delenv("PT1_TOKEN_ROTATION_LEAD_SECONDS", raising=False)
+    monkeypatch.delenv("PT1_TOKEN_ROTATION_SECONDS", raising=False)
+    return path
+
+
+def _write_entry(path, rotation_seconds, expires_at=None):
+    entry = {
+        "token": "2f1b7c1e-8d0a-4c5e-9d57-3f7f3b1f0a11",
+        "name": "short",
+        "rotation_seconds": rotation_seconds,
+    }
+    if expires_at is not None:
+        entry["expires_at"] = auth.format_datetime_string(expires_at)
+    path.write_text(json.dumps({"tokens": [entry]}))
+
+
+def test_short_rotation_entry_is_not_rotated_in_a_loop(tokens_file):
+    # 60 s period is shorter than the default 300 s lead
+    _write_entry(tokens_file, 60)
+    lead = auth._token_rotation_lead_seconds()
+    assert lead > 60
+
+    first = auth._rotate_active_token(lead)
+    for _ in range(5):
+        assert auth._rotate_active_token(lead).token == first.token
+    assert auth._rotate_active_token(lead, reload=True).token == first.token
+
+    # The rotator sleeps until 1/10 of the period before expiry, not 1 s
+    entry_lead = auth._entry_lead_seconds(lead, first.rotation_seconds)
+    remaining = (first.expires_at - auth.get_current_time()).total_seconds()
+    assert remaining - entry_lead > 50
+
+
+def test_short_rotation_entry_rotates_within_its_own_lead(tokens_file):
+    lead = auth._token_rotation_lead_seconds()
+    _write_entry(tokens_file, 60, auth.get_current_time() + timedelta(seconds=3))
+    rotated = auth._rotate_active_token(lead)
+    assert rotated.token != "2f1b7c1e-8d0a-4c5e-9d57-3f7f3b1f0a11"
+    assert auth._rotate_active_token(lead).token == rotated.token
+
+
+def test_long_rotation_entry_keeps_global_lead(tokens_file):
+    lead = auth._token_rotation_lead_seconds()
+    _write_entry(
+        tokens_file, 604800, auth.get_current_time() + timedelta(seconds=lead - 10)
+    )
+    rotated = auth._rotate_active_token(lead)
+    assert rotated.token != "2f1b7c1e-8d0a-4c5e-9d57-3f7f3b1f0a11"
+    assert auth._rotate_active_token(lead).token == rotated.token